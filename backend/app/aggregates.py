@@ -0,0 +1,332 @@
+"""
+Agregados de leads mantenidos de forma incremental.
+
+Al limpiar un archivo se calcula su agregado parcial (`FileAggregate`:
+filas y recuentos por Lead_Grade, Lead_Stage y tramo de score) sobre los
+bloques que ya recorre la limpieza, sin releer nada. Cuando el archivo se
+carga (o se publica limpio), el parcial se suma al resumen del ámbito:
+
+- `loaded`: filas cargadas en leads_raw (sirve `/lead-count`).
+- `cleaned`: archivos limpios publicados en S3 sin cargar.
+
+Cada parcial se guarda en S3 (`<AGGREGATES_PREFIX>/<ámbito>/files/...`) y
+el resumen (`.../summary.json`) se mantiene en memoria y se relee de S3
+cada AGGREGATES_REFRESH_SECONDS, así que las consultas no tocan Athena ni
+Snowflake. Registrar dos veces el mismo archivo reemplaza su parcial.
+
+Los parciales son la fuente de verdad: `rebuild` recompone el resumen a
+partir de ellos (p. ej. si dos instancias escribieron el resumen a la vez).
+`reconcile` lo compara con los recuentos de LEADS_FINAL en Snowflake (total
+y desgloses de una misma consulta, así que cuadran entre sí) y, con
+`repair`, guarda la diferencia como un ajuste. Las cargas que no pasan por la limpieza (Snowpipe, `/bulk-upload`)
+solo se reflejan tras una reconciliación con `repair`.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from typing import Dict, Optional
+from urllib.parse import quote
+
+AGGREGATES_PREFIX = os.getenv("AGGREGATES_PREFIX", "aggregates")
+AGGREGATES_REFRESH_SECONDS = float(os.getenv("AGGREGATES_REFRESH_SECONDS", 60))
+SCORE_BUCKET_WIDTH = 20
+NULL_LABEL = "null"
+SCOPES = ("loaded", "cleaned")
+BREAKDOWNS = ("by_grade", "by_stage", "by_score")
+
+
+def _empty() -> dict:
+    return {"rows": 0, **{name: {} for name in BREAKDOWNS}}
+
+
+def _merge(into: dict, part: dict, sign: int = 1):
+    """
+    Suma (o resta, con `sign=-1`) un agregado sobre otro; los recuentos que
+    quedan a cero se eliminan.
+    """
+    into["rows"] += sign * part["rows"]
+    for name in BREAKDOWNS:
+        counts = into[name]
+        for label, n in part[name].items():
+            value = counts.get(label, 0) + sign * n
+            if value:
+                counts[label] = value
+            else:
+                counts.pop(label, None)
+
+
+class FileAggregate:
+    """
+    Agregado parcial de un archivo, acumulado bloque a bloque (`add`).
+    """
+
+    def __init__(self):
+        self.counts = _empty()
+
+    def add(self, frame):
+        """
+        Suma un bloque limpio (cabeceras normalizadas). El score se toma de
+        Lead_Score si viene en el bloque o se calcula con el motor local.
+        """
+        import numpy as np
+        from .scoring import GRADE_COLUMN, SCORE_COLUMN, STAGE_COLUMN, can_score, score_frame
+
+        if not len(frame):
+            return
+        part = _empty()
+        part["rows"] = len(frame)
+        for name, column in (("by_grade", GRADE_COLUMN), ("by_stage", STAGE_COLUMN)):
+            if column in frame.columns:
+                values = frame[column].fillna(NULL_LABEL).value_counts()
+                part[name] = {str(label): int(n) for label, n in values.items()}
+        if SCORE_COLUMN in frame.columns:
+            scores = frame[SCORE_COLUMN].astype(float).to_numpy()
+        elif can_score(frame.columns):
+            scores = score_frame(frame)
+        else:
+            scores = None
+        if scores is not None:
+            valid = scores[~np.isnan(scores)]
+            lows = np.minimum(valid // SCORE_BUCKET_WIDTH * SCORE_BUCKET_WIDTH, 100 - SCORE_BUCKET_WIDTH)
+            labels, counts = np.unique(lows.astype(int), return_counts=True)
+            part["by_score"] = {f"{low}-{low + SCORE_BUCKET_WIDTH}": int(n) for low, n in zip(labels, counts)}
+            if len(valid) < len(scores):
+                part["by_score"][NULL_LABEL] = int(len(scores) - len(valid))
+        _merge(self.counts, part)
+
+    def to_dict(self) -> dict:
+        return json.loads(json.dumps(self.counts))
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "FileAggregate":
+        aggregate = cls()
+        _merge(aggregate.counts, data)
+        return aggregate
+
+
+class AggregateStore:
+    """
+    Resumen de un ámbito: suma de los parciales por archivo más el ajuste
+    de la última reconciliación. El resumen solo guarda las filas de cada
+    archivo; los desgloses por archivo están en sus propios objetos.
+    """
+
+    def __init__(self, scope: str, refresh: float = AGGREGATES_REFRESH_SECONDS):
+        self.scope = scope
+        self.refresh = refresh
+        self._summary: Optional[dict] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def prefix(self) -> str:
+        return f"{AGGREGATES_PREFIX.strip('/')}/{self.scope}"
+
+    def _file_key(self, name: str) -> str:
+        return f"{self.prefix}/files/{quote(name, safe='')}.json"
+
+    def _read(self, key: str) -> Optional[dict]:
+        from botocore.exceptions import ClientError
+        from .upload_s3 import bucket, get_s3
+
+        try:
+            return json.loads(get_s3().get_object(Bucket=bucket, Key=key)["Body"].read())
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+
+    def _write(self, key: str, data: dict):
+        from .upload_s3 import bucket, ensure_bucket_exists, get_s3
+
+        ensure_bucket_exists()
+        get_s3().put_object(Bucket=bucket, Key=key, Body=json.dumps(data).encode("utf-8"))
+
+    def _load(self) -> dict:
+        summary = self._read(f"{self.prefix}/summary.json")
+        if summary is None:
+            summary = {"totals": _empty(), "files": {}, "adjustment": _empty(), "updated_at": None}
+        self._summary, self._loaded_at = summary, time.monotonic()
+        return summary
+
+    def _publish(self, summary: dict):
+        summary["updated_at"] = time.time()
+        self._write(f"{self.prefix}/summary.json", summary)
+        self._summary, self._loaded_at = summary, time.monotonic()
+
+    def summary(self) -> dict:
+        """
+        Resumen actual (de memoria; se relee de S3 pasado `refresh`).
+        """
+        with self._lock:
+            if self._summary is None or time.monotonic() - self._loaded_at > self.refresh:
+                self._load()
+            return self._summary
+
+    def record(self, name: str, aggregate: FileAggregate) -> dict:
+        """
+        Suma el parcial del archivo `name` al resumen (reemplazando el
+        anterior del mismo nombre) y lo guarda en S3.
+        """
+        part = aggregate.to_dict()
+        key = self._file_key(name)
+        with self._lock:
+            previous = self._read(key)
+            self._write(key, {"name": name, **part})
+            # Se relee el resumen para no pisar lo registrado por otras instancias
+            summary = self._load()
+            if previous is not None:
+                _merge(summary["totals"], previous, -1)
+            _merge(summary["totals"], part)
+            summary["files"][name] = part["rows"]
+            self._publish(summary)
+        logging.info(f"📊 Agregados ({self.scope}): +{part['rows']} filas de {name}")
+        return summary
+
+    def rebuild(self) -> dict:
+        """
+        Recompone el resumen a partir de los parciales guardados en S3.
+        """
+        from .upload_s3 import bucket, get_s3
+
+        files, totals = {}, _empty()
+        paginator = get_s3().get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=f"{self.prefix}/files/"):
+            for item in page.get("Contents", []):
+                part = self._read(item["Key"])
+                if part is not None:
+                    files[part["name"]] = part["rows"]
+                    _merge(totals, part)
+        with self._lock:
+            adjustment = self._load()["adjustment"]
+            _merge(totals, adjustment)
+            summary = {"totals": totals, "files": files, "adjustment": adjustment}
+            self._publish(summary)
+            return summary
+
+    def adjust(self, expected: dict) -> dict:
+        """
+        Fija el ajuste para que los totales coincidan con `expected` (solo
+        las claves presentes: `rows` y/o desgloses).
+        """
+        with self._lock:
+            summary = self._load()
+            totals, adjustment = summary["totals"], summary["adjustment"]
+            _merge(totals, adjustment, -1)
+            if "rows" in expected:
+                adjustment["rows"] = expected["rows"] - totals["rows"]
+            for name in BREAKDOWNS:
+                if name in expected:
+                    correction = {label: n - totals[name].get(label, 0)
+                                  for label, n in expected[name].items()}
+                    correction.update({label: -n for label, n in totals[name].items()
+                                       if label not in expected[name]})
+                    adjustment[name] = {label: n for label, n in correction.items() if n}
+            _merge(totals, adjustment)
+            self._publish(summary)
+            return summary
+
+    def invalidate(self):
+        with self._lock:
+            self._summary = None
+
+
+_stores: Dict[str, AggregateStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(scope: str = "loaded") -> AggregateStore:
+    if scope not in SCOPES:
+        raise ValueError(f"Ámbito no soportado: {scope}. Usa {' o '.join(SCOPES)}.")
+    with _stores_lock:
+        store = _stores.get(scope)
+        if store is None:
+            store = _stores[scope] = AggregateStore(scope)
+        return store
+
+
+def record(scope: str, name: str, aggregate: FileAggregate):
+    """
+    Registra el parcial de un archivo ya cargado o publicado. Un fallo aquí
+    no debe deshacer la carga: se registra y la reconciliación lo corrige.
+    """
+    try:
+        get_store(scope).record(name, aggregate)
+    except Exception as e:
+        logging.warning(f"⚠️ No se pudieron actualizar los agregados ({scope}) con {name}: {e}")
+
+
+def breakdown(scope: str = "loaded") -> dict:
+    summary = get_store(scope).summary()
+    totals = summary["totals"]
+    return {
+        "scope": scope,
+        "total": totals["rows"],
+        **{name: dict(sorted(totals[name].items())) for name in BREAKDOWNS},
+        "files": len(summary["files"]),
+        "updated_at": summary.get("updated_at"),
+    }
+
+
+def _snowflake_counts() -> dict:
+    """
+    Total y desgloses de LEADS_FINAL en una sola consulta; el tramo de score
+    se calcula con la UDF y los mismos cortes que `FileAggregate`.
+    """
+    from .leads_query import SCORE_SQL
+    from .snowflake_client import connection
+
+    width = SCORE_BUCKET_WIDTH
+    bucket = f"LEAST(FLOOR({SCORE_SQL} / {width}) * {width}, {100 - width})"
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(f'SELECT "Lead_Grade", "Lead_Stage", {bucket}, COUNT(*) FROM LEADS_FINAL GROUP BY 1, 2, 3')
+            rows = cursor.fetchall()
+        finally:
+            cursor.close()
+    counts = _empty()
+    for grade, stage, low, n in rows:
+        counts["rows"] += n
+        score = NULL_LABEL if low is None else f"{int(low)}-{int(low) + width}"
+        for name, label in (("by_grade", grade), ("by_stage", stage), ("by_score", score)):
+            label = NULL_LABEL if label is None else str(label)
+            counts[name][label] = counts[name].get(label, 0) + n
+    return counts
+
+
+def _check(expected, actual) -> dict:
+    return {"expected": expected, "actual": actual, "ok": expected == actual}
+
+
+async def reconcile(repair: bool = False) -> dict:
+    """
+    Reconstruye el resumen `loaded` desde los parciales y lo compara con
+    LEADS_FINAL (filas y recuentos por grado, etapa y tramo de score). Con
+    `repair`, ajusta todos los totales a esos valores.
+    """
+    from .concurrency import run_io
+
+    store = get_store("loaded")
+    summary = await run_io(store.rebuild)
+    totals = summary["totals"]
+    report = {"checked_at": time.time(), "checks": {}, "errors": {}}
+    expected = {}
+
+    try:
+        expected = await run_io(_snowflake_counts)
+        for name in ("rows", *BREAKDOWNS):
+            report["checks"][name] = _check(expected[name], totals[name])
+    except Exception as e:
+        report["errors"]["snowflake"] = str(e)
+
+    report["ok"] = not report["errors"] and all(check["ok"] for check in report["checks"].values())
+    if repair and expected and not report["ok"]:
+        await run_io(store.adjust, expected)
+        report["repaired"] = True
+    report["aggregate"] = breakdown("loaded")
+    level = logging.INFO if report["ok"] else logging.WARNING
+    logging.log(level, f"📊 Reconciliación de agregados: {'ok' if report['ok'] else 'con diferencias'}")
+    return report
@@ -1,42 +1,244 @@
-import boto3
 import time
 import os
+import asyncio
+import hashlib
+import logging
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 # Configuración
 ATHENA_OUTPUT = os.getenv("ATHENA_OUTPUT", "s3://lead-scoring-athena-results/")
 ATHENA_DB = os.getenv("ATHENA_DATABASE", "leads")
 REGION = os.getenv("AWS_REGION", "eu-west-1")
 
-athena = boto3.client("athena", region_name=REGION)
+# Sondeo adaptativo: empieza rápido y se va espaciando hasta POLL_MAX
+POLL_INITIAL = float(os.getenv("ATHENA_POLL_INITIAL", 0.05))
+POLL_MAX = float(os.getenv("ATHENA_POLL_MAX", 2.0))
+POLL_FACTOR = float(os.getenv("ATHENA_POLL_FACTOR", 1.6))
+QUERY_TIMEOUT = float(os.getenv("ATHENA_QUERY_TIMEOUT", 120))
+# Tiempo durante el que se reutilizan ejecuciones/resultados de la misma consulta
+CACHE_TTL = float(os.getenv("ATHENA_CACHE_TTL", 60))
 
-def run_athena_query(query: str) -> int:
+# Cliente boto3 de Athena: se crea en el primer uso (get_boto_client)
+athena = None
+_athena_lock = threading.Lock()
+
+
+def get_boto_client():
     """
-    Ejecuta una consulta SQL en Athena y devuelve un resultado numérico simple.
+    Devuelve el cliente boto3 de Athena del proceso, creándolo si hace falta.
     """
-    try:
-        response = athena.start_query_execution(
+    global athena
+    if athena is None:
+        with _athena_lock:
+            if athena is None:
+                import boto3
+                from .instrumentation import instrument_client
+                athena = instrument_client(boto3.client("athena", region_name=REGION), "athena")
+    return athena
+
+
+class AthenaQueryError(Exception):
+    """
+    La consulta de Athena falló, se canceló o excedió el tiempo máximo.
+    """
+
+
+def _convert(value: Optional[str], athena_type: str) -> Any:
+    """
+    Convierte el VarCharValue de Athena al tipo Python de la columna.
+    """
+    if value is None:
+        return None
+    t = athena_type.lower()
+    if t in ("tinyint", "smallint", "integer", "int", "bigint"):
+        return int(value)
+    if t in ("double", "float", "real"):
+        return float(value)
+    if t == "decimal":
+        return Decimal(value)
+    if t == "boolean":
+        return value.lower() == "true"
+    if t == "date":
+        return date.fromisoformat(value)
+    if t.startswith("timestamp"):
+        return datetime.fromisoformat(value)
+    return value
+
+
+def query_hash(query: str, database: str = ATHENA_DB) -> str:
+    """
+    Clave de caché de una consulta (normaliza espacios).
+    """
+    normalized = " ".join(query.split())
+    return hashlib.sha256(f"{database}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+class AthenaClient:
+    """
+    Cliente de Athena para asyncio.
+
+    - Las llamadas a boto3 se ejecutan en hilos para no bloquear el event loop.
+    - El estado se sondea con backoff (POLL_INITIAL -> POLL_MAX).
+    - Las ejecuciones y los valores escalares se cachean por hash de la
+      consulta durante `cache_ttl` segundos; además se pide a Athena que
+      reutilice resultados recientes (ResultReuseConfiguration).
+    - `iter_rows` recorre todas las páginas de resultados con tipos Python.
+    """
+
+    def __init__(self, client=None, database: str = ATHENA_DB, output: str = ATHENA_OUTPUT,
+                 cache_ttl: float = CACHE_TTL, poll_initial: float = POLL_INITIAL,
+                 poll_max: float = POLL_MAX, timeout: float = QUERY_TIMEOUT):
+        self._client = client
+        self.database = database
+        self.output = output
+        self.cache_ttl = cache_ttl
+        self.poll_initial = poll_initial
+        self.poll_max = poll_max
+        self.timeout = timeout
+        self._executions: Dict[str, tuple] = {}
+        self._values: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        return self._client or get_boto_client()
+
+    def _cached(self, store: dict, key: str):
+        with self._lock:
+            item = store.get(key)
+            if item and time.monotonic() - item[1] < self.cache_ttl:
+                return item[0]
+            store.pop(key, None)
+            return None
+
+    def _remember(self, store: dict, key: str, value):
+        with self._lock:
+            store[key] = (value, time.monotonic())
+
+    async def start(self, query: str) -> str:
+        """
+        Lanza la consulta (o reutiliza una ejecución reciente idéntica) y
+        devuelve el QueryExecutionId.
+        """
+        key = query_hash(query, self.database)
+        execution_id = self._cached(self._executions, key)
+        if execution_id:
+            return execution_id
+
+        reuse_minutes = max(int(self.cache_ttl // 60), 1)
+        response = await asyncio.to_thread(
+            self.client.start_query_execution,
             QueryString=query,
-            QueryExecutionContext={"Database": ATHENA_DB},
-            ResultConfiguration={"OutputLocation": ATHENA_OUTPUT}
+            QueryExecutionContext={"Database": self.database},
+            ResultConfiguration={"OutputLocation": self.output},
+            ResultReuseConfiguration={
+                "ResultReuseByAgeConfiguration": {"Enabled": True, "MaxAgeInMinutes": reuse_minutes}
+            },
         )
         execution_id = response["QueryExecutionId"]
+        self._remember(self._executions, key, execution_id)
+        return execution_id
 
-        # Esperar hasta que termine la ejecución
+    async def wait(self, execution_id: str) -> None:
+        """
+        Espera a que termine la ejecución con sondeo adaptativo.
+        """
+        delay = self.poll_initial
+        deadline = time.monotonic() + self.timeout
         while True:
-            status = athena.get_query_execution(QueryExecutionId=execution_id)
+            status = await asyncio.to_thread(self.client.get_query_execution, QueryExecutionId=execution_id)
             state = status["QueryExecution"]["Status"]["State"]
-            if state in ["SUCCEEDED", "FAILED", "CANCELLED"]:
+            if state == "SUCCEEDED":
+                return
+            if state in ("FAILED", "CANCELLED"):
+                reason = status["QueryExecution"]["Status"].get("StateChangeReason", state)
+                self._forget_execution(execution_id)
+                raise AthenaQueryError(f"Consulta {execution_id} terminó en {state}: {reason}")
+            if time.monotonic() + delay > deadline:
+                raise AthenaQueryError(f"Consulta {execution_id} excedió {self.timeout}s")
+            await asyncio.sleep(delay)
+            delay = min(delay * POLL_FACTOR, self.poll_max)
+
+    def _forget_execution(self, execution_id: str):
+        with self._lock:
+            for key, (cached_id, _) in list(self._executions.items()):
+                if cached_id == execution_id:
+                    del self._executions[key]
+
+    async def iter_rows(self, query: str, page_size: int = 1000) -> AsyncIterator[dict]:
+        """
+        Ejecuta la consulta y devuelve todas las filas (todas las páginas)
+        como dicts con valores tipados.
+        """
+        execution_id = await self.start(query)
+        await self.wait(execution_id)
+
+        kwargs = {"QueryExecutionId": execution_id, "MaxResults": page_size}
+        first_page = True
+        while True:
+            page = await asyncio.to_thread(self.client.get_query_results, **kwargs)
+            columns = [(c["Name"], c["Type"]) for c in page["ResultSet"]["ResultSetMetadata"]["ColumnInfo"]]
+            rows = page["ResultSet"]["Rows"]
+            # En la primera página, la fila 0 es la cabecera
+            if first_page:
+                rows = rows[1:]
+                first_page = False
+            for row in rows:
+                values = [cell.get("VarCharValue") for cell in row["Data"]]
+                yield {name: _convert(value, t) for (name, t), value in zip(columns, values)}
+            token = page.get("NextToken")
+            if not token:
                 break
-            time.sleep(1)
+            kwargs["NextToken"] = token
+
+    async def fetch_all(self, query: str) -> List[dict]:
+        return [row async for row in self.iter_rows(query)]
+
+    async def scalar(self, query: str) -> Any:
+        """
+        Devuelve el primer valor de la primera fila (p. ej. un COUNT(*)),
+        cacheado durante `cache_ttl` segundos.
+        """
+        key = query_hash(query, self.database)
+        cached = self._cached(self._values, key)
+        if cached is not None:
+            return cached
+        rows = self.iter_rows(query, page_size=2)
+        try:
+            async for row in rows:
+                value = next(iter(row.values()))
+                self._remember(self._values, key, value)
+                return value
+            return None
+        finally:
+            await rows.aclose()
+
+    def invalidate(self):
+        with self._lock:
+            self._executions.clear()
+            self._values.clear()
 
-        if state != "SUCCEEDED":
-            return -1
 
-        # Obtener resultado
-        result = athena.get_query_results(QueryExecutionId=execution_id)
-        row = result["ResultSet"]["Rows"][1]  # fila 0 = encabezado
-        value = int(row["Data"][0]["VarCharValue"])
-        return value
+_client = AthenaClient()
+
+
+def get_athena() -> AthenaClient:
+    """
+    Devuelve el cliente de Athena compartido del proceso.
+    """
+    return _client
+
+
+def run_athena_query(query: str) -> int:
+    """
+    Ejecuta una consulta SQL en Athena y devuelve un resultado numérico simple.
+    Versión síncrona: no usar desde dentro de un event loop.
+    """
+    try:
+        return int(asyncio.run(get_athena().scalar(query)))
     except Exception as e:
-        print("Athena error:", e)
+        logging.error(f"Athena error: {e}")
         return -1
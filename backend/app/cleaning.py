@@ -0,0 +1,217 @@
+import io
+import os
+import time
+import logging
+from typing import BinaryIO, Callable, Iterator, List, Optional
+
+# Configuración de la limpieza en streaming
+SAMPLE_BYTES = int(os.getenv("CLEAN_SAMPLE_BYTES", 1024 * 1024))
+CHUNK_ROWS = int(os.getenv("CLEAN_CHUNK_ROWS", 50_000))
+
+
+class _CountingReader(io.RawIOBase):
+    """
+    Envoltorio de solo lectura que cuenta los bytes leídos del archivo original.
+    """
+
+    def __init__(self, raw: BinaryIO):
+        self._raw = raw
+        self.bytes_read = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        data = self._raw.read(len(b))
+        n = len(data)
+        b[:n] = data
+        self.bytes_read += n
+        return n
+
+
+def detect_encoding(fileobj: BinaryIO, sample_size: int = SAMPLE_BYTES) -> str:
+    """
+    Detecta el encoding a partir de una muestra acotada del inicio del archivo,
+    sin leerlo entero. Deja el puntero del archivo donde estaba.
+    """
+    import chardet
+    from .instrumentation import span
+
+    position = fileobj.tell()
+    sample = fileobj.read(sample_size)
+    fileobj.seek(position)
+
+    with span("chardet.detect"):
+        result = chardet.detect(sample)
+    encoding = result["encoding"] or "latin1"
+    # ascii es un subconjunto de utf-8: evita errores si más adelante hay acentos
+    if encoding.lower() == "ascii":
+        encoding = "utf-8"
+    logging.info(f"Encoding detectado: {encoding}")
+    return encoding
+
+
+def normalize_columns(columns) -> List[str]:
+    """
+    Normaliza los nombres de columna: sin espacios extremos y con '_' en lugar de ' '.
+    """
+    return [str(col).strip().replace(" ", "_") for col in columns]
+
+
+def iter_clean_frames(fileobj: BinaryIO, encoding: str, chunk_rows: int = CHUNK_ROWS,
+                      stats: Optional[dict] = None, score: bool = False,
+                      row_filter: Optional[Callable] = None,
+                      skip_rows: Optional[set] = None,
+                      aggregate: Optional["FileAggregate"] = None) -> Iterator["pd.DataFrame"]:
+    """
+    Lee el CSV por bloques de `chunk_rows` filas y devuelve cada bloque como
+    DataFrame con las cabeceras normalizadas (los nulos se conservan).
+
+    Todas las columnas se leen como texto para que el formato de un valor no
+    dependa del bloque en el que cae (p. ej. enteros con nulos -> "1.0").
+    Si se pasa `stats`, se acumulan en él las filas procesadas (`rows`).
+    Con `score=True` se añade la columna `Lead_Score` calculada con el motor
+    de scoring local (si el archivo trae las columnas necesarias).
+    `row_filter` recibe cada bloque normalizado (antes del scoring) y devuelve
+    las filas que deben seguir (p. ej. `DedupRun.filter`).
+    `skip_rows` son los índices de registro defectuosos del informe de
+    `prevalidate` (se saltan sin releer el archivo); con él, las filas con
+    campos de más que no estén en el informe también se descartan.
+    `aggregate` (ver `aggregates.py`) acumula los recuentos de cada bloque.
+    """
+    import pandas as pd
+    from .instrumentation import span
+    from .scoring import SCORE_COLUMN, can_score, score_frame
+
+    text = io.TextIOWrapper(fileobj, encoding=encoding, errors="replace", newline="")
+    if skip_rows is not None:
+        reader = pd.read_csv(text, dtype=str, chunksize=chunk_rows,
+                             skiprows=(lambda i: i in skip_rows) if skip_rows else None,
+                             on_bad_lines="skip")
+    else:
+        reader = pd.read_csv(text, dtype=str, chunksize=chunk_rows)
+    chunks = iter(reader)
+    try:
+        while True:
+            with span("pandas.read_csv"):
+                chunk = next(chunks, None)
+            if chunk is None:
+                break
+            chunk.columns = normalize_columns(chunk.columns)
+            if row_filter is not None:
+                with span("clean.row_filter"):
+                    chunk = row_filter(chunk)
+            if score and can_score(chunk.columns):
+                with span("scoring.score_frame"):
+                    chunk[SCORE_COLUMN] = score_frame(chunk)
+            if stats is not None:
+                stats["rows"] = stats.get("rows", 0) + len(chunk)
+            if aggregate is not None:
+                with span("aggregates.add"):
+                    aggregate.add(chunk)
+            yield chunk
+    finally:
+        reader.close()
+        # No cerrar el archivo subyacente: es responsabilidad del llamador
+        text.detach()
+
+
+def iter_cleaned_csv(fileobj: BinaryIO, encoding: str, chunk_rows: int = CHUNK_ROWS,
+                     stats: Optional[dict] = None, score: bool = False,
+                     row_filter: Optional[Callable] = None,
+                     skip_rows: Optional[set] = None,
+                     aggregate: Optional["FileAggregate"] = None) -> Iterator[bytes]:
+    """
+    Aplica `fillna("")` a cada bloque de `iter_clean_frames` y lo devuelve
+    como CSV en bytes UTF-8 (cabecera solo en el primero).
+    """
+    from .instrumentation import span
+
+    header = True
+    for chunk in iter_clean_frames(fileobj, encoding, chunk_rows, stats, score, row_filter, skip_rows,
+                                   aggregate):
+        with span("pandas.to_csv"):
+            chunk = chunk.fillna("")
+            buf = io.StringIO()
+            chunk.to_csv(buf, index=False, header=header)
+            data = buf.getvalue().encode("utf-8")
+        header = False
+        yield data
+
+
+def _encoding_and_skip(fileobj: BinaryIO, report: Optional[dict], bad_rows: str):
+    """
+    Encoding y filas a saltar: del informe de pre-validación si lo hay; si
+    no, detección por muestra y sin saltos.
+    """
+    if report is None:
+        return detect_encoding(fileobj), None
+    from .prevalidate import skip_rows
+    return report["encoding"], skip_rows(report, bad_rows)
+
+
+def clean_csv_to_s3(fileobj: BinaryIO, filename: str, chunk_rows: int = CHUNK_ROWS, score: bool = False,
+                    dedup: bool = False, report: Optional[dict] = None, bad_rows: str = "skip",
+                    progress: Optional[Callable[[dict], None]] = None,
+                    aggregate: Optional["FileAggregate"] = None,
+                    dedup_run: Optional["DedupRun"] = None) -> dict:
+    """
+    Limpia un CSV en streaming y sube el resultado a S3 por partes.
+
+    La memoria pico queda acotada por el tamaño de bloque de pandas y el
+    tamaño de parte de la subida multipart, independientemente del tamaño del
+    archivo.
+
+    Con `dedup=True` solo se escriben las filas nuevas o cambiadas respecto al
+    índice de hashes (ver `dedup.py`). El índice no se actualiza aquí, porque
+    registra lo cargado en Snowflake: quien carga el archivo pasa su propia
+    `dedup_run` y la confirma (`commit_run`) cuando la carga termina bien.
+    Con `report` (de `prevalidate`) se usa su encoding y se saltan o reparan
+    las filas defectuosas según `bad_rows`. `progress` recibe tras cada
+    bloque las filas y los bytes leídos y escritos hasta el momento.
+    `aggregate` acumula los recuentos de las filas escritas.
+
+    Returns:
+        dict: key en S3, filas, bytes leídos/escritos y throughput en MB/s
+        (y filas omitidas / bytes ahorrados si hay deduplicación)
+    """
+    from .upload_s3 import upload_stream
+
+    start = time.perf_counter()
+    encoding, skip = _encoding_and_skip(fileobj, report, bad_rows)
+    counter = _CountingReader(fileobj)
+    stats = {"rows": 0, "bytes_out": 0}
+    run = dedup_run
+    if run is None and dedup:
+        from .dedup import get_index
+        run = get_index().begin()
+
+    def _chunks():
+        row_filter = run.filter if run is not None else None
+        for data in iter_cleaned_csv(io.BufferedReader(counter), encoding, chunk_rows, stats, score,
+                                     row_filter, skip, aggregate):
+            stats["bytes_out"] += len(data)
+            if progress is not None:
+                progress({"rows": stats["rows"], "bytes_in": counter.bytes_read, "bytes_out": stats["bytes_out"]})
+            yield data
+
+    s3_key = upload_stream(filename, _chunks())
+    elapsed = time.perf_counter() - start
+    mb_per_s = (counter.bytes_read / (1024 * 1024)) / elapsed if elapsed > 0 else 0.0
+    logging.info(f"🧹 CSV limpiado y subido: {counter.bytes_read} bytes en {elapsed:.2f}s ({mb_per_s:.2f} MB/s)")
+
+    result = {
+        "s3_key": s3_key,
+        "encoding": encoding,
+        "rows": stats["rows"],
+        "bytes_in": counter.bytes_read,
+        "bytes_out": stats["bytes_out"],
+        "seconds": round(elapsed, 3),
+        "mb_per_s": round(mb_per_s, 2),
+    }
+    if skip is not None:
+        result["bad_rows_skipped"] = len(skip)
+    if run is not None:
+        result["rows_skipped"] = run.stats["rows_skipped"]
+        result["bytes_saved"] = run.stats["bytes_saved"]
+    return result
@@ -0,0 +1,147 @@
+"""
+Contenedor columnar para las respuestas de lectura (`/leads`,
+`/score-all-leads`).
+
+Las filas del conector se vuelcan por lotes en una lista por columna: no se
+crea un dict ni un modelo pydantic por fila mientras se acumula el resultado.
+Al responder se serializa directamente:
+
+- JSON (por defecto): array de objetos, igual que antes. Se genera por
+  bloques de `JSON_BATCH_ROWS` filas con orjson si está instalado (json de
+  la librería estándar si no), así que solo hay un bloque de dicts vivo a
+  la vez.
+- Arrow IPC (stream) si la cabecera `Accept` pide
+  `application/vnd.apache.arrow.stream`: columnas tipadas sin pasar por JSON.
+"""
+import io
+import os
+import json
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, List, Optional, Sequence
+
+from .schema_cache import compile_row_mapper
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depende del entorno
+    orjson = None
+
+JSON_BATCH_ROWS = int(os.getenv("JSON_BATCH_ROWS", 5000))
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def _default(value: Any) -> Any:
+    # Los NUMBER de Snowflake llegan como Decimal: se sirven como número
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(value: Any) -> bytes:
+    """
+    JSON compacto en bytes (orjson si está disponible).
+    """
+    if orjson is not None:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode("utf-8")
+
+
+class ColumnarResult:
+    """
+    Resultado tabular guardado por columnas.
+    """
+
+    __slots__ = ("columns", "data", "length")
+
+    def __init__(self, columns: Sequence[str], data: Optional[List[list]] = None):
+        self.columns = tuple(columns)
+        self.data = data if data is not None else [[] for _ in self.columns]
+        self.length = len(self.data[0]) if self.data else 0
+
+    @classmethod
+    def from_batches(cls, columns: Sequence[str], batches: Iterable[Sequence[tuple]]) -> "ColumnarResult":
+        result = cls(columns)
+        for rows in batches:
+            result.extend(rows)
+        return result
+
+    def extend(self, rows: Sequence[tuple]):
+        """
+        Añade un lote de filas (tuplas del conector) columna a columna.
+        """
+        if not rows:
+            return
+        for target, values in zip(self.data, zip(*rows)):
+            target.extend(values)
+        self.length += len(rows)
+
+    def __len__(self) -> int:
+        return self.length
+
+    def rows(self, start: int = 0, stop: Optional[int] = None) -> Iterator[tuple]:
+        return zip(*(column[start:stop] for column in self.data))
+
+    def column(self, name: str) -> list:
+        return self.data[self.columns.index(name)]
+
+    def iter_json(self, batch_rows: int = JSON_BATCH_ROWS) -> Iterator[bytes]:
+        """
+        Serializa como array JSON de objetos, por bloques.
+        """
+        to_dict = compile_row_mapper(self.columns)
+        yield b"["
+        for start in range(0, self.length, batch_rows):
+            chunk = dumps([to_dict(row) for row in self.rows(start, start + batch_rows)])
+            yield (b"," if start else b"") + chunk[1:-1]
+        yield b"]"
+
+    def to_json(self) -> bytes:
+        return b"".join(self.iter_json())
+
+    def to_arrow(self):
+        """
+        Tabla pyarrow con un array tipado por columna. Las columnas con tipos
+        mezclados se sirven como texto.
+        """
+        import pyarrow as pa
+
+        arrays = []
+        for values in self.data:
+            try:
+                arrays.append(pa.array(values))
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                arrays.append(pa.array([None if v is None else str(v) for v in values], type=pa.string()))
+        return pa.Table.from_arrays(arrays, names=list(self.columns))
+
+    def to_arrow_ipc(self) -> bytes:
+        import pyarrow as pa
+
+        table = self.to_arrow()
+        sink = io.BytesIO()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=JSON_BATCH_ROWS)
+        return sink.getvalue()
+
+    def to_dict(self) -> dict:
+        return {"columns": list(self.columns), "data": self.data}
+
+    @classmethod
+    def from_dict(cls, item: dict) -> "ColumnarResult":
+        return cls(item["columns"], item["data"])
+
+
+def wants_arrow(accept: Optional[str]) -> bool:
+    return bool(accept) and ARROW_STREAM_MEDIA_TYPE in accept
+
+
+def render(result: ColumnarResult, accept: Optional[str] = None, headers: Optional[dict] = None):
+    """
+    Respuesta negociada según `Accept`: Arrow IPC o JSON.
+    """
+    from fastapi.responses import Response
+
+    if wants_arrow(accept):
+        return Response(result.to_arrow_ipc(), media_type=ARROW_STREAM_MEDIA_TYPE, headers=headers)
+    return Response(result.to_json(), media_type="application/json", headers=headers)
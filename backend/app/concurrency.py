@@ -0,0 +1,52 @@
+"""
+Ejecución del trabajo bloqueante fuera del event loop.
+
+Los endpoints `async` no deben llamar directamente a boto3, pandas o al
+conector de Snowflake: bloquearían el loop y serializarían las peticiones
+concurrentes. Este módulo ofrece dos grupos de hilos con límites explícitos:
+
+- `run_io`: llamadas de red bloqueantes (S3, SageMaker, Snowflake).
+- `run_cpu`: trabajo de CPU (limpieza con pandas, Parquet). Se usan hilos y
+  no procesos porque trabajan sobre el archivo temporal de la subida, que no
+  se puede enviar a otro proceso; el parser C de pandas libera el GIL.
+
+Las tareas que superan el límite esperan su turno sin ocupar un hilo.
+"""
+import os
+import functools
+from typing import Any, Callable
+
+from anyio import CapacityLimiter, to_thread
+
+IO_CONCURRENCY = int(os.getenv("IO_CONCURRENCY", 32))
+CPU_CONCURRENCY = int(os.getenv("CPU_CONCURRENCY", os.cpu_count() or 2))
+
+io_limiter = CapacityLimiter(IO_CONCURRENCY)
+cpu_limiter = CapacityLimiter(CPU_CONCURRENCY)
+
+
+async def run_io(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Ejecuta `fn` (E/S bloqueante) en un hilo, con como mucho IO_CONCURRENCY
+    llamadas simultáneas.
+    """
+    return await to_thread.run_sync(functools.partial(fn, *args, **kwargs), limiter=io_limiter)
+
+
+async def run_cpu(fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Ejecuta `fn` (trabajo de CPU) en un hilo, con como mucho CPU_CONCURRENCY
+    tareas simultáneas.
+    """
+    return await to_thread.run_sync(functools.partial(fn, *args, **kwargs), limiter=cpu_limiter)
+
+
+def stats() -> dict:
+    """
+    Ocupación de cada grupo: hilos en uso, límite y tareas esperando.
+    """
+    result = {}
+    for name, limiter in (("io", io_limiter), ("cpu", cpu_limiter)):
+        s = limiter.statistics()
+        result[name] = {"in_use": s.borrowed_tokens, "limit": s.total_tokens, "waiting": s.tasks_waiting}
+    return result
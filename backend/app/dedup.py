@@ -0,0 +1,242 @@
+"""
+Detección de cambios por hash para cargas incrementales en leads_raw.
+
+Cada fila limpia se resume en dos hashes de 64 bits: el de su `Prospect_ID`
+y el de su contenido. El índice guarda, ordenados, los pares
+(hash de clave, hash de contenido) de las cargas anteriores en dos arrays
+NumPy (16 bytes por lead), persistidos como `.npz` en S3
+(DEDUP_INDEX_S3_KEY) y, si se configura, también en un archivo local
+(DEDUP_INDEX_PATH, p. ej. en desarrollo). /tmp no sirve de almacén: en
+Lambda se pierde en cada arranque en frío y la deduplicación dejaría de
+filtrar sin avisar. Solo se emiten a staging las filas nuevas o con
+contenido distinto.
+
+Los hashes se calculan con `pandas.util.hash_pandas_object` (vectorizado y
+determinista para una misma versión de pandas); si cambia la versión, el
+índice se descarta y la siguiente carga es completa.
+"""
+import io
+import os
+import logging
+import threading
+from typing import Optional
+
+import numpy as np
+
+KEY_COLUMN = "Prospect_ID"
+INDEX_PATH = os.getenv("DEDUP_INDEX_PATH") or None
+INDEX_S3_KEY = os.getenv("DEDUP_INDEX_S3_KEY", "dedup/leads_hash_index.npz") or None
+INDEX_FORMAT = 1
+
+
+def _pandas_version() -> str:
+    import pandas as pd
+    return pd.__version__
+
+
+class HashIndex:
+    """
+    Índice compacto Prospect_ID -> hash de contenido, compartido por el proceso.
+
+    Cada carga abre una `DedupRun` con `begin()`: la ejecución filtra los
+    bloques y solo al hacer `commit()` (carga terminada bien) incorpora sus
+    hashes al índice, de modo que un fallo a mitad no marca filas como
+    cargadas ni interfiere con otras cargas concurrentes.
+    """
+
+    def __init__(self, keys: Optional[np.ndarray] = None, hashes: Optional[np.ndarray] = None):
+        self.keys = keys if keys is not None else np.empty(0, dtype=np.uint64)
+        self.hashes = hashes if hashes is not None else np.empty(0, dtype=np.uint64)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, keys: np.ndarray) -> np.ndarray:
+        """
+        Devuelve el hash de contenido conocido para cada clave (0 si no existe).
+        """
+        with self._lock:
+            index_keys, index_hashes = self.keys, self.hashes
+        if not len(index_keys):
+            return np.zeros(len(keys), dtype=np.uint64)
+        pos = np.minimum(np.searchsorted(index_keys, keys), len(index_keys) - 1)
+        found = index_keys[pos] == keys
+        return np.where(found, index_hashes[pos], np.uint64(0))
+
+    def merge(self, keys: np.ndarray, hashes: np.ndarray):
+        """
+        Incorpora pares (clave, hash); ante claves repetidas gana el último.
+        """
+        if not len(keys):
+            return
+        # Dos tramos ordenados: la ordenación estable (timsort) los mezcla en tiempo lineal
+        incoming = np.argsort(keys, kind="stable")
+        keys, hashes = keys[incoming], hashes[incoming]
+        with self._lock:
+            all_keys = np.concatenate([self.keys, keys])
+            all_hashes = np.concatenate([self.hashes, hashes])
+            order = np.argsort(all_keys, kind="stable")
+            all_keys, all_hashes = all_keys[order], all_hashes[order]
+            last = np.append(all_keys[1:] != all_keys[:-1], True)
+            self.keys, self.hashes = all_keys[last], all_hashes[last]
+
+    def begin(self) -> "DedupRun":
+        return DedupRun(self)
+
+    def to_bytes(self) -> bytes:
+        with self._lock:
+            keys, hashes = self.keys, self.hashes
+        buf = io.BytesIO()
+        np.savez_compressed(buf, keys=keys, hashes=hashes,
+                            format=np.array(INDEX_FORMAT), pandas=np.array(_pandas_version()))
+        return buf.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "HashIndex":
+        with np.load(io.BytesIO(data)) as npz:
+            if int(npz["format"]) != INDEX_FORMAT or str(npz["pandas"]) != _pandas_version():
+                logging.warning("Índice de hashes incompatible con esta versión; se empieza de cero.")
+                return cls()
+            return cls(npz["keys"], npz["hashes"])
+
+
+class DedupRun:
+    """
+    Filtro de una carga concreta: deja pasar filas nuevas o cambiadas y
+    acumula sus hashes hasta `commit()`. Los hashes ya emitidos en la
+    ejecución cuentan como vistos en los bloques siguientes.
+    """
+
+    def __init__(self, index: HashIndex):
+        self.index = index
+        self._emitted = HashIndex()
+        self.stats = {"rows_in": 0, "rows_emitted": 0, "rows_skipped": 0, "bytes_saved": 0}
+
+    def filter(self, frame):
+        """
+        Devuelve las filas de `frame` cuyo `Prospect_ID` es nuevo o cuyo
+        contenido ha cambiado desde la última carga confirmada o desde su
+        última aparición en un bloque anterior de esta ejecución.
+        """
+        import pandas as pd
+
+        if KEY_COLUMN not in frame.columns:
+            raise ValueError(f"El archivo no contiene la columna {KEY_COLUMN}.")
+
+        key_hashes = pd.util.hash_pandas_object(frame[KEY_COLUMN], index=False).to_numpy()
+        row_hashes = pd.util.hash_pandas_object(frame, index=False).to_numpy()
+        # Repeticiones exactas dentro del bloque cuentan como ya vistas
+        first = ~pd.DataFrame({"k": key_hashes, "h": row_hashes}).duplicated().to_numpy()
+        # Lo emitido antes en esta ejecución manda sobre el índice confirmado
+        in_run = self._emitted.lookup(key_hashes)
+        current = np.where(in_run != 0, in_run, self.index.lookup(key_hashes))
+        changed = (current != row_hashes) & first
+        self._emitted.merge(key_hashes[changed], row_hashes[changed])
+
+        emitted = frame[changed]
+        skipped = len(frame) - len(emitted)
+        self.stats["rows_in"] += len(frame)
+        self.stats["rows_emitted"] += len(emitted)
+        self.stats["rows_skipped"] += skipped
+        if skipped:
+            # Bytes que habría ocupado en el CSV de staging lo que no se envía
+            skipped_csv = frame[~changed].fillna("").to_csv(index=False, header=False)
+            self.stats["bytes_saved"] += len(skipped_csv.encode("utf-8"))
+        return emitted
+
+    def pending(self) -> HashIndex:
+        """
+        Hashes emitidos y aún sin confirmar, para confirmarlos desde otro
+        proceso (`commit_pending`), p. ej. tras la etapa de carga de una ingesta.
+        """
+        return HashIndex(self._emitted.keys, self._emitted.hashes)
+
+    def commit(self):
+        """
+        Marca como cargadas las filas emitidas por esta ejecución.
+        """
+        self.index.merge(self._emitted.keys, self._emitted.hashes)
+        self._emitted = HashIndex()
+
+
+def _locations(path: Optional[str], s3_key: Optional[str]):
+    path = path or INDEX_PATH
+    s3_key = s3_key or INDEX_S3_KEY
+    if not path and not s3_key:
+        raise RuntimeError("La deduplicación necesita un almacén persistente: "
+                           "configura DEDUP_INDEX_S3_KEY o DEDUP_INDEX_PATH.")
+    return path, s3_key
+
+
+def load_index(path: Optional[str] = None, s3_key: Optional[str] = None) -> HashIndex:
+    """
+    Carga el índice desde S3 o, si no se usa S3, desde el archivo local.
+    """
+    path, s3_key = _locations(path, s3_key)
+    if s3_key:
+        from botocore.exceptions import ClientError
+        from .upload_s3 import bucket, get_s3
+        try:
+            return HashIndex.from_bytes(get_s3().get_object(Bucket=bucket, Key=s3_key)["Body"].read())
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+        return HashIndex()
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            return HashIndex.from_bytes(f.read())
+    return HashIndex()
+
+
+def save_index(index: HashIndex, path: Optional[str] = None, s3_key: Optional[str] = None):
+    """
+    Guarda el índice en S3 y, si se configura, en local (escritura atómica).
+    """
+    path, s3_key = _locations(path, s3_key)
+    data = index.to_bytes()
+    if path:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    if s3_key:
+        from .upload_s3 import bucket, get_s3
+        get_s3().put_object(Bucket=bucket, Key=s3_key, Body=data)
+    logging.info(f"💾 Índice de hashes guardado: {len(index)} leads, {len(data)} bytes")
+
+
+_index: Optional[HashIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_index() -> HashIndex:
+    """
+    Devuelve el índice del proceso, cargado la primera vez que se usa.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = load_index()
+    return _index
+
+
+def commit_run(run: DedupRun):
+    """
+    Confirma una ejecución y persiste el índice compartido.
+    """
+    run.commit()
+    with _index_lock:
+        save_index(run.index)
+
+
+def commit_pending(pending: HashIndex):
+    """
+    Confirma en el índice del proceso los hashes pendientes de una ejecución
+    de otro proceso (`DedupRun.pending`) y lo persiste.
+    """
+    index = get_index()
+    index.merge(pending.keys, pending.hashes)
+    with _index_lock:
+        save_index(index)
@@ -0,0 +1,175 @@
+"""
+Subida directa a S3 con URLs firmadas: el navegador envía el archivo a S3 y
+la API solo firma y coordina, sin recibir nunca los bytes (ni el límite de
+payload de Lambda).
+
+- Archivos pequeños: una URL de PUT (`presign_put`).
+- Archivos grandes: subida multipart. `initiate` crea la subida y, si se
+  conoce el tamaño, firma todas las partes de una vez; `presign_parts`
+  firma más en bloque; `complete` la cierra con los ETag de cada parte y
+  `abort` la cancela.
+
+El destino es la key de origen de un trabajo de ingesta
+(`<INGEST_PREFIX>/<job_id>/source/<archivo>`): al completar la subida se
+encola la limpieza y la carga (`ingestion.start_uploaded`).
+
+Para que el navegador pueda leer el ETag de cada parte, el CORS del bucket
+debe exponer la cabecera `ETag`.
+"""
+import os
+import re
+import math
+import uuid
+import logging
+from typing import List, Optional
+
+from .ingestion import INGEST_PREFIX
+
+UPLOAD_URL_TTL = int(os.getenv("UPLOAD_URL_TTL", 3600))
+UPLOAD_PART_SIZE = max(int(os.getenv("UPLOAD_PART_SIZE", 16 * 1024 * 1024)), 5 * 1024 * 1024)
+# Límites de S3 para subidas multipart
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10_000
+# Partes firmadas como mucho por petición
+MAX_PRESIGN_BATCH = int(os.getenv("UPLOAD_MAX_PRESIGN_BATCH", 1000))
+
+_KEY_PATTERN = re.compile(r"^(?P<prefix>.+)/(?P<job_id>[0-9a-f]{32})/source/(?P<filename>[^/]+)$")
+
+
+def _source_key(job_id: str, filename: str) -> str:
+    name = os.path.basename(filename or "")
+    if not name:
+        raise ValueError("El nombre del archivo no puede estar vacío.")
+    return f"{INGEST_PREFIX.strip('/')}/{job_id}/source/{name}"
+
+
+def parse_key(job_id: str, key: str) -> str:
+    """
+    Comprueba que `key` es la key de origen del trabajo y devuelve el nombre
+    del archivo; lanza ValueError si no lo es.
+    """
+    match = _KEY_PATTERN.match(key or "")
+    if match is None or match["job_id"] != job_id or match["prefix"] != INGEST_PREFIX.strip("/"):
+        raise ValueError("La key no corresponde a esta subida.")
+    return match["filename"]
+
+
+def part_size_for(size: Optional[int]) -> int:
+    """
+    Tamaño de parte: UPLOAD_PART_SIZE, o el necesario para no pasar de
+    MAX_PARTS partes.
+    """
+    if not size:
+        return UPLOAD_PART_SIZE
+    return max(UPLOAD_PART_SIZE, math.ceil(size / MAX_PARTS))
+
+
+def presign_put(filename: str, content_type: Optional[str] = None, expires_in: int = UPLOAD_URL_TTL) -> dict:
+    """
+    URL firmada para subir un archivo pequeño con un único PUT.
+    """
+    from .instrumentation import span
+    from .upload_s3 import bucket, ensure_bucket_exists, get_s3
+
+    ensure_bucket_exists()
+    job_id = uuid.uuid4().hex
+    key = _source_key(job_id, filename)
+    params = {"Bucket": bucket, "Key": key}
+    if content_type:
+        params["ContentType"] = content_type
+    with span("s3.presign"):
+        url = get_s3().generate_presigned_url("put_object", Params=params, ExpiresIn=expires_in)
+    return {"job_id": job_id, "key": key, "url": url, "method": "PUT", "expires_in": expires_in}
+
+
+def presign_parts(key: str, upload_id: str, part_numbers: List[int], expires_in: int = UPLOAD_URL_TTL) -> List[dict]:
+    """
+    Firma en bloque las URLs de `upload_part` de las partes indicadas.
+    """
+    from .instrumentation import span
+    from .upload_s3 import bucket, get_s3
+
+    if len(part_numbers) > MAX_PRESIGN_BATCH:
+        raise ValueError(f"Como mucho {MAX_PRESIGN_BATCH} partes por petición.")
+    if any(not 1 <= n <= MAX_PARTS for n in part_numbers):
+        raise ValueError(f"Los números de parte van de 1 a {MAX_PARTS}.")
+    s3 = get_s3()
+    with span("s3.presign"):
+        return [
+            {"part_number": n, "url": s3.generate_presigned_url(
+                "upload_part", ExpiresIn=expires_in,
+                Params={"Bucket": bucket, "Key": key, "UploadId": upload_id, "PartNumber": n})}
+            for n in part_numbers
+        ]
+
+
+def initiate(filename: str, content_type: Optional[str] = None, size: Optional[int] = None,
+             expires_in: int = UPLOAD_URL_TTL) -> dict:
+    """
+    Crea la subida multipart. Si se indica `size`, devuelve también las URLs
+    firmadas de todas las partes (hasta MAX_PRESIGN_BATCH).
+    """
+    from .upload_s3 import bucket, ensure_bucket_exists, get_s3
+
+    if size is not None and size <= 0:
+        raise ValueError("El tamaño del archivo debe ser positivo.")
+    ensure_bucket_exists()
+    job_id = uuid.uuid4().hex
+    key = _source_key(job_id, filename)
+    params = {"Bucket": bucket, "Key": key}
+    if content_type:
+        params["ContentType"] = content_type
+    upload_id = get_s3().create_multipart_upload(**params)["UploadId"]
+    part_size = part_size_for(size)
+    result = {"job_id": job_id, "key": key, "upload_id": upload_id, "part_size": part_size,
+              "expires_in": expires_in}
+    if size is not None:
+        part_count = math.ceil(size / part_size)
+        result["part_count"] = part_count
+        result["parts"] = presign_parts(key, upload_id, list(range(1, min(part_count, MAX_PRESIGN_BATCH) + 1)),
+                                        expires_in)
+    logging.info(f"📤 Subida multipart iniciada: {key}")
+    return result
+
+
+def complete(key: str, upload_id: str, parts: List[dict]):
+    """
+    Cierra la subida multipart con las partes (`part_number`, `etag`) en
+    orden.
+    """
+    from botocore.exceptions import ClientError
+    from .upload_s3 import bucket, get_s3
+
+    if not parts:
+        raise ValueError("La subida no tiene partes.")
+    ordered = sorted(({"PartNumber": int(p["part_number"]), "ETag": p["etag"]} for p in parts),
+                     key=lambda p: p["PartNumber"])
+    try:
+        get_s3().complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id,
+                                           MultipartUpload={"Parts": ordered})
+    except ClientError as e:
+        # Reintento de un `complete` que ya se aplicó: la subida ya no existe pero el objeto sí
+        if e.response["Error"]["Code"] == "NoSuchUpload" and exists(key):
+            return
+        raise
+    logging.info(f"✅ Subida multipart completada: {key} ({len(ordered)} partes)")
+
+
+def abort(key: str, upload_id: str):
+    from .upload_s3 import bucket, get_s3
+
+    get_s3().abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+    logging.info(f"🗑️ Subida multipart cancelada: {key}")
+
+
+def exists(key: str) -> bool:
+    from botocore.exceptions import ClientError
+    from .upload_s3 import bucket, get_s3
+
+    try:
+        get_s3().head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+    return True
@@ -0,0 +1,456 @@
+"""
+Exportaciones de LEADS_FINAL a S3 como trabajos en segundo plano.
+
+El cliente crea un trabajo (`start_export`), recibe su ID y consulta el
+progreso (`get_job`); cada trozo terminado queda en S3 y se entrega con una
+URL firmada, de modo que los datos nunca pasan por la respuesta de Lambda.
+
+Dos modos:
+
+- `stream`: el cursor se recorre con `fetchmany` y se escribe en trozos de
+  `chunk_rows` filas (NDJSON gzip o Parquet). El orden es por keyset sobre
+  "Lead_Number" y cada trozo registra su última clave, así que un trabajo
+  fallido se reanuda (`resume_export`) desde el último trozo completo.
+- `unload`: Snowflake escribe los archivos con `COPY INTO @EXPORT_STAGE`
+  (stage externo cuya URL es la raíz del bucket S3) sin pasar por el proceso.
+
+Los trabajos se ejecutan en la cola de `ingestion.py` (mensajes de tipo
+`export`): en Lambda, la worker con disparador SQS, ya que la Lambda de la
+API se congela en cuanto devuelve la respuesta. Sin INGEST_QUEUE_URL se usan
+los hilos del proceso.
+
+En modo stream, la memoria queda acotada a un lote de `fetchmany`: cada
+trozo se escribe lote a lote (gzip incremental o un row group de Parquet por
+lote en un temporal de disco) y se sube por partes.
+
+El estado de cada trabajo se guarda como manifiesto JSON junto a sus trozos
+(`<EXPORT_PREFIX>/<job_id>/manifest.json`) para que cualquier instancia
+pueda responder al sondeo.
+"""
+import os
+import json
+import time
+import uuid
+import zlib
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+from .leads_reader import KEYSET_COLUMN, LEADS_TABLE, get_schema
+from .schema_cache import TableSchema, quote_identifier
+
+EXPORT_PREFIX = os.getenv("EXPORT_PREFIX", "exports")
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", 250_000))
+EXPORT_FETCH_ROWS = int(os.getenv("EXPORT_FETCH_ROWS", 10_000))
+EXPORT_STAGE = os.getenv("EXPORT_STAGE")
+EXPORT_MAX_FILE_SIZE = int(os.getenv("EXPORT_MAX_FILE_SIZE", 256 * 1024 * 1024))
+EXPORT_URL_TTL = int(os.getenv("EXPORT_URL_TTL", 3600))
+
+FORMATS = {"ndjson": ".ndjson.gz", "parquet": ".parquet"}
+MODES = ("stream", "unload")
+TERMINAL = ("succeeded", "failed")
+# Nombre público -> tabla de Snowflake exportable
+EXPORT_TABLES = {"LEADS_FINAL": LEADS_TABLE}
+
+
+class ExportJob:
+    """
+    Estado de un trabajo de exportación (serializable como manifiesto).
+    """
+
+    def __init__(self, job_id: str, table: str, format: str, mode: str, columns: Sequence[str],
+                 filters: Dict[str, Any], chunk_rows: int):
+        self.job_id = job_id
+        self.table = table
+        self.format = format
+        self.mode = mode
+        self.columns = list(columns)
+        self.filters = dict(filters)
+        self.chunk_rows = chunk_rows
+        self.status = "queued"
+        self.rows = 0
+        self.chunks: List[dict] = []
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    @property
+    def prefix(self) -> str:
+        return f"{EXPORT_PREFIX.strip('/')}/{self.job_id}"
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id, "table": self.table, "format": self.format, "mode": self.mode,
+            "columns": self.columns, "filters": self.filters, "chunk_rows": self.chunk_rows,
+            "status": self.status, "rows": self.rows, "chunks": self.chunks, "error": self.error,
+            "created_at": self.created_at, "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ExportJob":
+        job = cls(data["job_id"], data["table"], data["format"], data["mode"], data["columns"],
+                  data["filters"], data["chunk_rows"])
+        for field in ("status", "rows", "chunks", "error", "created_at", "updated_at"):
+            setattr(job, field, data[field])
+        return job
+
+
+_jobs: Dict[str, ExportJob] = {}
+_jobs_lock = threading.Lock()
+
+
+def _save(job: ExportJob):
+    """
+    Publica el estado del trabajo en memoria y en su manifiesto de S3.
+    """
+    from .upload_s3 import bucket, ensure_bucket_exists, get_s3
+
+    job.updated_at = time.time()
+    with _jobs_lock:
+        _jobs[job.job_id] = job
+    ensure_bucket_exists()
+    get_s3().put_object(Bucket=bucket, Key=f"{job.prefix}/manifest.json",
+                        Body=json.dumps(job.to_dict(), default=str).encode("utf-8"))
+
+
+def build_select(schema: TableSchema, columns: Sequence[str], filters: Dict[str, Any],
+                 after: bool = False, projection: Optional[str] = None) -> str:
+    """
+    Construye el SELECT de la exportación con identificadores entrecomillados
+    y valores enlazados (`%(f0)s`, ...). Los filtros son igualdades; una
+    lista se traduce a IN. `projection` sustituye a la lista de columnas.
+    """
+    projection = projection or ", ".join(quote_identifier(col) for col in columns)
+    conditions = []
+    for i, (column, value) in enumerate(filters.items()):
+        if isinstance(value, (list, tuple)):
+            placeholders = ", ".join(f"%(f{i}_{j})s" for j in range(len(value)))
+            conditions.append(f"{quote_identifier(column)} IN ({placeholders})")
+        else:
+            conditions.append(f"{quote_identifier(column)} = %(f{i})s")
+    if after:
+        conditions.append(f"{quote_identifier(KEYSET_COLUMN)} > %(after)s")
+    sql = f"SELECT {projection} FROM {schema.table}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return sql
+
+
+def bind_filters(filters: Dict[str, Any]) -> dict:
+    params = {}
+    for i, value in enumerate(filters.values()):
+        if isinstance(value, (list, tuple)):
+            params.update({f"f{i}_{j}": item for j, item in enumerate(value)})
+        else:
+            params[f"f{i}"] = value
+    return params
+
+
+def _validate(schema: TableSchema, columns: Sequence[str], filters: Dict[str, Any]):
+    unknown = [col for col in list(columns) + list(filters) if col not in schema.columns]
+    if unknown:
+        raise ValueError(f"Columnas desconocidas: {', '.join(unknown)}")
+    for column, value in filters.items():
+        if isinstance(value, (list, tuple)) and not value:
+            raise ValueError(f"El filtro de {column} no puede ser una lista vacía.")
+
+
+def start_export(table: str = "LEADS_FINAL", format: str = "ndjson", mode: str = "stream",
+                 columns: Optional[Sequence[str]] = None, filters: Optional[Dict[str, Any]] = None,
+                 chunk_rows: int = EXPORT_CHUNK_ROWS) -> ExportJob:
+    """
+    Valida la petición, registra el trabajo y lo lanza en segundo plano.
+    Lanza ValueError si la tabla, el formato, el modo o las columnas no son válidos.
+    """
+    from .snowflake_client import connection
+
+    if table.upper() not in EXPORT_TABLES:
+        raise ValueError(f"Tabla no exportable: {table}")
+    if format not in FORMATS:
+        raise ValueError(f"Formato no soportado: {format}. Usa {', '.join(FORMATS)}.")
+    if mode not in MODES:
+        raise ValueError(f"Modo no soportado: {mode}. Usa {', '.join(MODES)}.")
+    if mode == "unload" and not EXPORT_STAGE:
+        raise ValueError("El modo unload requiere configurar EXPORT_STAGE.")
+    if chunk_rows < 1:
+        raise ValueError("chunk_rows debe ser al menos 1.")
+    filters = filters or {}
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            schema = get_schema(cursor)
+        finally:
+            cursor.close()
+    columns = list(columns or schema.columns)
+    _validate(schema, columns, filters)
+
+    job = ExportJob(uuid.uuid4().hex, table.upper(), format, mode, columns, filters, chunk_rows)
+    _enqueue(job)
+    logging.info(f"📦 Exportación {job.job_id} en cola ({mode}, {format})")
+    return job
+
+
+def _enqueue(job: ExportJob):
+    from .ingestion import get_queue
+
+    _save(job)
+    get_queue().send(job.job_id, kind="export")
+
+
+def resume_export(job_id: str) -> ExportJob:
+    """
+    Relanza un trabajo fallido; en modo stream continúa tras el último trozo
+    completo. Lanza KeyError si no existe y ValueError si no está fallido.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise KeyError(job_id)
+    if job.status != "failed":
+        raise ValueError(f"Solo se pueden reanudar trabajos fallidos (estado: {job.status}).")
+    job.status, job.error = "queued", None
+    _enqueue(job)
+    return job
+
+
+def process(job_id: str):
+    """
+    Ejecuta un trabajo encolado (punto de entrada de los workers). Los
+    mensajes repetidos de un trabajo terminado se ignoran.
+    """
+    job = get_job(job_id)
+    if job is None:
+        logging.error(f"❌ Exportación {job_id} no encontrada")
+        return
+    if job.status in TERMINAL:
+        return
+    _run(job)
+
+
+def get_job(job_id: str) -> Optional[ExportJob]:
+    """
+    Devuelve el trabajo. Uno terminado se sirve desde memoria; uno en curso
+    se lee de su manifiesto en S3, porque puede avanzar en otra instancia
+    (la worker SQS), y la copia local solo se usa si no hay manifiesto.
+    """
+    from botocore.exceptions import ClientError
+    from .upload_s3 import bucket, get_s3
+
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None and job.status in TERMINAL:
+        return job
+    try:
+        body = get_s3().get_object(Bucket=bucket, Key=f"{EXPORT_PREFIX.strip('/')}/{job_id}/manifest.json")["Body"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return job
+        raise
+    return ExportJob.from_dict(json.loads(body.read()))
+
+
+def describe(job: ExportJob, url_ttl: int = EXPORT_URL_TTL) -> dict:
+    """
+    Estado del trabajo para la API, con una URL firmada por trozo.
+    """
+    from .upload_s3 import bucket, get_s3
+
+    s3 = get_s3()
+    result = job.to_dict()
+    result["chunks"] = [
+        {**chunk, "url": s3.generate_presigned_url("get_object", Params={"Bucket": bucket, "Key": chunk["key"]},
+                                                   ExpiresIn=url_ttl)}
+        for chunk in job.chunks
+    ]
+    return result
+
+
+def _run(job: ExportJob):
+    from .snowflake_client import connection
+
+    job.status = "running"
+    _save(job)
+    try:
+        with connection() as conn:
+            if job.mode == "unload":
+                _unload(conn, job)
+            else:
+                _stream(conn, job)
+        job.status = "succeeded"
+        logging.info(f"✅ Exportación {job.job_id}: {job.rows} filas en {len(job.chunks)} trozo(s)")
+    except Exception as e:
+        job.status, job.error = "failed", str(e)
+        logging.error(f"❌ Exportación {job.job_id} falló: {e}")
+    _save(job)
+
+
+class _ChunkReader:
+    """
+    Reparte los lotes de `fetchmany` en trozos de hasta `chunk_rows` filas
+    sin materializar ningún trozo: `chunk()` devuelve un iterador de lotes y
+    deja en `rows`/`last_key` lo que ha entregado.
+    """
+
+    def __init__(self, cursor, fetch_rows: int, key_index: int):
+        self._cursor = cursor
+        self._fetch_rows = fetch_rows
+        self._key_index = key_index
+        self._pending: List[tuple] = []
+        self._exhausted = False
+        self.rows = 0
+        self.last_key = None
+
+    def has_more(self) -> bool:
+        if not self._pending and not self._exhausted:
+            self._pending = self._cursor.fetchmany(self._fetch_rows) or []
+            self._exhausted = not self._pending
+        return bool(self._pending)
+
+    def chunk(self, limit: int) -> Iterator[List[tuple]]:
+        self.rows, self.last_key = 0, None
+        while self.rows < limit and self.has_more():
+            batch, self._pending = self._pending, []
+            room = limit - self.rows
+            if len(batch) > room:
+                batch, self._pending = batch[:room], batch[room:]
+            self.rows += len(batch)
+            self.last_key = batch[-1][self._key_index]
+            yield batch
+
+
+def _stream(conn, job: ExportJob):
+    """
+    Recorre el cursor y escribe un archivo en S3 cada `chunk_rows` filas.
+    """
+    cursor = conn.cursor()
+    try:
+        schema = get_schema(cursor)
+        # La clave de keyset se pide siempre (al final) para poder reanudar
+        select_columns = job.columns + ([KEYSET_COLUMN] if KEYSET_COLUMN not in job.columns else [])
+        after = job.chunks[-1]["last_key"] if job.chunks else None
+        sql = build_select(schema, select_columns, job.filters, after=after is not None)
+        sql += f" ORDER BY {quote_identifier(KEYSET_COLUMN)}"
+        params = bind_filters(job.filters)
+        if after is not None:
+            params["after"] = after
+        cursor.execute(sql, params)
+
+        to_dict = TableSchema(schema.table, job.columns).to_dict
+        reader = _ChunkReader(cursor, EXPORT_FETCH_ROWS, select_columns.index(KEYSET_COLUMN))
+        while reader.has_more():
+            number = len(job.chunks) + 1
+            key = f"{job.prefix}/part-{number:05d}{FORMATS[job.format]}"
+            size = _write_chunk(key, reader.chunk(job.chunk_rows), to_dict, job)
+            job.rows += reader.rows
+            job.chunks.append({"key": key, "rows": reader.rows, "bytes": size, "last_key": reader.last_key})
+            _save(job)
+    finally:
+        cursor.close()
+
+
+def _write_chunk(key: str, batches: Iterator[List[tuple]], to_dict, job: ExportJob) -> int:
+    """
+    Sube un trozo (lotes de filas) a S3 y devuelve su tamaño en bytes.
+    """
+    from .upload_s3 import upload_stream
+
+    written = 0
+
+    def _counted(parts):
+        nonlocal written
+        for part in parts:
+            written += len(part)
+            yield part
+
+    if job.format == "parquet":
+        with tempfile.TemporaryFile(suffix=".parquet") as tmp:
+            _write_parquet(batches, job.columns, tmp)
+            tmp.seek(0)
+            upload_stream(key, _counted(iter(lambda: tmp.read(1024 * 1024), b"")))
+    else:
+        upload_stream(key, _counted(_gzip_ndjson(batches, to_dict)))
+    return written
+
+
+def _gzip_ndjson(batches: Iterator[List[tuple]], to_dict) -> Iterator[bytes]:
+    """
+    Comprime en gzip, lote a lote, una línea JSON por fila.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for rows in batches:
+        lines = "".join(json.dumps(to_dict(row), default=str) + "\n" for row in rows)
+        data = compressor.compress(lines.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _arrow_column(values: Sequence, name: str, type_=None):
+    import pyarrow as pa
+
+    if type_ is not None and pa.types.is_string(type_):
+        return pa.array([None if v is None else str(v) for v in values], type=type_)
+    try:
+        array = pa.array(values, type=type_)
+    except (pa.ArrowInvalid, pa.ArrowTypeError) as e:
+        raise ValueError(f"La columna {name} no encaja en el tipo {type_} de los lotes anteriores: {e}")
+    # Una columna sin valores en el primer lote se escribe como texto
+    return array.cast(pa.string()) if pa.types.is_null(array.type) else array
+
+
+def _write_parquet(batches: Iterator[List[tuple]], columns: Sequence[str], sink):
+    """
+    Escribe cada lote como un row group; el esquema se fija con el primero.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    try:
+        for rows in batches:
+            values = list(zip(*rows))
+            if writer is None:
+                arrays = [_arrow_column(values[i], name) for i, name in enumerate(columns)]
+                writer = pq.ParquetWriter(sink, pa.schema([pa.field(n, a.type) for n, a in zip(columns, arrays)]),
+                                          compression="zstd")
+            else:
+                arrays = [_arrow_column(values[i], f.name, f.type) for i, f in enumerate(writer.schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def _unload(conn, job: ExportJob):
+    """
+    Descarga la exportación en Snowflake (COPY INTO @stage) y registra los
+    archivos resultantes a partir del listado de S3.
+    """
+    from .upload_s3 import bucket, get_s3
+
+    cursor = conn.cursor()
+    try:
+        schema = get_schema(cursor)
+        if job.format == "ndjson":
+            # Una columna VARIANT por fila: el unload JSON escribe un objeto por línea
+            pairs = ", ".join(f"'{col}', {quote_identifier(col)}" for col in job.columns)
+            select = build_select(schema, job.columns, job.filters, projection=f"OBJECT_CONSTRUCT_KEEP_NULL({pairs})")
+            file_format = "TYPE = JSON COMPRESSION = GZIP"
+        else:
+            select = build_select(schema, job.columns, job.filters)
+            file_format = "TYPE = PARQUET"
+        cursor.execute(
+            f"COPY INTO @{EXPORT_STAGE}/{job.prefix}/part FROM ({select}) "
+            f"FILE_FORMAT = ({file_format}) HEADER = TRUE MAX_FILE_SIZE = {EXPORT_MAX_FILE_SIZE}",
+            bind_filters(job.filters),
+        )
+        result = cursor.fetchone()
+        job.rows = int(result[0]) if result else 0
+    finally:
+        cursor.close()
+
+    paginator = get_s3().get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix=f"{job.prefix}/part"):
+        for item in page.get("Contents", []):
+            job.chunks.append({"key": item["Key"], "rows": None, "bytes": item["Size"]})
@@ -0,0 +1,486 @@
+"""
+Ingesta de archivos de leads como trabajos en segundo plano.
+
+La petición solo sube el archivo original a S3 (en streaming, por partes),
+crea el trabajo y lo encola; la respuesta no depende del tamaño del
+archivo. Un worker ejecuta después las etapas:
+
+1. `clean`: pre-validación y limpieza en streaming hacia S3
+   (`<INGEST_PREFIX>/<job_id>/cleaned.csv`, o Parquet si no se carga).
+2. `stage`: PUT del archivo limpio al stage interno de Snowflake.
+3. `load`: COPY INTO leads_raw.
+
+Cada etapa guarda su progreso, intentos y errores en el manifiesto del
+trabajo (`<INGEST_PREFIX>/<job_id>/job.json`), que cualquier instancia
+puede leer. Los errores transitorios se reintentan con backoff
+exponencial; los de datos (CSV ilegible) no. Un trabajo fallido se puede
+relanzar (`retry`) y continúa por la primera etapa no completada.
+
+Cola:
+
+- Local (por defecto): hilos del proceso, INGEST_WORKERS trabajos a la vez.
+  Se usan hilos y no procesos por lo mismo que en `concurrency.py`.
+- SQS (INGEST_QUEUE_URL): se envía un mensaje por trabajo y una Lambda
+  worker lo procesa (`handle_sqs_event`, enrutado desde `main.handler`).
+
+La misma cola ejecuta las exportaciones de `exports.py` (mensajes de tipo
+`export`, ver `dispatch`).
+
+Las etapas `stage` y `load` usan Snowflake y se limitan a
+INGEST_LOAD_CONCURRENCY a la vez por proceso.
+
+Con deduplicación, `clean` solo filtra: los hashes de las filas emitidas se
+guardan junto al trabajo (`dedup_pending.npz`) y se confirman en el índice
+al terminar `load`, así que un archivo que no llega a Snowflake no marca
+sus filas como cargadas. Si la carga falla, el archivo limpio sigue en S3
+y `retry` lo vuelve a cargar.
+"""
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Dict, List, Optional
+
+INGEST_PREFIX = os.getenv("INGEST_PREFIX", "ingest")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+INGEST_LOAD_CONCURRENCY = int(os.getenv("INGEST_LOAD_CONCURRENCY", 1))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", 3))
+INGEST_RETRY_BASE_DELAY = float(os.getenv("INGEST_RETRY_BASE_DELAY", 1.0))
+# Como mucho una escritura del manifiesto por este intervalo mientras avanza una etapa
+INGEST_PROGRESS_INTERVAL = float(os.getenv("INGEST_PROGRESS_INTERVAL", 2.0))
+INGEST_QUEUE_URL = os.getenv("INGEST_QUEUE_URL", "")
+INGEST_URL_TTL = int(os.getenv("INGEST_URL_TTL", 3600))
+UPLOAD_READ_SIZE = 8 * 1024 * 1024
+
+STAGES = ("clean", "stage", "load")
+TERMINAL = ("succeeded", "failed")
+
+
+class IngestJob:
+    """
+    Estado de un trabajo de ingesta (serializable como manifiesto).
+    """
+
+    def __init__(self, job_id: str, filename: str, options: dict):
+        self.job_id = job_id
+        self.filename = filename
+        self.options = dict(options)
+        self.status = "queued"
+        self.stages: Dict[str, dict] = {
+            name: {"status": "pending", "attempts": 0, "started_at": None, "finished_at": None,
+                   "error": None, "progress": {}}
+            for name in self.stage_names
+        }
+        self.result: Dict[str, dict] = {}
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    @property
+    def prefix(self) -> str:
+        return f"{INGEST_PREFIX.strip('/')}/{self.job_id}"
+
+    @property
+    def source_key(self) -> str:
+        return f"{self.prefix}/source/{os.path.basename(self.filename)}"
+
+    @property
+    def stage_names(self) -> tuple:
+        return STAGES if self.options.get("load", True) else STAGES[:1]
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.job_id, "filename": self.filename, "options": self.options,
+            "status": self.status, "stages": self.stages, "result": self.result, "error": self.error,
+            "created_at": self.created_at, "updated_at": self.updated_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "IngestJob":
+        job = cls(data["job_id"], data["filename"], data["options"])
+        for field in ("status", "stages", "result", "error", "created_at", "updated_at"):
+            setattr(job, field, data[field])
+        return job
+
+
+_jobs: Dict[str, IngestJob] = {}
+_jobs_lock = threading.Lock()
+_load_slots = threading.BoundedSemaphore(INGEST_LOAD_CONCURRENCY)
+
+
+def _save(job: IngestJob):
+    """
+    Publica el estado del trabajo en memoria y en su manifiesto de S3.
+    """
+    from .upload_s3 import bucket, ensure_bucket_exists, get_s3
+
+    job.updated_at = time.time()
+    with _jobs_lock:
+        _jobs[job.job_id] = job
+    ensure_bucket_exists()
+    get_s3().put_object(Bucket=bucket, Key=f"{job.prefix}/job.json",
+                        Body=json.dumps(job.to_dict(), default=str).encode("utf-8"))
+
+
+def get_job(job_id: str) -> Optional[IngestJob]:
+    """
+    Devuelve el trabajo. Uno terminado se sirve desde memoria; uno en curso
+    se lee de su manifiesto en S3, porque con la cola SQS avanza en la
+    worker, y la copia local solo se usa si no hay manifiesto.
+    """
+    from botocore.exceptions import ClientError
+    from .upload_s3 import bucket, get_s3
+
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None and job.status in TERMINAL:
+        return job
+    try:
+        body = get_s3().get_object(Bucket=bucket, Key=f"{INGEST_PREFIX.strip('/')}/{job_id}/job.json")["Body"]
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+            return job
+        raise
+    return IngestJob.from_dict(json.loads(body.read()))
+
+
+class LocalQueue:
+    """
+    Cola en proceso: un grupo de hilos con INGEST_WORKERS trabajos a la vez.
+    """
+
+    def __init__(self, workers: int = INGEST_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest")
+        self._lock = threading.Lock()
+        self.workers = workers
+        self.pending = 0
+        self.running = 0
+
+    def send(self, job_id: str, kind: str = "ingest"):
+        with self._lock:
+            self.pending += 1
+        self._executor.submit(self._work, job_id, kind)
+
+    def _work(self, job_id: str, kind: str):
+        with self._lock:
+            self.pending -= 1
+            self.running += 1
+        try:
+            dispatch(job_id, kind)
+        finally:
+            with self._lock:
+                self.running -= 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"backend": "local", "workers": self.workers, "pending": self.pending, "running": self.running}
+
+
+class SQSQueue:
+    """
+    Cola SQS: un mensaje `{"job_id": ..., "kind": ...}` por trabajo.
+    """
+
+    def __init__(self, queue_url: str = INGEST_QUEUE_URL):
+        self.queue_url = queue_url
+        self._client = None
+
+    def _sqs(self):
+        if self._client is None:
+            import boto3
+            from .instrumentation import instrument_client
+            self._client = instrument_client(boto3.client("sqs", region_name=os.getenv("AWS_REGION", "eu-west-1")),
+                                             "sqs")
+        return self._client
+
+    def send(self, job_id: str, kind: str = "ingest"):
+        self._sqs().send_message(QueueUrl=self.queue_url, MessageBody=json.dumps({"job_id": job_id, "kind": kind}))
+
+    def stats(self) -> dict:
+        return {"backend": "sqs", "queue_url": self.queue_url}
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = SQSQueue() if INGEST_QUEUE_URL else LocalQueue()
+    return _queue
+
+
+def _new_job(job_id: str, filename: str, score: bool, dedup: bool, bad_rows: str, output: str,
+             load: bool) -> IngestJob:
+    if bad_rows not in ("skip", "repair"):
+        raise ValueError(f"Modo no soportado: {bad_rows}. Usa skip o repair.")
+    if output not in ("csv", "parquet"):
+        raise ValueError(f"Salida no soportada: {output}. Usa csv o parquet.")
+    if load and output != "csv":
+        raise ValueError("La carga en Snowflake usa la salida csv.")
+    return IngestJob(job_id, filename,
+                     {"score": score, "dedup": dedup, "bad_rows": bad_rows, "output": output, "load": load})
+
+
+def _enqueue(job: IngestJob) -> IngestJob:
+    _save(job)
+    get_queue().send(job.job_id)
+    logging.info(f"📥 Ingesta {job.job_id} en cola ({job.filename})")
+    return job
+
+
+def submit(fileobj: BinaryIO, filename: str, score: bool = False, dedup: bool = False,
+           bad_rows: str = "skip", output: str = "csv", load: bool = True) -> IngestJob:
+    """
+    Sube el archivo original a S3, crea el trabajo y lo encola. Lanza
+    ValueError si las opciones no son válidas.
+    """
+    from .upload_s3 import upload_stream
+
+    job = _new_job(uuid.uuid4().hex, filename, score, dedup, bad_rows, output, load)
+    fileobj.seek(0)
+    upload_stream(job.source_key, iter(lambda: fileobj.read(UPLOAD_READ_SIZE), b""))
+    return _enqueue(job)
+
+
+def start_uploaded(job_id: str, filename: str, score: bool = False, dedup: bool = False,
+                   bad_rows: str = "skip", output: str = "csv", load: bool = True) -> IngestJob:
+    """
+    Encola la ingesta de un archivo que ya está en su key de origen (subida
+    directa a S3, ver `direct_upload.py`). Repetir la llamada devuelve el
+    trabajo existente.
+    """
+    job = get_job(job_id)
+    if job is not None:
+        return job
+    return _enqueue(_new_job(job_id, filename, score, dedup, bad_rows, output, load))
+
+
+def retry(job_id: str) -> IngestJob:
+    """
+    Relanza un trabajo fallido desde la primera etapa no completada. Lanza
+    KeyError si no existe y ValueError si no está fallido.
+    """
+    job = get_job(job_id)
+    if job is None:
+        raise KeyError(job_id)
+    if job.status != "failed":
+        raise ValueError(f"Solo se pueden reintentar trabajos fallidos (estado: {job.status}).")
+    job.status, job.error = "queued", None
+    for stage in job.stages.values():
+        if stage["status"] != "succeeded":
+            stage.update(status="pending", attempts=0, error=None)
+    _save(job)
+    get_queue().send(job.job_id)
+    return job
+
+
+def dispatch(job_id: str, kind: str = "ingest"):
+    """
+    Ejecuta el trabajo de un mensaje de la cola según su tipo.
+    """
+    if kind == "export":
+        from .exports import process as process_export
+        return process_export(job_id)
+    if kind != "ingest":
+        raise ValueError(f"Tipo de trabajo desconocido: {kind}")
+    return process(job_id)
+
+
+def process(job_id: str):
+    """
+    Ejecuta las etapas pendientes de un trabajo (punto de entrada de los
+    workers). Los mensajes repetidos de un trabajo terminado se ignoran.
+    """
+    job = get_job(job_id)
+    if job is None:
+        logging.error(f"❌ Ingesta {job_id} no encontrada")
+        return
+    if job.status in TERMINAL:
+        return
+    _run(job)
+
+
+def _retryable(error: Exception) -> bool:
+    # Un CSV ilegible fallará igual en el siguiente intento
+    return not isinstance(error, (ValueError, UnicodeError))
+
+
+def _run(job: IngestJob):
+    from .instrumentation import span
+
+    job.status = "running"
+    _save(job)
+    for name in job.stage_names:
+        stage = job.stages[name]
+        if stage["status"] == "succeeded":
+            continue
+        while True:
+            stage["attempts"] += 1
+            stage.update(status="running", started_at=time.time(), error=None)
+            _save(job)
+            try:
+                with span(f"ingest.{name}"):
+                    STAGE_FUNCTIONS[name](job, stage)
+                stage.update(status="succeeded", finished_at=time.time())
+                _save(job)
+                break
+            except Exception as e:
+                stage["error"] = str(e)
+                if stage["attempts"] >= INGEST_MAX_ATTEMPTS or not _retryable(e):
+                    stage.update(status="failed", finished_at=time.time())
+                    job.status, job.error = "failed", f"{name}: {e}"
+                    logging.error(f"❌ Ingesta {job.job_id} falló en {name}: {e}")
+                    _save(job)
+                    return
+                delay = INGEST_RETRY_BASE_DELAY * (2 ** (stage["attempts"] - 1))
+                logging.warning(f"⚠️ Ingesta {job.job_id}: {name} falló ({e}); reintento en {delay:.1f}s")
+                stage["status"] = "retrying"
+                _save(job)
+                time.sleep(delay)
+    job.status = "succeeded"
+    logging.info(f"✅ Ingesta {job.job_id} completada")
+    _save(job)
+
+
+def _download(key: str, suffix: str):
+    from .upload_s3 import bucket, get_s3
+
+    tmp = tempfile.NamedTemporaryFile(suffix=suffix)
+    shutil.copyfileobj(get_s3().get_object(Bucket=bucket, Key=key)["Body"], tmp, UPLOAD_READ_SIZE)
+    tmp.flush()
+    tmp.seek(0)
+    return tmp
+
+
+def _clean(job: IngestJob, stage: dict):
+    from .aggregates import FileAggregate, record
+    from .cleaning import clean_csv_to_s3
+    from .dedup import get_index
+    from .parquet_stage import clean_csv_to_parquet_s3
+    from .prevalidate import prevalidate
+    from .upload_s3 import bucket, get_s3
+
+    options = job.options
+    load = options.get("load", True)
+    aggregate = FileAggregate()
+    run = get_index().begin() if options["dedup"] and load else None
+    with _download(job.source_key, ".csv") as tmp:
+        total = os.fstat(tmp.fileno()).st_size
+        report = prevalidate(tmp)
+        last_save = [time.monotonic()]
+
+        def _progress(values: dict):
+            stage["progress"] = {**values, "percent": round(100 * values["bytes_in"] / total, 1) if total else 100.0}
+            if time.monotonic() - last_save[0] >= INGEST_PROGRESS_INTERVAL:
+                last_save[0] = time.monotonic()
+                _save(job)
+
+        if options["output"] == "parquet":
+            stats = clean_csv_to_parquet_s3(tmp, job.filename, score=options["score"], report=report,
+                                            bad_rows=options["bad_rows"], aggregate=aggregate,
+                                            dedup=options["dedup"])
+        else:
+            stats = clean_csv_to_s3(tmp, f"{job.prefix}/cleaned.csv", score=options["score"],
+                                    dedup=options["dedup"], report=report, bad_rows=options["bad_rows"],
+                                    progress=_progress, aggregate=aggregate, dedup_run=run)
+    stage["progress"] = {"rows": stats["rows"], "bytes_in": total, "percent": 100.0}
+    job.result["clean"] = {
+        "s3_key": stats["s3_key"], "rows": stats["rows"],
+        "rows_skipped": stats.get("rows_skipped"), "bytes_saved": stats.get("bytes_saved"),
+        "encoding": report["encoding"], "bad_row_count": report["bad_row_count"],
+        "header_issues": report["header_issues"],
+        # El parcial viaja en el manifiesto hasta la etapa de carga (puede ser otro worker)
+        "aggregate": aggregate.to_dict(),
+    }
+    if run is not None:
+        # Se confirman tras `load`, que puede ejecutarse en otro worker
+        key = f"{job.prefix}/dedup_pending.npz"
+        get_s3().put_object(Bucket=bucket, Key=key, Body=run.pending().to_bytes())
+        job.result["clean"]["dedup_pending"] = key
+    if not load:
+        record("cleaned", stats["s3_key"], aggregate)
+
+
+def _stage(job: IngestJob, stage: dict):
+    from .snowflake_client import connection, put_to_stage
+
+    clean = job.result["clean"]
+    if not clean["rows"]:
+        job.result["stage"] = {"skipped": "sin filas nuevas"}
+        return
+    with _download(clean["s3_key"], f"_{job.job_id}_cleaned.csv") as tmp, _load_slots:
+        with connection() as conn:
+            staged = put_to_stage(conn, tmp.name)
+    job.result["stage"] = {"staged_file": staged}
+
+
+def _load(job: IngestJob, stage: dict):
+    from .aggregates import FileAggregate, record
+    from .snowflake_client import connection, copy_into_raw
+
+    staged = job.result["stage"].get("staged_file")
+    if staged is None:
+        job.result["load"] = {"skipped": job.result["stage"].get("skipped")}
+        return
+    with _load_slots, connection() as conn:
+        job.result["load"] = copy_into_raw(conn, staged)
+    pending_key = job.result["clean"].get("dedup_pending")
+    if pending_key:
+        from .dedup import HashIndex, commit_pending
+        from .upload_s3 import bucket, get_s3
+        commit_pending(HashIndex.from_bytes(get_s3().get_object(Bucket=bucket, Key=pending_key)["Body"].read()))
+    record("loaded", staged, FileAggregate.from_dict(job.result["clean"]["aggregate"]))
+    stage["progress"] = {"rows": job.result["clean"]["rows"], "percent": 100.0}
+
+
+STAGE_FUNCTIONS = {"clean": _clean, "stage": _stage, "load": _load}
+
+
+def describe(job: IngestJob, url_ttl: int = INGEST_URL_TTL) -> dict:
+    """
+    Estado del trabajo para la API; si no se carga en Snowflake, incluye la
+    URL firmada del archivo limpio.
+    """
+    from .upload_s3 import bucket, get_s3
+
+    result = job.to_dict()
+    result["status_url"] = f"/ingestions/{job.job_id}"
+    clean = job.result.get("clean")
+    if job.status == "succeeded" and clean and not job.options.get("load", True):
+        result["download_url"] = get_s3().generate_presigned_url(
+            "get_object", Params={"Bucket": bucket, "Key": clean["s3_key"]}, ExpiresIn=url_ttl)
+    return result
+
+
+def handle_sqs_event(event: dict) -> dict:
+    """
+    Punto de entrada de la Lambda worker con disparador SQS. Devuelve los
+    mensajes fallidos (ReportBatchItemFailures) para que SQS los reintente.
+    """
+    failures: List[dict] = []
+    for record in event.get("Records", []):
+        try:
+            body = json.loads(record["body"])
+            dispatch(body["job_id"], body.get("kind", "ingest"))
+        except Exception as e:
+            logging.error(f"❌ Mensaje de ingesta {record.get('messageId')} falló: {e}")
+            failures.append({"itemIdentifier": record["messageId"]})
+    return {"batchItemFailures": failures}
+
+
+def stats() -> dict:
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    by_status: Dict[str, int] = {}
+    for job in jobs:
+        by_status[job.status] = by_status.get(job.status, 0) + 1
+    return {"queue": get_queue().stats(), "jobs": by_status}
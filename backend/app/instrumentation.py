@@ -0,0 +1,353 @@
+"""
+Instrumentación de los caminos calientes.
+
+- `InstrumentationMiddleware` (ASGI) abre un contexto de tiempos por
+  petición y al terminar añade la cabecera `Server-Timing`, escribe una
+  línea JSON en el logger `timing` y actualiza las métricas.
+- `span(name)` / `timed(name)` miden un tramo (conexión a Snowflake,
+  `execute`, llamadas boto3, SageMaker, etapas de pandas). El tramo se suma
+  al desglose de la petición en curso (vía `contextvars`, que se propaga a
+  los hilos de `run_io`/`run_cpu`) y a un histograma global.
+- `instrument_client` engancha los eventos de botocore para medir cada
+  llamada a la API de un cliente boto3 (`s3.UploadPart`, ...).
+- `render_metrics` genera el formato de texto de Prometheus para `/metrics`.
+
+El coste por tramo es un par de `perf_counter()` y unas sumas bajo un lock;
+se puede desactivar con INSTRUMENTATION_ENABLED=0.
+"""
+import os
+import json
+import time
+import logging
+import threading
+import functools
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence
+
+INSTRUMENTATION_ENABLED = os.getenv("INSTRUMENTATION_ENABLED", "1") == "1"
+TIMING_LOG = os.getenv("TIMING_LOG", "1") == "1"
+# Tramos como mucho en la cabecera Server-Timing (los más lentos)
+SERVER_TIMING_MAX = int(os.getenv("SERVER_TIMING_MAX", 20))
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+timing_logger = logging.getLogger("timing")
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str]):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: tuple, value: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str], buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, tuple(labels), tuple(buckets)
+        # labels -> [cuentas por cubo (no acumuladas), suma, total]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: tuple, value: float):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> Dict[tuple, dict]:
+        with self._lock:
+            return {labels: {"count": s[2], "sum": s[1]} for labels, s in self._series.items()}
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, [list(s[0]), s[1], s[2]]) for labels, s in self._series.items())
+        names = self.labels + ("le",)
+        for labels, (counts, total, count) in series:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {count}")
+        return lines
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+http_requests = Counter("http_requests_total", "Peticiones HTTP atendidas", ("method", "route", "status"))
+http_request_seconds = Histogram("http_request_duration_seconds", "Duración de las peticiones HTTP",
+                                 ("method", "route"))
+span_seconds = Histogram("span_duration_seconds", "Duración de los tramos instrumentados", ("span",))
+
+
+class RequestTimings:
+    """
+    Desglose de tiempos de una petición: por tramo, número de veces y total.
+    """
+
+    __slots__ = ("spans", "_lock")
+
+    def __init__(self):
+        self.spans: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float):
+        with self._lock:
+            item = self.spans.get(name)
+            if item is None:
+                self.spans[name] = [1, seconds]
+            else:
+                item[0] += 1
+                item[1] += seconds
+
+    def as_ms(self) -> Dict[str, dict]:
+        with self._lock:
+            return {name: {"count": c, "ms": round(t * 1000, 3)} for name, (c, t) in self.spans.items()}
+
+    def server_timing(self, total: float) -> str:
+        with self._lock:
+            spans = sorted(self.spans.items(), key=lambda item: item[1][1], reverse=True)[:SERVER_TIMING_MAX]
+        parts = [f"total;dur={total * 1000:.1f}"]
+        for name, (count, seconds) in spans:
+            entry = f"{name};dur={seconds * 1000:.1f}"
+            if count > 1:
+                entry += f';desc="x{count}"'
+            parts.append(entry)
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+def record(name: str, seconds: float):
+    """
+    Registra un tramo ya medido.
+    """
+    span_seconds.observe((name,), seconds)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+class span:
+    """
+    Mide el bloque como el tramo `name` (`with span("s3.presign"): ...`).
+    Clase y no generador: es el camino caliente de la instrumentación.
+    """
+
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if INSTRUMENTATION_ENABLED:
+            record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def timed(name: str):
+    """
+    Decorador: mide cada llamada a la función como el tramo `name`.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _before_call(model=None, context=None, **kwargs):
+    if context is not None:
+        context["_timing_start"] = time.perf_counter()
+
+
+def _make_after_call(service: str):
+    def _after_call(model=None, context=None, **kwargs):
+        start = context.pop("_timing_start", None) if context is not None else None
+        if start is not None and model is not None:
+            record(f"{service}.{model.name}", time.perf_counter() - start)
+    return _after_call
+
+
+def instrument_client(client, service: str):
+    """
+    Mide cada llamada a la API del cliente boto3 con los eventos de botocore
+    (sin envolver el cliente). Los clientes sin `meta.events` (sustitutos en
+    pruebas) se devuelven tal cual.
+    """
+    events = getattr(getattr(client, "meta", None), "events", None)
+    if events is None or not INSTRUMENTATION_ENABLED:
+        return client
+    after = _make_after_call(service)
+    # before-parameter-build es el primer evento de cada llamada: incluye la serialización
+    events.register("before-parameter-build", _before_call)
+    events.register("after-call", after)
+    events.register("after-call-error", after)
+    return client
+
+
+class TimedCursor:
+    """
+    Cursor de Snowflake que mide `execute` y las lecturas.
+    """
+
+    __slots__ = ("_cursor",)
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, *args, **kwargs):
+        with span("snowflake.execute"):
+            self._cursor.execute(*args, **kwargs)
+        return self
+
+    def fetchone(self):
+        with span("snowflake.fetch"):
+            return self._cursor.fetchone()
+
+    def fetchmany(self, *args, **kwargs):
+        with span("snowflake.fetch"):
+            return self._cursor.fetchmany(*args, **kwargs)
+
+    def fetchall(self):
+        with span("snowflake.fetch"):
+            return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class TimedConnection:
+    """
+    Conexión de Snowflake cuyos cursores están instrumentados. `raw` es la
+    conexión original (para APIs que la necesitan tal cual).
+    """
+
+    __slots__ = ("raw",)
+
+    def __init__(self, conn):
+        self.raw = conn
+
+    def cursor(self, *args, **kwargs):
+        return TimedCursor(self.raw.cursor(*args, **kwargs))
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+
+def _route(scope: dict) -> str:
+    # Plantilla de la ruta (p. ej. /exports/{job_id}) para no disparar la cardinalidad
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+class InstrumentationMiddleware:
+    """
+    Middleware ASGI: tiempos por petición, Server-Timing, log JSON y métricas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not INSTRUMENTATION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def _send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                header = timings.server_timing(time.perf_counter() - start).encode("latin-1")
+                message = {**message, "headers": list(message.get("headers", [])) + [(b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            duration = time.perf_counter() - start
+            _current.reset(token)
+            method, route = scope.get("method", ""), _route(scope)
+            http_requests.inc((method, route, str(status)))
+            http_request_seconds.observe((method, route), duration)
+            if TIMING_LOG and timing_logger.isEnabledFor(logging.INFO):
+                timing_logger.info(json.dumps({
+                    "event": "request", "method": method, "route": route, "path": scope.get("path"),
+                    "status": status, "duration_ms": round(duration * 1000, 3), "spans": timings.as_ms(),
+                }))
+
+
+def _gauges(prefix: str, stats: dict) -> list:
+    """
+    Convierte un dict de estadísticas (como los de `/metrics/*`) en gauges;
+    un nivel anidado se expone con la etiqueta `group`.
+    """
+    samples: Dict[str, list] = {}
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            for sub, v in value.items():
+                if isinstance(v, (int, float)) and not isinstance(v, bool):
+                    samples.setdefault(f"{prefix}_{sub}", []).append((_labels(("group",), (key,)), v))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            samples.setdefault(f"{prefix}_{key}", []).append(("", value))
+    lines = []
+    for name, values in samples.items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(f"{name}{labels} {_number(v)}" for labels, v in values)
+    return lines
+
+
+def render_metrics(gauges: Optional[Dict[str, dict]] = None) -> str:
+    """
+    Texto en formato de exposición de Prometheus: métricas HTTP y de tramos
+    más los gauges de `gauges` ({prefijo: estadísticas}).
+    """
+    lines = http_requests.render() + http_request_seconds.render() + span_seconds.render()
+    for prefix, stats in (gauges or {}).items():
+        lines += _gauges(prefix, stats)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,270 @@
+"""
+Consultas con filtros, proyección y orden sobre LEADS_FINAL.
+
+Los filtros (grado, etapa, rango de score, fecha de carga) se resuelven en
+Snowflake con parámetros enlazados, de modo que solo viajan las filas y
+columnas pedidas. Cada combinación de filtros presentes, columnas y orden
+("forma" de la consulta) se compila una vez y se memoriza en el esquema
+cacheado de la tabla (`TableSchema.statement`), así que se invalida con él.
+
+La paginación es por keyset sobre (columna de orden, "Lead_Number"); los
+NULL de la columna de orden van al final. El cursor lleva una huella de los
+filtros y el orden, y no se acepta con una consulta distinta.
+"""
+import os
+import json
+import hashlib
+from typing import Any, Iterator, Optional, Sequence
+
+from .leads_reader import KEYSET_COLUMN, LEADS_TABLE, STREAM_BATCH_SIZE, decode_cursor, encode_cursor, get_schema
+from .schema_cache import TableSchema, compile_row_mapper, quote_identifier
+from .scoring import ACTIVITY_COLUMN, GRADE_COLUMN, STAGE_COLUMN
+
+# Columna de fecha para los filtros `loaded_from`/`loaded_to` (puede ser una
+# columna técnica no proyectada); se comprueba contra el esquema cacheado
+LEADS_DATE_COLUMN = os.getenv("LEADS_DATE_COLUMN", "LOAD_TS")
+QUERY_MAX_IN_VALUES = int(os.getenv("LEADS_QUERY_MAX_IN_VALUES", 64))
+
+# Columna calculada con la UDF de scoring; se puede proyectar, filtrar y ordenar
+SCORE_COLUMN = "score"
+SCORE_SQL = f"SCORING_UDF({quote_identifier(ACTIVITY_COLUMN)}, {quote_identifier(GRADE_COLUMN)}, {quote_identifier(STAGE_COLUMN)})"
+
+
+def _in_slots(n: int) -> int:
+    # Las listas IN se rellenan hasta la siguiente potencia de 2 para no
+    # compilar una sentencia distinta por cada número de valores
+    return 1 << (n - 1).bit_length() if n else 0
+
+
+class LeadQuery:
+    """
+    Filtros, proyección, orden y límite de una consulta sobre LEADS_FINAL.
+    """
+
+    __slots__ = ("grades", "stages", "score_min", "score_max", "loaded_from", "loaded_to",
+                 "columns", "order_by", "descending", "limit", "after")
+
+    def __init__(self, grades: Sequence[str] = (), stages: Sequence[str] = (),
+                 score_min: Optional[float] = None, score_max: Optional[float] = None,
+                 loaded_from: Any = None, loaded_to: Any = None, columns: Optional[Sequence[str]] = None,
+                 order_by: str = KEYSET_COLUMN, descending: bool = False, limit: Optional[int] = None,
+                 after: Any = None):
+        self.grades = tuple(dict.fromkeys(grades or ()))
+        self.stages = tuple(dict.fromkeys(stages or ()))
+        for name, values in (("grade", self.grades), ("stage", self.stages)):
+            if len(values) > QUERY_MAX_IN_VALUES:
+                raise ValueError(f"Demasiados valores de {name} (máximo {QUERY_MAX_IN_VALUES}).")
+        if score_min is not None and score_max is not None and score_min > score_max:
+            raise ValueError("score_min no puede ser mayor que score_max.")
+        self.score_min = score_min
+        self.score_max = score_max
+        self.loaded_from = loaded_from
+        self.loaded_to = loaded_to
+        self.columns = tuple(dict.fromkeys(columns)) if columns else None
+        self.order_by = order_by
+        self.descending = descending
+        self.limit = limit
+        self.after = None
+        if after is not None:
+            self.resume(after)
+
+    def resume(self, after: Any) -> "LeadQuery":
+        """
+        Continúa tras la clave `after` (la de un cursor ya decodificado).
+        """
+        if (isinstance(after, list) and len(after) == 2) != (self.order_by != KEYSET_COLUMN):
+            raise ValueError("El cursor no corresponde al orden pedido.")
+        self.after = after
+        return self
+
+    def fingerprint(self) -> str:
+        """
+        Huella de los filtros y el orden: lo que decide qué filas van en cada
+        página (la proyección y el límite no).
+        """
+        parts = [sorted(self.grades), sorted(self.stages), self.score_min, self.score_max,
+                 self.loaded_from, self.loaded_to, self.order_by, self.descending]
+        body = json.dumps(parts, default=str, separators=(",", ":"))
+        return hashlib.sha256(body.encode("utf-8")).hexdigest()[:16]
+
+    def resume_from(self, cursor: str) -> "LeadQuery":
+        """
+        Decodifica un cursor de esta misma consulta y continúa tras él.
+        Lanza ValueError si el cursor es de otros filtros u otro orden.
+        """
+        return self.resume(decode_cursor(cursor, scope=self.fingerprint()))
+
+    def _after_value_is_null(self) -> bool:
+        return self.order_by != KEYSET_COLUMN and self.after is not None and self.after[0] is None
+
+    def shape(self, page: bool) -> tuple:
+        """
+        Parte estructural de la consulta: lo que cambia el SQL, no los valores.
+        """
+        return ("query", _in_slots(len(self.grades)), _in_slots(len(self.stages)),
+                self.score_min is not None, self.score_max is not None,
+                self.loaded_from is not None, self.loaded_to is not None,
+                self.columns, self.order_by, self.descending, self.limit is not None,
+                self.after is not None, self._after_value_is_null(), page)
+
+    def params(self) -> dict:
+        """
+        Valores enlazados de la consulta.
+        """
+        params = {"score_min": self.score_min, "score_max": self.score_max,
+                  "loaded_from": self.loaded_from, "loaded_to": self.loaded_to, "limit": self.limit}
+        for prefix, values in (("grade", self.grades), ("stage", self.stages)):
+            for i in range(_in_slots(len(values))):
+                params[f"{prefix}_{i}"] = values[min(i, len(values) - 1)]
+        if self.after is not None:
+            if self.order_by == KEYSET_COLUMN:
+                params["after_key"] = self.after
+            else:
+                params["after_value"], params["after_key"] = self.after
+        return params
+
+    def compile(self, schema: TableSchema, page: bool) -> "CompiledQuery":
+        """
+        Devuelve la sentencia de esta forma de consulta, compilándola solo la
+        primera vez para el esquema actual.
+        """
+        if (self.loaded_from is not None or self.loaded_to is not None) and not schema.has_column(LEADS_DATE_COLUMN):
+            raise ValueError(f"LEADS_FINAL no tiene la columna de fecha de carga {LEADS_DATE_COLUMN} "
+                             "(configura LEADS_DATE_COLUMN); no se puede filtrar por fecha.")
+        return schema.statement(self.shape(page), lambda s: CompiledQuery(s, self, page))
+
+
+class CompiledQuery:
+    """
+    SQL con parámetros enlazados y mapeador de filas de una forma de consulta.
+
+    Expone `columns` y `to_dict` como `TableSchema`, así que sirve para
+    `leads_reader.to_ndjson`/`to_csv`.
+    """
+
+    __slots__ = ("sql", "columns", "to_dict", "order_index", "key_index")
+
+    def __init__(self, schema: TableSchema, query: LeadQuery, page: bool):
+        available = set(schema.columns) | {SCORE_COLUMN}
+        columns = query.columns or schema.columns
+        unknown = [name for name in (*columns, query.order_by) if name not in available]
+        if unknown:
+            raise ValueError(f"Columnas desconocidas: {', '.join(unknown)}")
+
+        # Con paginación, la columna de orden y la clave se añaden al final si
+        # no se proyectan (el mapeador y ColumnarResult ignoran las sobrantes)
+        selected = list(columns)
+        if page:
+            selected += [name for name in (query.order_by, KEYSET_COLUMN) if name not in selected]
+        self.columns = tuple(columns)
+        self.to_dict = compile_row_mapper(self.columns)
+        self.order_index = selected.index(query.order_by) if page else None
+        self.key_index = selected.index(KEYSET_COLUMN) if page else None
+        self.sql = self._build(query, selected)
+
+    @staticmethod
+    def _build(query: LeadQuery, selected: Sequence[str]) -> str:
+        def expr(name):
+            return SCORE_SQL if name == SCORE_COLUMN else quote_identifier(name)
+
+        projection = ", ".join(
+            f"{SCORE_SQL} AS {quote_identifier(SCORE_COLUMN)}" if name == SCORE_COLUMN else quote_identifier(name)
+            for name in selected
+        )
+        where = []
+        for column, prefix, values in ((GRADE_COLUMN, "grade", query.grades), (STAGE_COLUMN, "stage", query.stages)):
+            if values:
+                slots = ", ".join(f"%({prefix}_{i})s" for i in range(_in_slots(len(values))))
+                where.append(f"{quote_identifier(column)} IN ({slots})")
+        if query.score_min is not None:
+            where.append(f"{SCORE_SQL} >= %(score_min)s")
+        if query.score_max is not None:
+            where.append(f"{SCORE_SQL} <= %(score_max)s")
+        if query.loaded_from is not None:
+            where.append(f"{quote_identifier(LEADS_DATE_COLUMN)} >= %(loaded_from)s")
+        if query.loaded_to is not None:
+            where.append(f"{quote_identifier(LEADS_DATE_COLUMN)} < %(loaded_to)s")
+
+        key = quote_identifier(KEYSET_COLUMN)
+        direction = "DESC" if query.descending else "ASC"
+        if query.order_by == KEYSET_COLUMN:
+            if query.after is not None:
+                where.append(f"{key} {'<' if query.descending else '>'} %(after_key)s")
+            order = f"{key} {direction}"
+        else:
+            column = expr(query.order_by)
+            if query.after is not None:
+                if query._after_value_is_null():
+                    where.append(f"({column} IS NULL AND {key} > %(after_key)s)")
+                else:
+                    op = "<" if query.descending else ">"
+                    where.append(f"({column} {op} %(after_value)s"
+                                 f" OR ({column} = %(after_value)s AND {key} > %(after_key)s)"
+                                 f" OR {column} IS NULL)")
+            order = f"{column} {direction} NULLS LAST, {key} ASC"
+
+        sql = f"SELECT {projection} FROM {LEADS_TABLE}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY {order}"
+        if query.limit is not None:
+            sql += " LIMIT %(limit)s"
+        return sql
+
+    def cursor_for(self, row: tuple, query: LeadQuery) -> str:
+        """
+        Cursor de la página siguiente a partir de la última fila devuelta.
+        """
+        if query.order_by == KEYSET_COLUMN:
+            return encode_cursor(row[self.key_index], scope=query.fingerprint())
+        return encode_cursor([row[self.order_index], row[self.key_index]], scope=query.fingerprint())
+
+
+def prepare(conn, query: LeadQuery, page: bool) -> CompiledQuery:
+    """
+    Compila (o recupera) la sentencia de `query`. Lanza ValueError si pide
+    columnas desconocidas; útil para validar antes de empezar un streaming.
+    """
+    cursor = conn.cursor()
+    try:
+        return query.compile(get_schema(cursor), page)
+    finally:
+        cursor.close()
+
+
+def fetch_query_page(conn, query: LeadQuery):
+    """
+    Devuelve (consulta compilada, filas, siguiente cursor) de una página de
+    `query.limit` filas. El cursor es None cuando no quedan más filas.
+    """
+    cursor = conn.cursor()
+    try:
+        compiled = query.compile(get_schema(cursor), page=True)
+        cursor.execute(compiled.sql, query.params())
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    next_cursor = None
+    if rows and len(rows) == query.limit:
+        next_cursor = compiled.cursor_for(rows[-1], query)
+    return compiled, rows, next_cursor
+
+
+def iter_query_batches(conn, query: LeadQuery, batch_size: int = STREAM_BATCH_SIZE) -> Iterator:
+    """
+    Como `leads_reader.iter_batches`, pero con los filtros de `query`:
+    devuelve primero la consulta compilada y después lotes de filas.
+    """
+    cursor = conn.cursor()
+    try:
+        compiled = query.compile(get_schema(cursor), page=False)
+        cursor.execute(compiled.sql, query.params())
+        yield compiled
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
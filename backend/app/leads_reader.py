@@ -0,0 +1,167 @@
+"""
+Lectura paginada y en streaming de LEADS_FINAL.
+
+La paginación es por keyset sobre "Lead_Number": cada página pide las filas
+con clave mayor que la última devuelta, de modo que el coste no crece con el
+número de página como con OFFSET. El cursor que ve el cliente es opaco
+(base64 de la última clave y, en consultas filtradas, de una huella de sus
+filtros y orden).
+"""
+import base64
+import csv
+import io
+import json
+import os
+from typing import Any, Iterator, List, Optional
+
+from .schema_cache import TableSchema, schema_cache
+
+LEADS_TABLE = "LEADS_DB.PUBLIC.LEADS_FINAL"
+KEYSET_COLUMN = "Lead_Number"
+STREAM_BATCH_SIZE = int(os.getenv("LEADS_STREAM_BATCH_SIZE", 1000))
+
+
+def encode_cursor(last_key: Any, scope: Optional[str] = None) -> str:
+    """
+    Codifica la última clave devuelta como cursor opaco. `scope` identifica
+    la consulta (filtros y orden) para la que vale el cursor.
+    """
+    body = {"after": last_key}
+    if scope is not None:
+        body["q"] = scope
+    payload = json.dumps(body, default=str).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, scope: Optional[str] = None) -> Any:
+    """
+    Devuelve la clave a partir de la cual continuar. Lanza ValueError si el
+    cursor no es válido o se emitió para otra consulta (`scope`).
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        body = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        after = body["after"]
+    except Exception:
+        raise ValueError("Cursor de paginación inválido.")
+    if body.get("q") != scope:
+        raise ValueError("El cursor se emitió para otros filtros u otro orden.")
+    return after
+
+
+def fetch_all_columns(cursor) -> List[str]:
+    """
+    Devuelve todas las columnas de LEADS_FINAL, incluidas las dos primeras
+    columnas técnicas.
+    """
+    cursor.execute("""
+        SELECT COLUMN_NAME
+        FROM LEADS_DB.INFORMATION_SCHEMA.COLUMNS
+        WHERE TABLE_NAME = 'LEADS_FINAL'
+        AND TABLE_SCHEMA = 'PUBLIC'
+        ORDER BY ORDINAL_POSITION
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+
+def fetch_columns(cursor) -> List[str]:
+    """
+    Devuelve las columnas de LEADS_FINAL que se exponen en la API (sin las
+    dos primeras columnas técnicas).
+    """
+    return fetch_all_columns(cursor)[2:]
+
+
+def get_schema(cursor) -> TableSchema:
+    """
+    Devuelve el esquema cacheado de LEADS_FINAL (consulta INFORMATION_SCHEMA
+    solo si no está en caché o ha caducado). Las dos columnas técnicas
+    quedan en `hidden`: se pueden filtrar pero no se proyectan.
+    """
+    def _load():
+        names = fetch_all_columns(cursor)
+        return TableSchema(LEADS_TABLE, names[2:], hidden=names[:2])
+
+    return schema_cache.get(LEADS_TABLE, _load)
+
+
+def keyset_sql(schema: TableSchema, after: bool, limit: bool) -> str:
+    """
+    Devuelve la consulta por keyset con parámetros enlazados, precompilada
+    en el esquema para cada combinación de `after`/`limit`.
+    """
+    return schema.statement(("keyset", after, limit), lambda s: _build_keyset_sql(s, after, limit))
+
+
+def _build_keyset_sql(schema: TableSchema, after: bool, limit: bool) -> str:
+    sql = f'SELECT {schema.projection_sql} FROM {LEADS_TABLE}'
+    if after:
+        sql += f' WHERE "{KEYSET_COLUMN}" > %(after)s'
+    sql += f' ORDER BY "{KEYSET_COLUMN}"'
+    if limit:
+        sql += ' LIMIT %(limit)s'
+    return sql
+
+
+def fetch_page(conn, limit: int, after: Any = None):
+    """
+    Devuelve (esquema, filas, siguiente cursor). El cursor es None cuando
+    no quedan más filas.
+    """
+    cursor = conn.cursor()
+    try:
+        schema = get_schema(cursor)
+        cursor.execute(keyset_sql(schema, after is not None, True), {"after": after, "limit": limit})
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    next_cursor = None
+    if rows and len(rows) == limit:
+        next_cursor = encode_cursor(rows[-1][schema.index(KEYSET_COLUMN)])
+    return schema, rows, next_cursor
+
+
+def iter_batches(conn, after: Any = None, limit: Optional[int] = None,
+                 batch_size: int = STREAM_BATCH_SIZE) -> Iterator[tuple]:
+    """
+    Recorre el resultado con `fetchmany` y devuelve primero el esquema y
+    después lotes de filas, sin cargar el resultado completo.
+    """
+    cursor = conn.cursor()
+    try:
+        schema = get_schema(cursor)
+        cursor.execute(keyset_sql(schema, after is not None, limit is not None), {"after": after, "limit": limit})
+        yield schema
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+
+def to_ndjson(batches: Iterator) -> Iterator[str]:
+    """
+    Serializa los lotes como JSON lines (un objeto por fila).
+    """
+    to_dict = next(batches).to_dict
+    for rows in batches:
+        yield "".join(json.dumps(to_dict(row), default=str) + "\n" for row in rows)
+
+
+def to_csv(batches: Iterator) -> Iterator[str]:
+    """
+    Serializa los lotes como CSV con cabecera.
+    """
+    schema = next(batches)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(schema.columns)
+    yield buf.getvalue()
+    for rows in batches:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows(rows)
+        yield buf.getvalue()
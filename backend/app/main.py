@@ -1,7 +1,8 @@
-from fastapi import FastAPI, File, UploadFile, Response, Query, HTTPException
+from fastapi import FastAPI, File, UploadFile, Response, Query, HTTPException, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Optional
+from datetime import datetime
 from deprecated import deprecated
 
 app = FastAPI()
@@ -21,8 +22,13 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
 
+# Tiempos por petición: Server-Timing, log JSON y /metrics (ver instrumentation.py)
+from .instrumentation import InstrumentationMiddleware
+app.add_middleware(InstrumentationMiddleware)
+
 @app.get("/")
 def root():
     return {"message": "Hello from Lambda"}
@@ -34,86 +40,149 @@ def healthcheck():
 @deprecated(reason="Usa la función `/generate-presigned-url` en su lugar.")
 @app.post("/upload")
 async def upload_csv(file: UploadFile = File(...)):
+    from .concurrency import run_io
     from .upload_s3 import upload_file
     content = await file.read()
-    result = upload_file(file.filename, content)
+    result = await run_io(upload_file, file.filename, content)
     return {"status": "File uploaded successfully", "filename": result}
 
-@app.post("/clean-upload-and-generate-url")
-async def clean_upload_and_generate_url(file: UploadFile = File(...)):
-    import tempfile, os
-    import pandas as pd
-    import boto3
-    import chardet
+def _clean_upload_and_presign(fileobj, filename: str, score: bool, output: str, dedup: bool,
+                              bad_rows: str = "skip"):
+    """
+    Parte bloqueante de /clean-upload-and-generate-url (se ejecuta en el
+    grupo de hilos de CPU).
+    """
     import logging
-    from fastapi import HTTPException
-    from .upload_s3 import upload_file  # función que sube a S3 y devuelve la key
-
-    BUCKET_NAME = "leads-raw"
-    s3_client = boto3.client("s3")
-
+    from .aggregates import FileAggregate, record
+    from .cleaning import clean_csv_to_s3
+    from .parquet_stage import clean_csv_to_parquet_s3
+    from .instrumentation import span
+    from .prevalidate import prevalidate
+    from .upload_s3 import bucket as BUCKET_NAME, get_s3
+
+    # Cliente compartido del proceso (crear uno por petición cuesta ~100 ms)
+    s3_client = get_s3()
+
+    # 0. Pre-pasada: encoding (rápido si es UTF-8) y filas defectuosas
+    report = prevalidate(fileobj)
+
+    # 1. Limpiar en streaming desde el archivo temporal de la subida y subir a S3
+    #    (CSV por partes, o Parquet particionado por fecha de ingesta)
+    aggregate = FileAggregate()
+    if output == "parquet":
+        stats = clean_csv_to_parquet_s3(fileobj, filename, score=score, report=report, bad_rows=bad_rows,
+                                        aggregate=aggregate, dedup=dedup)
+        cleaned_filename = stats["s3_key"].rsplit("/", 1)[-1]
+    else:
+        cleaned_filename = filename.replace(".csv", "_cleaned.csv")
+        stats = clean_csv_to_s3(fileobj, cleaned_filename, score=score, dedup=dedup,
+                                report=report, bad_rows=bad_rows, aggregate=aggregate)
+    # Recuentos del archivo limpio publicado (ver aggregates.py)
+    record("cleaned", stats["s3_key"], aggregate)
+
+    # 2. (Opcional) Generar URL de descarga firmada
     try:
-        # 1. Guardar contenido temporalmente
-        content = await file.read()
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp_file:
-            tmp_file.write(content)
-            tmp_file_path = tmp_file.name
-
-        # 2. Detectar encoding automáticamente
-        with open(tmp_file_path, 'rb') as f:
-            raw_data = f.read()
-            result = chardet.detect(raw_data)
-            detected_encoding = result['encoding'] or 'latin1'
-            logging.info(f"Encoding detectado: {detected_encoding}")
-
-        # 3. Leer y limpiar CSV con pandas
-        try:
-            df = pd.read_csv(tmp_file_path, encoding=detected_encoding, errors="replace")
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Error leyendo el CSV: {str(e)}")
-
-        df.fillna("", inplace=True)
-        df.columns = [col.strip().replace(" ", "_") for col in df.columns]
-
-        # 4. Guardar archivo limpio
-        cleaned_file_path = tmp_file_path.replace(".csv", "_cleaned.csv")
-        df.to_csv(cleaned_file_path, index=False)
-
-        # 5. Subir a S3
-        with open(cleaned_file_path, "rb") as cleaned_file:
-            cleaned_content = cleaned_file.read()
-            cleaned_filename = file.filename.replace(".csv", "_cleaned.csv")
-            s3_key = upload_file(cleaned_filename, cleaned_content)
-
-        # 6. (Opcional) Generar URL de descarga firmada
-        try:
+        with span("s3.presign"):
             presigned_url = s3_client.generate_presigned_url(
                 'get_object',
-                Params={'Bucket': BUCKET_NAME, 'Key': s3_key},
+                Params={'Bucket': BUCKET_NAME, 'Key': stats["s3_key"]},
                 ExpiresIn=3600
             )
-        except Exception as e:
-            logging.warning(f"No se pudo generar URL firmada: {e}")
-            presigned_url = None
+    except Exception as e:
+        logging.warning(f"No se pudo generar URL firmada: {e}")
+        presigned_url = None
+    return stats, cleaned_filename, presigned_url, report
 
-        return {
-            "status": "Archivo limpiado y subido a S3",
-            "filename": cleaned_filename,
-            "s3_key": s3_key,
-            "download_url": presigned_url
+@app.post("/clean-upload-and-generate-url")
+async def clean_upload_and_generate_url(file: UploadFile = File(...), score: bool = False,
+                                        output: str = Query("csv", pattern="^(csv|parquet)$"),
+                                        dedup: bool = False,
+                                        bad_rows: str = Query("skip", pattern="^(skip|repair)$"),
+                                        background: bool = False):
+    from .concurrency import run_cpu
+
+    # Archivos grandes: trabajo en segundo plano (ver /ingestions)
+    if background:
+        return await _submit_ingestion(file, score=score, dedup=dedup, bad_rows=bad_rows, output=output,
+                                       load=False)
+
+    # Limpieza, subida y firma son bloqueantes: fuera del event loop
+    try:
+        await file.seek(0)
+        stats, cleaned_filename, presigned_url, report = await run_cpu(
+            _clean_upload_and_presign, file.file, file.filename, score, output, dedup, bad_rows
+        )
+    except (ValueError, UnicodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Error leyendo el CSV: {str(e)}")
+    s3_key = stats["s3_key"]
+
+    return {
+        "status": "Archivo limpiado y subido a S3",
+        "filename": cleaned_filename,
+        "s3_key": s3_key,
+        "download_url": presigned_url,
+        "rows": stats["rows"],
+        "throughput_mb_s": stats.get("mb_per_s", stats.get("write_mb_per_s")),
+        "compression_ratio": stats.get("compression_ratio"),
+        "rows_skipped": stats.get("rows_skipped"),
+        "bytes_saved": stats.get("bytes_saved"),
+        "validation": {
+            "encoding": report["encoding"],
+            "utf8_fast_path": report["utf8_fast_path"],
+            "header_issues": report["header_issues"],
+            "bad_row_count": report["bad_row_count"],
+            "bad_rows": report["bad_rows"][:20],
+            "bad_rows_mode": bad_rows,
+            "seconds": report["seconds"]
         }
+    }
 
-    finally:
-        # 7. Limpieza de archivos temporales
-        if os.path.exists(tmp_file_path):
-            os.remove(tmp_file_path)
-        if 'cleaned_file_path' in locals() and os.path.exists(cleaned_file_path):
-            os.remove(cleaned_file_path)
+@app.post("/bulk-upload")
+def bulk_upload(files: List[UploadFile] = File(...), prefix: str = "", snowpipe: bool = False):
+    """
+    Sube varios archivos de leads (o .zip con varios CSV) a S3 en paralelo.
+    Con `snowpipe=true` los archivos subidos se registran en Snowpipe en
+    llamadas `insertFiles` agrupadas.
+    """
+    import time, zipfile
+    from contextlib import ExitStack
+    from .upload_s3 import upload_files
+
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        sources = []
+        for file in files:
+            if file.filename.lower().endswith(".zip"):
+                try:
+                    archive = stack.enter_context(zipfile.ZipFile(file.file))
+                except zipfile.BadZipFile:
+                    raise HTTPException(status_code=400, detail=f"Zip inválido: {file.filename}")
+                for member in archive.infolist():
+                    if not member.is_dir():
+                        sources.append((member.filename, stack.enter_context(archive.open(member))))
+            else:
+                file.file.seek(0)
+                sources.append((file.filename, file.file))
+        results = upload_files(sources, prefix)
+
+    snowpipe_status = None
+    if snowpipe:
+        from .snowflake_client import notify_snowpipe
+        snowpipe_status = notify_snowpipe(r["key"] for r in results if "error" not in r)
+
+    return {
+        "status": "Archivos subidos a S3",
+        "count": len(results),
+        "failed": sum(1 for r in results if "error" in r),
+        "seconds": round(time.perf_counter() - start, 3),
+        "files": results,
+        "snowpipe": snowpipe_status
+    }
 
 @deprecated(reason="Usa la función `/generate-presigned-url` en su lugar.")
 @app.post("/process-s3-file")
 async def process_s3_file(payload: dict):
-    from .snowflake_client import upload_to_snowflake_snowpipe_s3
+    from .snowflake_client import upload_to_snowflake_snowpipe_s3_async
     import logging
 
     s3_key = payload.get("s3_key")
@@ -121,71 +190,179 @@ async def process_s3_file(payload: dict):
         raise HTTPException(status_code=400, detail="Missing s3_key in payload")
 
     logging.info(f"Processing file in S3: {s3_key}")
-    result = upload_to_snowflake_snowpipe_s3(s3_key)
+    result = await upload_to_snowflake_snowpipe_s3_async(s3_key)
     return {"status": "processed", "result": result}
 
 
 @app.get("/leads")
-def get_leads(limit: int = 10):
-    from .snowflake_client import get_connection
-    conn = get_connection()
-    cursor = conn.cursor()
+def get_leads(limit: Optional[int] = Query(None, ge=1), cursor: Optional[str] = None,
+              format: str = Query("json", pattern="^(json|ndjson|csv)$"), accept: Optional[str] = Header(None)):
+    """
+    Devuelve leads de LEADS_FINAL paginados por keyset.
+
+    - `format=json`: una página de `limit` filas (10 por defecto); el cursor de la siguiente
+      página va en la cabecera `X-Next-Cursor`. Con
+      `Accept: application/vnd.apache.arrow.stream` la página se sirve como Arrow IPC.
+    - `format=ndjson|csv`: streaming por lotes (`fetchmany`) desde el cursor;
+      sin `limit` recorre toda la tabla con memoria constante.
+    """
+    from fastapi.responses import StreamingResponse
+    from .columnar import ColumnarResult, render
+    from .snowflake_client import connection
+    from .leads_reader import decode_cursor, fetch_page, iter_batches, to_csv, to_ndjson
+
     try:
-        cursor.execute("""
-            SELECT COLUMN_NAME 
-            FROM LEADS_DB.INFORMATION_SCHEMA.COLUMNS 
-            WHERE TABLE_NAME = 'LEADS_FINAL'
-            AND TABLE_SCHEMA = 'PUBLIC'
-            ORDER BY ORDINAL_POSITION
-        """)
-        columns = [f'"{row[0]}"' for row in cursor.fetchall()][2:]
-        columns_sql = ", ".join(columns)
-        cursor.execute(f"""SELECT {columns_sql} FROM LEADS_DB.PUBLIC.LEADS_FINAL LIMIT {limit}""")
-        rows = cursor.fetchall()
-        clean_columns = [col.replace('"', '') for col in columns]
-        return [dict(zip(clean_columns, row)) for row in rows]
-    finally:
-        cursor.close()
-        conn.close()
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "json":
+        with connection() as conn:
+            schema, rows, next_cursor = fetch_page(conn, limit or 10, after)
+        page = ColumnarResult.from_batches(schema.columns, [rows])
+        return render(page, accept, {"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+    def _stream():
+        with connection() as conn:
+            batches = iter_batches(conn, after, limit)
+            yield from (to_ndjson(batches) if format == "ndjson" else to_csv(batches))
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(_stream(), media_type=media_type)
+
+
+@app.get("/leads/query")
+def query_leads(grade: Optional[List[str]] = Query(None), stage: Optional[List[str]] = Query(None),
+                score_min: Optional[float] = None, score_max: Optional[float] = None,
+                loaded_from: Optional[datetime] = None, loaded_to: Optional[datetime] = None,
+                columns: Optional[List[str]] = Query(None), order_by: str = "Lead_Number", desc: bool = False,
+                limit: Optional[int] = Query(None, ge=1, le=10000), cursor: Optional[str] = None,
+                format: str = Query("json", pattern="^(json|ndjson|csv)$"), accept: Optional[str] = Header(None)):
+    """
+    Leads de LEADS_FINAL filtrados en Snowflake (no en Python).
+
+    - Filtros: `grade` y `stage` (repetibles), `score_min`/`score_max` sobre
+      SCORING_UDF y `loaded_from`/`loaded_to` sobre la fecha de carga.
+    - `columns` (repetible o separado por comas) limita la proyección; `score`
+      añade la columna calculada. `order_by` + `desc` fijan el orden.
+    - `format=json`: página de `limit` filas (10 por defecto) con el cursor
+      siguiente en `X-Next-Cursor`; `ndjson|csv`: streaming por lotes.
+    """
+    from fastapi.responses import StreamingResponse
+    from .columnar import ColumnarResult, render
+    from .snowflake_client import connection
+    from .leads_reader import to_csv, to_ndjson
+    from .leads_query import LeadQuery, fetch_query_page, iter_query_batches, prepare
+
+    try:
+        query = LeadQuery(
+            grades=grade, stages=stage, score_min=score_min, score_max=score_max,
+            loaded_from=loaded_from, loaded_to=loaded_to,
+            columns=[name.strip() for value in columns or () for name in value.split(",") if name.strip()],
+            order_by=order_by, descending=desc,
+            limit=(limit or 10) if format == "json" else limit,
+        )
+        if cursor:
+            query.resume_from(cursor)
+        if format == "json":
+            with connection() as conn:
+                compiled, rows, next_cursor = fetch_query_page(conn, query)
+        else:
+            with connection() as conn:
+                prepare(conn, query, page=False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if format == "json":
+        page = ColumnarResult.from_batches(compiled.columns, [rows])
+        return render(page, accept, {"X-Next-Cursor": next_cursor} if next_cursor else None)
+
+    def _stream():
+        with connection() as conn:
+            batches = iter_query_batches(conn, query)
+            yield from (to_ndjson(batches) if format == "ndjson" else to_csv(batches))
+
+    media_type = "application/x-ndjson" if format == "ndjson" else "text/csv"
+    return StreamingResponse(_stream(), media_type=media_type)
 
 
 @deprecated(reason="Usa la función `/generate-presigned-url` en su lugar.")
 @app.post("/upload-and-load")
-async def upload_and_load(file: UploadFile = File(...)):
-    import tempfile, os
-    import pandas as pd
-    from .upload_s3 import upload_file
-    from .snowflake_client import upload_to_snowflake
+async def upload_and_load(file: UploadFile = File(...), dedup: bool = True, background: bool = False):
+    from .concurrency import run_cpu
+
+    if background:
+        return await _submit_ingestion(file, dedup=dedup, load=True)
+    await file.seek(0)
+    return await run_cpu(_clean_and_load, file.file, file.filename, dedup)
 
-    content = await file.read()
-    with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp_file:
-        tmp_file.write(content)
-        tmp_file_path = tmp_file.name
 
-    df = pd.read_csv(tmp_file_path, encoding="latin1")
-    df.fillna("", inplace=True)
-    df.columns = [col.strip().replace(" ", "_") for col in df.columns]
-    cleaned_file_path = tmp_file_path.replace(".csv", "_cleaned.csv")
-    df.to_csv(cleaned_file_path, index=False)
+def _clean_and_load(fileobj, filename: str, dedup: bool) -> dict:
+    """
+    Parte bloqueante de /upload-and-load: limpia (solo filas nuevas o
+    cambiadas si `dedup`), sube el original a S3 por partes desde el
+    temporal de la subida y carga en Snowflake.
+    """
+    import tempfile, os
+    from .aggregates import FileAggregate, record
+    from .cleaning import detect_encoding, iter_cleaned_csv
+    from .dedup import commit_run, get_index
+    from .upload_s3 import PART_SIZE, upload_stream
+    from .snowflake_client import upload_to_snowflake
 
-    upload_file(file.filename, content)
-    result = upload_to_snowflake(cleaned_file_path, file.filename)
+    # Solo se envían a staging las filas nuevas o cambiadas (índice de hashes)
+    run = get_index().begin() if dedup else None
+    stats = {"rows": 0}
+    aggregate = FileAggregate()
+    cleaned_file_path = None
+    try:
+        with tempfile.NamedTemporaryFile(delete=False, suffix="_cleaned.csv") as tmp_file:
+            cleaned_file_path = tmp_file.name
+            try:
+                encoding = detect_encoding(fileobj)
+                for data in iter_cleaned_csv(fileobj, encoding, stats=stats,
+                                             row_filter=run.filter if run else None, aggregate=aggregate):
+                    tmp_file.write(data)
+            except (ValueError, UnicodeError) as e:
+                raise HTTPException(status_code=400, detail=f"Error leyendo el CSV: {str(e)}")
+
+        # El original se sube por bloques desde el temporal de la subida, sin leerlo entero
+        fileobj.seek(0)
+        upload_stream(filename, iter(lambda: fileobj.read(PART_SIZE), b""))
+        if stats["rows"]:
+            result = upload_to_snowflake(cleaned_file_path, filename)
+        else:
+            result = {"status": "sin cambios: no se cargó nada en Snowflake"}
+    finally:
+        # También si la limpieza falla con un error inesperado (OSError, ParserError...)
+        if cleaned_file_path is not None:
+            os.remove(cleaned_file_path)
 
-    os.remove(tmp_file_path)
-    os.remove(cleaned_file_path)
+    if run is not None and result.get("status") != "error":
+        commit_run(run)
+    if stats["rows"] and result.get("status") != "error":
+        record("loaded", result["filename"], aggregate)
 
-    return {"status": "File processed and loaded to Snowflake", "filename": file.filename}
+    return {
+        "status": "File processed and loaded to Snowflake",
+        "filename": filename,
+        "rows_loaded": stats["rows"],
+        "rows_skipped": run.stats["rows_skipped"] if run else 0,
+        "bytes_saved": run.stats["bytes_saved"] if run else 0,
+        "snowflake_result": result
+    }
 
 
 @deprecated(reason="Usa la función `/generate-presigned-url` en su lugar.")
 @app.post("/upload-and-load-snowpipe")
 async def upload_and_load_snowpipe(file: UploadFile = File(...)):
+    from .concurrency import run_io
     from .upload_s3 import upload_file
-    from .snowflake_client import upload_to_snowflake_snowpipe_s3
+    from .snowflake_client import upload_to_snowflake_snowpipe_s3_async
 
     content = await file.read()
-    s3_filename = upload_file(file.filename, content)
-    result = upload_to_snowflake_snowpipe_s3(s3_filename)
+    s3_filename = await run_io(upload_file, file.filename, content)
+    result = await upload_to_snowflake_snowpipe_s3_async(s3_filename)
 
     return {
         "status": "Archivo subido a S3 y Snowpipe activado",
@@ -193,26 +370,238 @@ async def upload_and_load_snowpipe(file: UploadFile = File(...)):
         "snowpipe_result": result
     }
 
-@app.get("/download")
-def download_file():
-    from fastapi import Response
-    from .snowflake_client import get_connection
-    conn = get_connection()
-    cursor = conn.cursor()
-    sql = """
-    SELECT $1
-    FROM @leads_internal_stage/tmprqsaeu0j_cleaned.json/tmprqsaeu0j_cleaned.json.gz
-    (FILE_FORMAT => 'json_as_variant')
-    LIMIT 100;
-    """
-    cursor.execute(sql)
-    rows = cursor.fetchall()
-    content = "\n".join([str(row[0]) for row in rows])
-    return Response(
-        content=content,
-        media_type="application/json",
-        headers={"Content-Disposition": "attachment; filename=prospectos.json"}
-    )
+class ExportRequest(BaseModel):
+    table: str = "LEADS_FINAL"
+    format: str = "ndjson"
+    mode: str = "stream"
+    columns: Optional[List[str]] = None
+    filters: Optional[dict] = None
+    chunk_rows: Optional[int] = None
+
+@app.post("/exports", status_code=202)
+def create_export(request: ExportRequest):
+    """
+    Lanza una exportación a S3 (NDJSON gzip o Parquet) y devuelve su ID.
+    El progreso y las URLs firmadas de cada trozo se consultan en
+    `GET /exports/{job_id}`.
+    """
+    from .exports import EXPORT_CHUNK_ROWS, describe, start_export
+    try:
+        job = start_export(request.table, request.format, request.mode, request.columns,
+                           request.filters, request.chunk_rows or EXPORT_CHUNK_ROWS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**describe(job), "status_url": f"/exports/{job.job_id}"}
+
+@app.get("/exports/{job_id}")
+def get_export(job_id: str):
+    from .exports import describe, get_job
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    return describe(job)
+
+@app.post("/exports/{job_id}/resume", status_code=202)
+def resume_export(job_id: str):
+    from .exports import describe, resume_export as resume
+    try:
+        return describe(resume(job_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Exportación no encontrada")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+async def _submit_ingestion(file: UploadFile, **options):
+    """
+    Sube el archivo a S3 y encola su ingesta; responde 202 sin esperar a
+    la limpieza ni a la carga.
+    """
+    from fastapi.responses import JSONResponse
+    from .concurrency import run_io
+    from .ingestion import describe, submit
+
+    await file.seek(0)
+    try:
+        job = await run_io(submit, file.file, file.filename, **options)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(status_code=202, content={
+        **describe(job), "events_url": f"/ingestions/{job.job_id}/events"
+    })
+
+@app.post("/ingestions", status_code=202)
+async def create_ingestion(file: UploadFile = File(...), score: bool = False, dedup: bool = True,
+                           bad_rows: str = Query("skip", pattern="^(skip|repair)$"),
+                           output: str = Query("csv", pattern="^(csv|parquet)$"), load: bool = True):
+    """
+    Ingesta en segundo plano: limpieza, PUT al stage y COPY INTO como
+    etapas con reintentos. El estado se consulta en `GET /ingestions/{job_id}`
+    o se sigue en `GET /ingestions/{job_id}/events`.
+    """
+    return await _submit_ingestion(file, score=score, dedup=dedup, bad_rows=bad_rows, output=output, load=load)
+
+@app.get("/ingestions/{job_id}")
+def get_ingestion(job_id: str):
+    from .ingestion import describe, get_job
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingesta no encontrada")
+    return describe(job)
+
+@app.post("/ingestions/{job_id}/retry", status_code=202)
+def retry_ingestion(job_id: str):
+    from .ingestion import describe, retry
+    try:
+        return describe(retry(job_id))
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Ingesta no encontrada")
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/ingestions/{job_id}/events")
+async def ingestion_events(job_id: str, interval: float = Query(1.0, gt=0, le=30)):
+    """
+    Server-Sent Events con el estado del trabajo cada vez que cambia, hasta
+    que termina. Detrás de API Gateway (sin streaming) usa el sondeo de
+    `GET /ingestions/{job_id}`.
+    """
+    import json
+    import anyio
+    from fastapi.responses import StreamingResponse
+    from .concurrency import run_io
+    from .ingestion import TERMINAL, describe, get_job
+
+    job = await run_io(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingesta no encontrada")
+
+    async def _events():
+        last = None
+        while True:
+            current = await run_io(get_job, job_id)
+            if current.updated_at != last:
+                last = current.updated_at
+                yield f"event: {current.status}\ndata: {json.dumps(describe(current), default=str)}\n\n"
+            if current.status in TERMINAL:
+                return
+            await anyio.sleep(interval)
+
+    return StreamingResponse(_events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+class MultipartUploadRequest(BaseModel):
+    filename: str
+    content_type: Optional[str] = None
+    size: Optional[int] = None
+
+class PresignPartsRequest(BaseModel):
+    key: str
+    upload_id: str
+    part_numbers: List[int]
+
+class UploadedPart(BaseModel):
+    part_number: int
+    etag: str
+
+class CompleteUploadRequest(BaseModel):
+    key: str
+    upload_id: Optional[str] = None
+    parts: Optional[List[UploadedPart]] = None
+    score: bool = False
+    dedup: bool = True
+    bad_rows: str = "skip"
+    output: str = "csv"
+    load: bool = True
+
+def _upload_filename(job_id: str, key: str) -> str:
+    from .direct_upload import parse_key
+    try:
+        return parse_key(job_id, key)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _s3_error(e) -> HTTPException:
+    # NoSuchUpload, InvalidPart, ...: errores del cliente de la subida
+    return HTTPException(status_code=400, detail=f"S3: {e.response['Error'].get('Code')}")
+
+@app.get("/generate-presigned-url")
+def generate_presigned_url(filename: str, content_type: Optional[str] = None):
+    """
+    URL firmada para subir un archivo con un único PUT directo a S3. Al
+    terminar, `POST complete_url` con `{"key": ...}` lanza la ingesta.
+    """
+    from .direct_upload import presign_put
+    try:
+        result = presign_put(filename, content_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**result, "complete_url": f"/uploads/{result['job_id']}/complete"}
+
+@app.post("/uploads/multipart")
+def initiate_multipart_upload(request: MultipartUploadRequest):
+    """
+    Inicia una subida multipart directa a S3. Con `size` devuelve ya las
+    URLs firmadas de las partes (de `part_size` bytes), que el cliente
+    puede subir en paralelo.
+    """
+    from .direct_upload import initiate
+    try:
+        result = initiate(request.filename, request.content_type, request.size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**result, "complete_url": f"/uploads/{result['job_id']}/complete"}
+
+@app.post("/uploads/{job_id}/parts")
+def presign_upload_parts(job_id: str, request: PresignPartsRequest):
+    from .direct_upload import presign_parts
+    _upload_filename(job_id, request.key)
+    try:
+        return {"parts": presign_parts(request.key, request.upload_id, request.part_numbers)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/uploads/{job_id}/complete", status_code=202)
+def complete_upload(job_id: str, request: CompleteUploadRequest):
+    """
+    Cierra la subida (multipart si trae `upload_id`; si no, comprueba que el
+    PUT llegó) y encola la limpieza y la carga como trabajo de ingesta.
+    """
+    from botocore.exceptions import ClientError
+    from .direct_upload import complete, exists
+    from .ingestion import describe, start_uploaded
+
+    filename = _upload_filename(job_id, request.key)
+    try:
+        if request.upload_id:
+            complete(request.key, request.upload_id, [p.model_dump() for p in request.parts or []])
+        elif not exists(request.key):
+            raise HTTPException(status_code=409, detail="El archivo aún no está en S3")
+        job = start_uploaded(job_id, filename, score=request.score, dedup=request.dedup,
+                             bad_rows=request.bad_rows, output=request.output, load=request.load)
+    except ClientError as e:
+        raise _s3_error(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {**describe(job), "events_url": f"/ingestions/{job.job_id}/events"}
+
+@app.delete("/uploads/{job_id}")
+def abort_upload(job_id: str, key: str, upload_id: str):
+    from botocore.exceptions import ClientError
+    from .direct_upload import abort
+    _upload_filename(job_id, key)
+    try:
+        abort(key, upload_id)
+    except ClientError as e:
+        raise _s3_error(e)
+    return {"status": "aborted", "key": key}
+
+@app.get("/download", status_code=202)
+def download_file(format: str = Query("ndjson", pattern="^(ndjson|parquet)$")):
+    """
+    Exporta LEADS_FINAL completa a S3 en segundo plano (antes devolvía 100
+    filas de un archivo fijo del stage). Ver `/exports`.
+    """
+    return create_export(ExportRequest(format=format))
 
 class LeadScore(BaseModel):
     id: Optional[int]
@@ -221,48 +610,255 @@ class LeadScore(BaseModel):
     lead_stage: Optional[str]
     score: Optional[float]
 
+SCORED_LEAD_COLUMNS = ("id", "activity_score", "lead_grade", "lead_stage", "score")
+
 @app.get("/score-all-leads", response_model=List[LeadScore])
-def score_all_leads():
-    from .snowflake_client import get_connection
+def score_all_leads(limit: int = Query(100, ge=1, le=10000), accept: Optional[str] = Header(None)):
+    """
+    Leads puntuados con SCORING_UDF. El resultado se cachea por parámetros
+    y se invalida cuando llega una carga nueva (ver `result_cache.py`).
+
+    `LeadScore` documenta la forma de cada fila; la respuesta se serializa
+    desde el resultado columnar sin validar fila a fila (JSON o Arrow IPC
+    según `Accept`).
+    """
+    from .columnar import render
+    from .result_cache import result_cache
+    result = result_cache.get_or_compute(f"score-all-leads:limit={limit}", lambda: _query_scored_leads(limit))
+    return render(result, accept)
+
+def _query_scored_leads(limit: int):
+    from .columnar import ColumnarResult
+    from .leads_reader import STREAM_BATCH_SIZE
+    from .snowflake_client import connection
+    # La UDF se evalúa una sola vez por fila en la subconsulta; el filtro
+    # exterior usa su alias
     query = """
-        SELECT 
-            "Lead_Number" AS id,
-            "Asymmetrique_Activity_Score" AS activity_score,
-            "Lead_Grade",
-            "Lead_Stage",
-            SCORING_UDF("Asymmetrique_Activity_Score", "Lead_Grade", "Lead_Stage") AS score
-        FROM leads_final
-        LIMIT 100
-    """
-    conn = get_connection()
-    cursor = conn.cursor()
-    cursor.execute(query)
-    rows = cursor.fetchall()
-    result = []
-    for row in rows:
-        if len(row) != 5 or None in row:
-            continue
-        result.append({
-            "id": row[0],
-            "activity_score": row[1],
-            "lead_grade": row[2],
-            "lead_stage": row[3],
-            "score": row[4]
-        })
+        SELECT id, activity_score, "Lead_Grade", "Lead_Stage", score
+        FROM (
+            SELECT
+                "Lead_Number" AS id,
+                "Asymmetrique_Activity_Score" AS activity_score,
+                "Lead_Grade",
+                "Lead_Stage",
+                SCORING_UDF("Asymmetrique_Activity_Score", "Lead_Grade", "Lead_Stage") AS score
+            FROM leads_final
+            WHERE "Lead_Number" IS NOT NULL
+              AND "Lead_Grade" IS NOT NULL
+              AND "Lead_Stage" IS NOT NULL
+        )
+        WHERE score IS NOT NULL
+        LIMIT %(limit)s
+    """
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute(query, {"limit": limit})
+            result = ColumnarResult(SCORED_LEAD_COLUMNS)
+            while True:
+                rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+                if not rows:
+                    break
+                # Las filas incompletas ya se descartan en Snowflake (el LIMIT cuenta
+                # solo filas completas); esto es solo una salvaguarda para LeadScore
+                result.extend([row for row in rows if len(row) == 5 and None not in row])
+        finally:
+            cursor.close()
     return result
 
 @app.post("/score-lead")
-def score_lead(payload: dict):
-    from .sagemaker_client import call_sagemaker
-    result = call_sagemaker(payload)
+async def score_lead(payload: dict):
+    from .sagemaker_client import call_sagemaker_async
+    result = await call_sagemaker_async(payload)
     return result
 
+def _parse_batch_leads(body: bytes, content_type: str) -> list:
+    """
+    Convierte el cuerpo de /score-leads/batch (CSV, JSON lines o array JSON)
+    en una lista de leads. Las líneas inválidas y los elementos del array que
+    no son objetos se devuelven como excepción para que el lead
+    correspondiente reciba su propia entrada de error.
+    """
+    import csv, io, json
+
+    text = body.decode("utf-8-sig", errors="replace")
+    if "csv" in content_type:
+        reader = csv.DictReader(io.StringIO(text))
+        return [{k: (v if v != "" else None) for k, v in row.items()} for row in reader]
+
+    if "application/json" in content_type and text.lstrip().startswith("["):
+        try:
+            leads = json.loads(text)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"JSON inválido: {e}")
+        return [lead if isinstance(lead, dict) else ValueError("cada lead debe ser un objeto JSON")
+                for lead in leads]
+
+    leads = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            lead = json.loads(line)
+            if not isinstance(lead, dict):
+                raise ValueError("cada línea debe ser un objeto JSON")
+            leads.append(lead)
+        except ValueError as e:
+            leads.append(e)
+    return leads
+
+def _read_scores(body: bytes, content_type: str):
+    """
+    Puntuaciones de /scores: stream IPC de Arrow o JSON (array u objetos
+    por línea) con Lead_Number y la columna de puntuación.
+    """
+    import io
+    import pandas as pd
+    import pyarrow as pa
+    from .columnar import ARROW_STREAM_MEDIA_TYPE
+
+    if ARROW_STREAM_MEDIA_TYPE in content_type:
+        return pa.ipc.open_stream(body).read_all()
+    text = body.decode("utf-8-sig")
+    return pd.read_json(io.StringIO(text), lines=not text.lstrip().startswith("["), dtype=False)
+
+@app.post("/scores")
+async def write_back_scores(request: Request, source: str = "external", score_column: str = "Lead_Score",
+                            chunk_rows: Optional[int] = Query(None, ge=1)):
+    """
+    Guarda en bloque puntuaciones calculadas fuera de Snowflake (Parquet en
+    stage + MERGE por Lead_Number) y devuelve las filas/s de la escritura.
+    """
+    from .concurrency import run_io
+    from .snowflake_client import SCORES_CHUNK_ROWS, write_scores
+
+    try:
+        scores = _read_scores(await request.body(), request.headers.get("content-type", ""))
+        return await run_io(write_scores, scores, source, score_column, chunk_rows or SCORES_CHUNK_ROWS)
+    except (ValueError, KeyError) as e:
+        raise HTTPException(status_code=400, detail=f"Puntuaciones inválidas: {e}")
+
+@app.post("/score-leads/batch")
+async def score_leads_batch(request: Request,
+                            batch_size: Optional[int] = Query(None, ge=1),
+                            max_in_flight: Optional[int] = Query(None, ge=1)):
+    import json
+    from fastapi.responses import StreamingResponse
+    from .sagemaker_client import score_leads_batched, BATCH_SIZE, MAX_IN_FLIGHT
+
+    leads = _parse_batch_leads(await request.body(), request.headers.get("content-type", ""))
+    results = score_leads_batched(leads, batch_size or BATCH_SIZE, max_in_flight or MAX_IN_FLIGHT)
+    return StreamingResponse(
+        (json.dumps(result) + "\n" for result in results),
+        media_type="application/x-ndjson"
+    )
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """
+    Métricas en formato de texto de Prometheus: peticiones y tramos
+    instrumentados, más el pool de Snowflake, las cachés y la concurrencia.
+    """
+    from fastapi.responses import PlainTextResponse
+    from .concurrency import stats as concurrency_stats
+    from .ingestion import stats as ingestion_stats
+    from .instrumentation import render_metrics
+    from .prediction_cache import prediction_cache
+    from .result_cache import result_cache
+    from .schema_cache import schema_cache
+    from .snowflake_client import get_pool
+
+    return PlainTextResponse(render_metrics({
+        "snowflake_pool": get_pool().stats(),
+        "result_cache": result_cache.stats(),
+        "schema_cache": schema_cache.stats(),
+        "concurrency": concurrency_stats(),
+        "ingestion": ingestion_stats(),
+        "prediction_cache": prediction_cache.stats(),
+    }), media_type="text/plain; version=0.0.4")
+
+@app.get("/metrics/concurrency")
+def concurrency_metrics():
+    from .concurrency import stats
+    return stats()
+
+@app.get("/metrics/snowflake-pool")
+def snowflake_pool_metrics():
+    from .snowflake_client import get_pool
+    return get_pool().stats()
+
+@app.get("/metrics/result-cache")
+def result_cache_metrics():
+    from .result_cache import result_cache
+    return result_cache.stats()
+
+@app.get("/metrics/prediction-cache")
+def prediction_cache_metrics():
+    from .prediction_cache import prediction_cache
+    return prediction_cache.stats()
+
+@app.post("/prediction-cache/invalidate")
+def invalidate_prediction_cache():
+    from .prediction_cache import prediction_cache
+    prediction_cache.invalidate()
+    return {"status": "invalidated", **prediction_cache.stats()}
+
+@app.post("/result-cache/invalidate")
+def invalidate_result_cache():
+    from .result_cache import result_cache
+    result_cache.invalidate()
+    return {"status": "invalidated", **result_cache.stats()}
+
+@app.post("/schema-cache/invalidate")
+def invalidate_schema_cache(table: Optional[str] = None):
+    from .schema_cache import invalidate, schema_cache
+    invalidate(table)
+    return {"status": "invalidated", **schema_cache.stats()}
+
 @app.get("/lead-count")
-def count_leads():
-    from .athena_client import run_athena_query
+async def count_leads(source: str = Query("aggregate", pattern="^(aggregate|athena)$")):
+    """
+    Total de leads cargados: del resumen incremental (milisegundos) o, con
+    `source=athena` o si aún no hay agregados, con COUNT(*) en Athena.
+    """
+    import logging
+    from .aggregates import breakdown
+    from .athena_client import get_athena
+    from .concurrency import run_io
+
+    if source == "aggregate":
+        try:
+            summary = await run_io(breakdown, "loaded")
+            if summary["files"] or summary["updated_at"]:
+                return {"total": summary["total"], "source": "aggregate", "updated_at": summary["updated_at"]}
+        except Exception as e:
+            logging.warning(f"Agregados no disponibles: {e}")
     query = "SELECT COUNT(*) AS total FROM leads_raw"
-    result = run_athena_query(query)
-    return {"total": result}
+    try:
+        result = await get_athena().scalar(query)
+    except Exception as e:
+        # Como `run_athena_query`: cualquier fallo (Athena, credenciales, red) devuelve -1
+        logging.error(f"Athena error: {e}")
+        result = -1
+    return {"total": result, "source": "athena"}
+
+@app.get("/lead-breakdown")
+async def lead_breakdown(scope: str = Query("loaded", pattern="^(loaded|cleaned)$")):
+    """
+    Recuentos por Lead_Grade, Lead_Stage y tramo de score del resumen
+    incremental (ver aggregates.py).
+    """
+    from .aggregates import breakdown
+    from .concurrency import run_io
+    return await run_io(breakdown, scope)
+
+@app.post("/aggregates/reconcile")
+async def reconcile_aggregates(repair: bool = False):
+    """
+    Compara los agregados con LEADS_FINAL en Snowflake; con `repair`, los ajusta.
+    """
+    from .aggregates import reconcile
+    return await reconcile(repair)
 @app.post("/test-upload-s3-file")
 def test_upload_s3_file():
     """
@@ -288,4 +884,25 @@ def test_upload_s3_file():
 
 # Lambda adapter
 from mangum import Mangum
-handler = Mangum(app)
+_http_handler = Mangum(app)
+
+def handler(event, context):
+    """
+    Entrada de Lambda: los lotes de SQS (worker de ingesta) van a
+    `ingestion.handle_sqs_event`, la tarea programada de reconciliación a
+    `aggregates.reconcile` y el resto, a la API vía Mangum.
+    """
+    records = event.get("Records") if isinstance(event, dict) else None
+    if records and records[0].get("eventSource") == "aws:sqs":
+        from .ingestion import handle_sqs_event
+        return handle_sqs_event(event)
+    # Tarea programada (EventBridge) de reconciliación de agregados
+    if isinstance(event, dict) and event.get("task") == "reconcile-aggregates":
+        import anyio
+        from .aggregates import reconcile
+        return anyio.run(reconcile, bool(event.get("repair", True)))
+    return _http_handler(event, context)
+
+# Precarga opcional durante el init de Lambda (PREWARM_MODULES / PREWARM_CLIENTS)
+from .startup import prewarm
+prewarm()
@@ -0,0 +1,250 @@
+"""
+Etapa opcional de salida en Parquet para el camino de limpieza.
+
+Convierte el CSV limpio en un archivo Parquet tipado y columnar
+(compresión snappy o zstd, tamaño de row group configurable) y lo sube a S3
+con una key particionada por fecha de ingesta, de modo que Athena pueda
+podar particiones:
+
+    <PARQUET_PREFIX>/ingest_date=YYYY-MM-DD/<archivo>.parquet
+
+Requiere `pyarrow`.
+"""
+import io
+import os
+import time
+import logging
+import tempfile
+from datetime import date
+from typing import BinaryIO, Optional
+
+PARQUET_PREFIX = os.getenv("PARQUET_PREFIX", "leads_parquet")
+PARQUET_COMPRESSION = os.getenv("PARQUET_COMPRESSION", "zstd")
+PARQUET_ROW_GROUP_ROWS = int(os.getenv("PARQUET_ROW_GROUP_ROWS", 128_000))
+
+SUPPORTED_COMPRESSION = ("snappy", "zstd")
+
+
+def partition_key(filename: str, ingest_date: Optional[date] = None, prefix: str = PARQUET_PREFIX) -> str:
+    """
+    Devuelve la key de S3 (estilo Hive) para el Parquet de `filename`.
+    """
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    ingest_date = ingest_date or date.today()
+    return f"{prefix.strip('/')}/ingest_date={ingest_date.isoformat()}/{stem}.parquet"
+
+
+def _column_type(column):
+    """
+    Tipo Parquet más estrecho que admite los valores no vacíos de la columna:
+    int64 si todos son enteros, float64 si son numéricos y string en otro
+    caso. None si la columna no tiene valores.
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    if pd.api.types.is_float_dtype(column):
+        # Columnas ya numéricas (p. ej. Lead_Score) se mantienen como float
+        return pa.float64()
+    values = column.dropna()
+    values = values[values.astype(str).str.strip() != ""]
+    if not len(values):
+        return None
+    numeric = pd.to_numeric(values, errors="coerce")
+    if not numeric.notna().all():
+        return pa.string()
+    if (numeric % 1 == 0).all() and numeric.abs().max() < 2 ** 63:
+        return pa.int64()
+    return pa.float64()
+
+
+def _widest(current, observed):
+    import pyarrow as pa
+
+    if observed is None or current == observed or pa.types.is_string(current):
+        return current
+    if pa.types.is_string(observed):
+        return pa.string()
+    # int64 + float64
+    return pa.float64()
+
+
+def infer_schema(frame):
+    """
+    Decide el tipo Parquet de cada columna a partir del primer bloque
+    (las columnas sin valores se escriben como string).
+    """
+    import pyarrow as pa
+
+    return pa.schema([pa.field(column, _column_type(frame[column]) or pa.string()) for column in frame.columns])
+
+
+def widen_schema(schema, frame):
+    """
+    Devuelve el esquema ensanchado para que quepan los valores de `frame`
+    (int64 -> float64 -> string), o el mismo esquema si ya caben.
+    """
+    import pyarrow as pa
+
+    fields = []
+    for field in schema:
+        type_ = field.type
+        if field.name in frame.columns:
+            type_ = _widest(type_, _column_type(frame[field.name]))
+        fields.append(field if type_ == field.type else pa.field(field.name, type_))
+    widened = pa.schema(fields)
+    return schema if widened.equals(schema) else widened
+
+
+def to_table(frame, schema):
+    """
+    Convierte un bloque (columnas de texto) al esquema fijado. El esquema
+    debe admitir todos los valores del bloque (ver `widen_schema`).
+    """
+    import pandas as pd
+    import pyarrow as pa
+
+    arrays = []
+    for field in schema:
+        column = frame[field.name] if field.name in frame.columns else pd.Series([None] * len(frame), dtype=object)
+        if pa.types.is_string(field.type):
+            arrays.append(pa.array(column, type=pa.string(), from_pandas=True))
+        else:
+            numeric = pd.to_numeric(column.where(column.astype(str).str.strip() != ""), errors="coerce")
+            if pa.types.is_integer(field.type):
+                numeric = numeric.astype("Int64")
+            arrays.append(pa.array(numeric, type=field.type, from_pandas=True))
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+def _rewrite(sink, start: int, schema, compression: str, row_group_rows: int):
+    """
+    Vuelve a escribir desde `start` los row groups ya escritos en `sink`,
+    convertidos a `schema`, y devuelve el writer abierto para seguir.
+    """
+    import shutil
+    import pyarrow.parquet as pq
+
+    with tempfile.TemporaryFile(suffix=".parquet") as previous:
+        sink.seek(start)
+        shutil.copyfileobj(sink, previous)
+        sink.seek(start)
+        sink.truncate()
+        previous.seek(0)
+        source = pq.ParquetFile(previous)
+        writer = pq.ParquetWriter(sink, schema, compression=compression)
+        for i in range(source.num_row_groups):
+            writer.write_table(source.read_row_group(i).cast(schema), row_group_size=row_group_rows)
+    return writer
+
+
+def write_parquet(fileobj: BinaryIO, sink, encoding: str, compression: str = PARQUET_COMPRESSION,
+                  row_group_rows: int = PARQUET_ROW_GROUP_ROWS, score: bool = False,
+                  skip_rows: Optional[set] = None, aggregate=None, row_filter=None) -> dict:
+    """
+    Escribe el CSV de `fileobj` como Parquet en `sink`; cada bloque de
+    `row_group_rows` filas es un row group. Devuelve filas y esquema.
+    `aggregate` (ver `aggregates.py`) acumula los recuentos de cada bloque y
+    `row_filter` se aplica como en `cleaning.iter_clean_frames`.
+
+    El esquema se infiere del primer bloque. Si un bloque posterior trae
+    valores que no caben (decimales en una columna int64, texto en una
+    numérica), la columna se ensancha y los row groups ya escritos se
+    reescriben con el nuevo esquema, así que `sink` debe poder leerse,
+    posicionarse y truncarse (un temporal de disco o un BytesIO). Los números
+    ya escritos que pasan a string quedan en su forma canónica ("1.50" -> "1.5").
+    """
+    import pyarrow.parquet as pq
+    from .cleaning import iter_clean_frames
+    from .instrumentation import span
+
+    if compression not in SUPPORTED_COMPRESSION:
+        raise ValueError(f"Compresión no soportada: {compression}. Usa {', '.join(SUPPORTED_COMPRESSION)}.")
+
+    stats = {"rows": 0}
+    writer = None
+    schema = None
+    start = sink.tell()
+    try:
+        for frame in iter_clean_frames(fileobj, encoding, row_group_rows, stats, score, row_filter=row_filter,
+                                       skip_rows=skip_rows, aggregate=aggregate):
+            if writer is None:
+                schema = inferred = infer_schema(frame)
+                writer = pq.ParquetWriter(sink, schema, compression=compression)
+            else:
+                wider = widen_schema(schema, frame)
+                if wider is not schema:
+                    for old, new in zip(schema, wider):
+                        if old.type != new.type:
+                            logging.warning(f"⚠️ Columna {old.name} ensanchada de {old.type} a {new.type}; "
+                                            "reescribiendo los row groups anteriores")
+                    writer.close()
+                    with span("parquet.rewrite"):
+                        writer = _rewrite(sink, start, wider, compression, row_group_rows)
+                    schema = wider
+            with span("parquet.write"):
+                writer.write_table(to_table(frame, schema), row_group_size=row_group_rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError("El CSV no contiene datos.")
+    widened = {new.name: f"{old.type} -> {new.type}" for old, new in zip(inferred, schema) if old.type != new.type}
+    return {"rows": stats["rows"], "widened": widened, "columns": {f.name: str(f.type) for f in schema}}
+
+
+def clean_csv_to_parquet_s3(fileobj: BinaryIO, filename: str, compression: str = PARQUET_COMPRESSION,
+                            row_group_rows: int = PARQUET_ROW_GROUP_ROWS, score: bool = False,
+                            ingest_date: Optional[date] = None, report: Optional[dict] = None,
+                            bad_rows: str = "skip", aggregate=None, dedup: bool = False) -> dict:
+    """
+    Limpia el CSV, lo escribe como Parquet en un temporal de disco (memoria
+    acotada a un row group) y lo sube a S3 en su partición.
+
+    Con `dedup=True` solo se escriben las filas nuevas o cambiadas respecto al
+    índice de hashes (ver `dedup.py`). El índice no se actualiza: registra lo
+    cargado en Snowflake y el Parquet no se carga.
+
+    Returns:
+        dict: key, filas, bytes CSV/Parquet, ratio de compresión y throughput
+    """
+    from .cleaning import _CountingReader, _encoding_and_skip
+    from .upload_s3 import upload_stream
+
+    start = time.perf_counter()
+    encoding, skip = _encoding_and_skip(fileobj, report, bad_rows)
+    counter = _CountingReader(fileobj)
+    key = partition_key(filename, ingest_date)
+    run = None
+    if dedup:
+        from .dedup import get_index
+        run = get_index().begin()
+
+    with tempfile.TemporaryFile(suffix=".parquet") as tmp:
+        result = write_parquet(io.BufferedReader(counter), tmp, encoding, compression, row_group_rows, score, skip,
+                               aggregate, run.filter if run is not None else None)
+        write_seconds = time.perf_counter() - start
+        parquet_bytes = tmp.tell()
+        tmp.seek(0)
+        upload_stream(key, iter(lambda: tmp.read(1024 * 1024), b""))
+
+    elapsed = time.perf_counter() - start
+    mb_in = counter.bytes_read / (1024 * 1024)
+    stats = {
+        "s3_key": key,
+        "encoding": encoding,
+        "compression": compression,
+        "rows": result["rows"],
+        "widened": result["widened"],
+        "columns": result["columns"],
+        "bytes_in": counter.bytes_read,
+        "bytes_out": parquet_bytes,
+        "compression_ratio": round(counter.bytes_read / parquet_bytes, 2) if parquet_bytes else 0.0,
+        "write_mb_per_s": round(mb_in / write_seconds, 2) if write_seconds > 0 else 0.0,
+        "seconds": round(elapsed, 3),
+    }
+    if run is not None:
+        stats["rows_skipped"] = run.stats["rows_skipped"]
+        stats["bytes_saved"] = run.stats["bytes_saved"]
+    logging.info(f"🧱 Parquet escrito: {key} ({stats['compression_ratio']}x, {stats['write_mb_per_s']} MB/s)")
+    return stats
@@ -0,0 +1,165 @@
+"""
+Caché de predicciones de `/score-lead`.
+
+- Clave: hash SHA-256 del payload en forma canónica (claves ordenadas,
+  números enteros escritos igual aunque lleguen como float) más la versión
+  del modelo (`SAGEMAKER_ENDPOINT` y `SAGEMAKER_MODEL_VERSION`, leídas del
+  entorno en cada petición).
+- LRU en proceso con TTL por entrada (PREDICTION_CACHE_MAX_ENTRIES,
+  PREDICTION_CACHE_TTL). Los errores no se guardan.
+- Single-flight: las peticiones simultáneas con la misma clave esperan a
+  una única invocación del endpoint. La invocación es una tarea propia de
+  la caché, así que cancelar la petición que la inició no afecta al resto.
+- Si cambia el endpoint o la versión del modelo se vacía la caché.
+"""
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+PREDICTION_CACHE_ENABLED = os.getenv("PREDICTION_CACHE_ENABLED", "1") == "1"
+PREDICTION_CACHE_TTL = float(os.getenv("PREDICTION_CACHE_TTL", 300))
+PREDICTION_CACHE_MAX_ENTRIES = int(os.getenv("PREDICTION_CACHE_MAX_ENTRIES", 10_000))
+
+
+def _canonical(value: Any) -> Any:
+    # 3 y 3.0 son la misma característica para el modelo
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {str(k): _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    return value
+
+
+def canonical_key(payload: Any, model_version: str) -> str:
+    """
+    Clave de caché de un payload para una versión del modelo.
+    """
+    body = json.dumps(_canonical(payload), sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{model_version}\n{body}".encode("utf-8")).hexdigest()
+
+
+def model_version() -> str:
+    from . import sagemaker_client
+    return sagemaker_client.model_version()
+
+
+class PredictionCache:
+    """
+    LRU con TTL y coalescencia de llamadas en curso por clave.
+    """
+
+    def __init__(self, ttl: float = PREDICTION_CACHE_TTL, max_entries: int = PREDICTION_CACHE_MAX_ENTRIES,
+                 version: Callable[[], str] = model_version, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._version_fn = version
+        self._clock = clock
+        self._version: Optional[str] = None
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def _current_version(self) -> str:
+        version = self._version_fn()
+        with self._lock:
+            if version != self._version:
+                if self._version is not None:
+                    logging.info(f"🔄 Modelo cambiado ({self._version} -> {version}): caché de predicciones vaciada")
+                    self._entries.clear()
+                    self._metrics["invalidations"] += 1
+                self._version = version
+        return version
+
+    def _get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, created_at = item
+            if self._clock() - created_at >= self.ttl:
+                del self._entries[key]
+                self._metrics["expired"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._metrics["hits"] += 1
+            return value
+
+    def _put(self, key: str, value: Any):
+        with self._lock:
+            self._entries[key] = (value, self._clock())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._metrics["evictions"] += 1
+
+    async def get_or_call(self, payload: Any, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Devuelve la predicción cacheada del payload o la obtiene con
+        `call()`, compartiendo la invocación con las peticiones simultáneas.
+        """
+        if not PREDICTION_CACHE_ENABLED:
+            return await call()
+        key = canonical_key(payload, self._current_version())
+        value = self._get(key)
+        if value is not None:
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            with self._lock:
+                self._metrics["misses"] += 1
+            task = asyncio.ensure_future(self._invoke(key, call))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            with self._lock:
+                self._metrics["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    async def _invoke(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        with self._lock:
+            self._metrics["invocations"] += 1
+        value = await call()
+        # `call_sagemaker` devuelve los errores como {"error": ...}: no se cachean
+        if not (isinstance(value, dict) and "error" in value):
+            self._put(key, value)
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._metrics["invalidations"] += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self._metrics = {"hits": 0, "misses": 0, "coalesced": 0, "invocations": 0,
+                             "expired": 0, "evictions": 0, "invalidations": 0}
+
+    def stats(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            size = len(self._entries)
+        requests = metrics["hits"] + metrics["misses"] + metrics["coalesced"]
+        return {
+            **metrics,
+            "requests": requests,
+            "avoided_invocations": metrics["hits"] + metrics["coalesced"],
+            "hit_rate": round((metrics["hits"] + metrics["coalesced"]) / requests, 4) if requests else 0.0,
+            "inflight": len(self._inflight),
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "model_version": self._version,
+        }
+
+
+prediction_cache = PredictionCache()
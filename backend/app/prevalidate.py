@@ -0,0 +1,346 @@
+"""
+Pre-pasada de encoding y validación de un CSV antes de limpiarlo.
+
+1. Una lectura secuencial por bloques comprueba si el archivo es UTF-8
+   válido (decodificador incremental en C), cuenta comillas y elige los
+   cortes de trozo en saltos de línea que no caen dentro de un campo
+   entrecomillado.
+2. Solo si no es UTF-8 se ejecuta chardet sobre unas pocas muestras
+   (inicio, medio y final) en lugar de sobre todo el archivo.
+3. Cada trozo se valida en paralelo (un grupo de procesos del módulo,
+   arrancados con forkserver; hilos si el entorno no los permite, como
+   Lambda sin /dev/shm): número de campos por fila frente a la cabecera.
+
+El resultado es un informe con el encoding, los problemas de la cabecera,
+el detalle de las primeras filas defectuosas (offset en bytes, línea,
+índice de registro y número de campos) y los índices de registro de todas
+ellas, sin límite. `cleaning.iter_clean_frames` acepta `skip_rows` con esos
+índices para saltarlas sin volver a leer el archivo.
+"""
+import os
+import csv
+import time
+import codecs
+import shutil
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, List, Optional, Tuple
+
+BLOCK_SIZE = int(os.getenv("PREVALIDATE_BLOCK_SIZE", 8 * 1024 * 1024))
+CHUNK_BYTES = int(os.getenv("PREVALIDATE_CHUNK_BYTES", 32 * 1024 * 1024))
+WORKERS = int(os.getenv("PREVALIDATE_WORKERS", os.cpu_count() or 2))
+MAX_BAD_ROWS = int(os.getenv("PREVALIDATE_MAX_BAD_ROWS", 1000))
+SAMPLE_BYTES = 64 * 1024
+SAMPLES = 3
+
+
+def _scan(fileobj: BinaryIO, chunk_bytes: int) -> dict:
+    """
+    Lectura secuencial: validez UTF-8, BOM, primera línea y cortes de trozo
+    (offset en bytes y número de línea de inicio).
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")("strict")
+    utf8 = True
+    offset = 0
+    quotes = 0
+    newlines = 0
+    boundaries = [(0, 0)]
+    target = chunk_bytes
+    head = b""
+
+    while True:
+        block = fileobj.read(BLOCK_SIZE)
+        if not block:
+            break
+        if len(head) < SAMPLE_BYTES:
+            head += block[:SAMPLE_BYTES]
+        if utf8:
+            try:
+                decoder.decode(block)
+            except UnicodeDecodeError:
+                utf8 = False
+        # Cortes: primer salto de línea tras el objetivo con comillas pares
+        search_from = max(target - offset, 0)
+        while search_from < len(block):
+            nl = block.find(b"\n", search_from)
+            if nl < 0:
+                break
+            if (quotes + block.count(b'"', 0, nl)) % 2 == 0:
+                boundaries.append((offset + nl + 1, newlines + block.count(b"\n", 0, nl + 1)))
+                target = offset + nl + 1 + chunk_bytes
+                search_from = max(target - offset, nl + 1)
+            else:
+                search_from = nl + 1
+        quotes += block.count(b'"')
+        newlines += block.count(b"\n")
+        offset += len(block)
+
+    if utf8:
+        try:
+            decoder.decode(b"", final=True)
+        except UnicodeDecodeError:
+            utf8 = False
+    if boundaries[-1][0] >= offset and len(boundaries) > 1:
+        boundaries.pop()
+    return {"utf8": utf8, "size": offset, "head": head, "boundaries": boundaries}
+
+
+def _sampled_encoding(fileobj: BinaryIO, size: int) -> str:
+    """
+    chardet sobre SAMPLES muestras repartidas por el archivo.
+    """
+    import chardet
+
+    detector = chardet.UniversalDetector()
+    for i in range(SAMPLES):
+        fileobj.seek(max(size * i // SAMPLES, 0))
+        detector.feed(fileobj.read(SAMPLE_BYTES))
+        if detector.done:
+            break
+    detector.close()
+    encoding = detector.result["encoding"] or "latin1"
+    # Sin UTF-8 válido, "ascii"/"utf-8" no pueden ser la respuesta
+    if encoding.lower().replace("-", "") in ("ascii", "utf8"):
+        encoding = "latin1"
+    return encoding
+
+
+def _parse_header(head: bytes, encoding: str) -> Tuple[List[str], int, List[str]]:
+    """
+    Devuelve columnas, longitud en bytes de la línea de cabecera y problemas.
+    """
+    from .cleaning import normalize_columns
+
+    line = head.split(b"\n", 1)[0]
+    header_bytes = len(line) + 1
+    columns = next(csv.reader([line.decode(encoding, errors="replace").rstrip("\r")]), [])
+    issues = []
+    normalized = normalize_columns(columns)
+    if not columns:
+        issues.append("cabecera vacía")
+    empty = [i for i, name in enumerate(normalized) if not name]
+    if empty:
+        issues.append(f"columnas sin nombre en las posiciones {empty}")
+    duplicated = sorted({name for name in normalized if name and normalized.count(name) > 1})
+    if duplicated:
+        issues.append(f"columnas duplicadas tras normalizar: {duplicated}")
+    return columns, header_bytes, issues
+
+
+def _validate_range(path: str, start: int, end: int, first_line: int, encoding: str,
+                    width: int, max_bad: int) -> Tuple[int, int, list, list, list]:
+    """
+    Valida las filas de [start, end). Devuelve (índices consumidos,
+    registros, índices de todas las filas malas, índices de las que tienen
+    campos de más o comillas sin cerrar, detalle de las primeras `max_bad`)
+    con índices de registro relativos.
+
+    Los índices siguen la numeración del `skiprows` de pandas: una línea en
+    blanco no es un registro pero sí consume un índice.
+    """
+    with open(path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    index = 0
+    records = 0
+    bad = []
+    long = []
+    details = []
+    offset = start
+    line = first_line
+    pending = b""
+    pending_offset = offset
+    pending_line = line
+    for raw in data.splitlines(keepends=True):
+        if not pending:
+            pending_offset, pending_line = offset, line
+        pending += raw
+        offset += len(raw)
+        line += 1
+        # Un registro puede ocupar varias líneas si un campo lleva saltos
+        if pending.count(b'"') % 2:
+            continue
+        text = pending.decode(encoding, errors="replace").rstrip("\r\n")
+        pending = b""
+        index += 1
+        if not text:
+            continue
+        fields = len(next(csv.reader([text]), []))
+        records += 1
+        if fields != width:
+            bad.append(index)
+            if fields > width:
+                long.append(index)
+            if len(details) < max_bad:
+                details.append({"offset": pending_offset, "line": pending_line + 1,
+                                "record": index, "fields": fields})
+    if pending:
+        index += 1
+        records += 1
+        bad.append(index)
+        long.append(index)
+        if len(details) < max_bad:
+            details.append({"offset": pending_offset, "line": pending_line + 1, "record": index,
+                            "fields": None, "error": "comillas sin cerrar"})
+    return index, records, bad, long, details
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    """
+    Grupo de validación compartido por el proceso. Los procesos se arrancan
+    con forkserver: se valida desde hilos del servidor y un fork copiaría
+    locks tomados (boto3, logging, el pool de Snowflake).
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            try:
+                _pool = ProcessPoolExecutor(max_workers=WORKERS,
+                                            mp_context=multiprocessing.get_context("forkserver"))
+            except (OSError, NotImplementedError, ValueError) as e:
+                logging.warning(f"⚠️ Sin procesos disponibles ({e}); se valida con hilos")
+                _pool = ThreadPoolExecutor(max_workers=WORKERS)
+        return _pool
+
+
+def _use_threads(e: Exception):
+    global _pool
+    logging.warning(f"⚠️ Grupo de procesos no disponible ({e}); se valida con hilos")
+    with _pool_lock:
+        _pool = ThreadPoolExecutor(max_workers=WORKERS)
+
+
+def _as_path(fileobj: BinaryIO) -> Tuple[str, bool]:
+    """
+    Ruta del archivo en disco; si no la tiene (p. ej. SpooledTemporaryFile
+    de una subida), se copia a un temporal. Devuelve (ruta, es_temporal).
+    """
+    name = getattr(fileobj, "name", None)
+    if isinstance(name, str) and os.path.isfile(name):
+        return name, False
+    # SpooledTemporaryFile que ya pasó a disco: se lee su archivo subyacente
+    # (en Linux un TemporaryFile sin nombre, accesible por su descriptor)
+    name = getattr(getattr(fileobj, "_file", None), "name", None)
+    if isinstance(name, int):
+        name = f"/proc/{os.getpid()}/fd/{name}"
+    if isinstance(name, str) and os.path.isfile(name):
+        fileobj.flush()
+        return name, False
+    fileobj.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".csv") as tmp:
+        shutil.copyfileobj(fileobj, tmp, BLOCK_SIZE)
+    return tmp.name, True
+
+
+def _validate_all(args: list, workers: int) -> list:
+    if len(args) == 1 or workers <= 1:
+        return [_validate_range(*a) for a in args]
+    try:
+        return list(_executor().map(_validate_range, *zip(*args)))
+    except (OSError, BrokenProcessPool) as e:
+        # Sin /dev/shm los procesos pueden fallar al arrancar, no al crear el grupo
+        _use_threads(e)
+        return list(_executor().map(_validate_range, *zip(*args)))
+
+
+def prevalidate(fileobj: BinaryIO, chunk_bytes: int = CHUNK_BYTES, workers: int = WORKERS,
+                max_bad_rows: int = MAX_BAD_ROWS) -> dict:
+    """
+    Ejecuta la pre-pasada completa y devuelve el informe. Deja el puntero
+    del archivo donde estaba.
+
+    Returns:
+        dict: encoding, utf8_fast_path, bom, bytes, columns, header_issues,
+        rows, bad_row_count, bad_rows (hasta `max_bad_rows`), bad_records y
+        long_records (índices de todas las filas defectuosas y de las que
+        tienen campos de más), chunks, seconds
+    """
+    from .instrumentation import span
+
+    start = time.perf_counter()
+    position = fileobj.tell()
+    fileobj.seek(0)
+    with span("prevalidate.scan"):
+        scan = _scan(fileobj, chunk_bytes)
+
+    bom = scan["head"].startswith(codecs.BOM_UTF8)
+    if scan["utf8"]:
+        encoding = "utf-8-sig" if bom else "utf-8"
+    else:
+        with span("chardet.detect"):
+            encoding = _sampled_encoding(fileobj, scan["size"])
+
+    columns, header_bytes, header_issues = _parse_header(scan["head"], encoding)
+    # El primer trozo empieza tras la cabecera
+    boundaries = [(max(b, header_bytes), line if b >= header_bytes else 1) for b, line in scan["boundaries"]]
+    ranges = [(b[0], nb[0], b[1]) for b, nb in zip(boundaries, boundaries[1:] + [(scan["size"], None)])
+              if nb[0] > b[0]]
+
+    results = []
+    if ranges:
+        path, temporary = _as_path(fileobj)
+        try:
+            args = [(path, s, e, line, encoding, len(columns), max_bad_rows) for s, e, line in ranges]
+            with span("prevalidate.validate"):
+                results = _validate_all(args, workers)
+        finally:
+            if temporary:
+                os.remove(path)
+    fileobj.seek(position)
+
+    rows = 0
+    consumed = 0
+    bad_rows = []
+    bad_records = []
+    long_records = []
+    for index, records, bad, long, details in results:
+        for item in details:
+            if len(bad_rows) < max_bad_rows:
+                bad_rows.append({**item, "record": consumed + item["record"]})
+        bad_records.extend(consumed + i for i in bad)
+        long_records.extend(consumed + i for i in long)
+        consumed += index
+        rows += records
+
+    report = {
+        "encoding": encoding,
+        "utf8_fast_path": scan["utf8"],
+        "bom": bom,
+        "bytes": scan["size"],
+        "columns": columns,
+        "header_issues": header_issues,
+        "rows": rows,
+        "bad_row_count": len(bad_records),
+        "bad_rows": bad_rows,
+        "bad_records": bad_records,
+        "long_records": long_records,
+        "chunks": len(ranges),
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+    logging.info(f"🔎 Pre-validación: {encoding}, {rows} filas, {len(bad_records)} defectuosas en {report['seconds']}s")
+    return report
+
+
+def skip_rows(report: dict, mode: str = "skip") -> set:
+    """
+    Índices de registro (1 = primera fila de datos) de las filas a saltar,
+    en el formato de `skiprows` de pandas (la cabecera es la 0 y las líneas
+    en blanco también cuentan). Se calculan con todas las filas defectuosas,
+    no con el detalle limitado de `bad_rows`.
+
+    - `skip`: todas las filas defectuosas.
+    - `repair`: solo las que tienen campos de más; las cortas se conservan
+      y pandas completa los campos que faltan como vacíos.
+    """
+    if mode not in ("skip", "repair"):
+        raise ValueError(f"Modo no soportado: {mode}. Usa skip o repair.")
+    return set(report["bad_records"] if mode == "skip" else report["long_records"])
@@ -0,0 +1,334 @@
+"""
+Caché de resultados de scoring (p. ej. `/score-all-leads`).
+
+- LRU en proceso con TTL por entrada.
+- Backend compartido opcional (RESULT_CACHE_BACKEND=s3) para que varias
+  instancias de Lambda reutilicen el mismo resultado; `MemoryBackend` hace
+  de sustituto local en pruebas.
+- Cada entrada guarda la marca de carga ("watermark") con la que se
+  calculó: la última modificación de LEADS_RAW/LEADS_FINAL según
+  INFORMATION_SCHEMA (metadatos, no despierta el warehouse). Si ha cambiado,
+  la entrada no vale y se recalcula.
+- Stale-while-revalidate: pasado el TTL y dentro de `stale_ttl`, se sirve
+  el valor anterior y se refresca en segundo plano (una vez por clave).
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 60))
+RESULT_CACHE_STALE_TTL = float(os.getenv("RESULT_CACHE_STALE_TTL", 600))
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 128))
+RESULT_CACHE_BACKEND = os.getenv("RESULT_CACHE_BACKEND", "")
+RESULT_CACHE_PREFIX = os.getenv("RESULT_CACHE_PREFIX", "cache/results")
+# Cada cuánto se vuelve a consultar la marca de carga en Snowflake
+WATERMARK_CHECK_INTERVAL = float(os.getenv("RESULT_CACHE_WATERMARK_INTERVAL", 30))
+
+
+class CacheEntry:
+    __slots__ = ("value", "watermark", "created_at", "compute_seconds")
+
+    def __init__(self, value: Any, watermark: Any, created_at: float, compute_seconds: float):
+        self.value = value
+        self.watermark = watermark
+        self.created_at = created_at
+        self.compute_seconds = compute_seconds
+
+    def to_bytes(self) -> bytes:
+        return json.dumps({"value": self.value, "watermark": self.watermark, "created_at": self.created_at,
+                           "compute_seconds": self.compute_seconds}, default=_encode).encode("utf-8")
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "CacheEntry":
+        item = json.loads(data, object_hook=_decode)
+        return cls(item["value"], item["watermark"], item["created_at"], item["compute_seconds"])
+
+
+def _encode(value: Any) -> Any:
+    from .columnar import ColumnarResult
+    if isinstance(value, ColumnarResult):
+        return {"__columnar__": value.to_dict()}
+    return str(value)
+
+
+def _decode(item: dict) -> Any:
+    if "__columnar__" in item:
+        from .columnar import ColumnarResult
+        return ColumnarResult.from_dict(item["__columnar__"])
+    return item
+
+
+class MemoryBackend:
+    """
+    Backend compartido en memoria (sustituto local del backend S3).
+    """
+
+    def __init__(self):
+        self._items: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._items.get(key)
+
+    def set(self, key: str, data: bytes):
+        with self._lock:
+            self._items[key] = data
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class S3Backend:
+    """
+    Backend compartido entre instancias: un objeto JSON por clave en S3.
+    """
+
+    def __init__(self, prefix: str = RESULT_CACHE_PREFIX):
+        self.prefix = prefix.strip("/")
+
+    def _key(self, key: str) -> str:
+        import hashlib
+        return f"{self.prefix}/{hashlib.sha256(key.encode('utf-8')).hexdigest()}.json"
+
+    def get(self, key: str) -> Optional[bytes]:
+        from botocore.exceptions import ClientError
+        from .upload_s3 import bucket, get_s3
+        try:
+            return get_s3().get_object(Bucket=bucket, Key=self._key(key))["Body"].read()
+        except ClientError as e:
+            if e.response["Error"]["Code"] in ("NoSuchKey", "404"):
+                return None
+            raise
+
+    def set(self, key: str, data: bytes):
+        from .upload_s3 import bucket, get_s3
+        get_s3().put_object(Bucket=bucket, Key=self._key(key), Body=data)
+
+    def clear(self):
+        from .upload_s3 import bucket, get_s3
+        s3 = get_s3()
+        for page in s3.get_paginator("list_objects_v2").paginate(Bucket=bucket, Prefix=f"{self.prefix}/"):
+            for item in page.get("Contents", []):
+                s3.delete_object(Bucket=bucket, Key=item["Key"])
+
+
+class ResultCache:
+    """
+    Caché LRU con TTL, invalidación por marca de carga y refresco en
+    segundo plano.
+    """
+
+    def __init__(self, watermark: Callable[[], Any], ttl: float = RESULT_CACHE_TTL,
+                 stale_ttl: float = RESULT_CACHE_STALE_TTL, max_entries: int = RESULT_CACHE_MAX_ENTRIES,
+                 shared=None, watermark_interval: float = WATERMARK_CHECK_INTERVAL,
+                 clock: Callable[[], float] = time.time):
+        self._watermark_fn = watermark
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_entries = max_entries
+        self.shared = shared
+        self.watermark_interval = watermark_interval
+        self._clock = clock
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._refreshing = set()
+        self._executor = None
+        self._watermark = None
+        self._watermark_checked = None
+        self.reset_stats()
+
+    def current_watermark(self) -> Any:
+        """
+        Devuelve la marca de carga, consultándola como mucho cada
+        `watermark_interval` segundos.
+        """
+        now = self._clock()
+        with self._lock:
+            if self._watermark_checked is not None and now - self._watermark_checked < self.watermark_interval:
+                return self._watermark
+        watermark = self._watermark_fn()
+        with self._lock:
+            self._watermark, self._watermark_checked = watermark, now
+        return watermark
+
+    def notify_load(self):
+        """
+        Señala que ha terminado una carga: la siguiente lectura vuelve a
+        consultar la marca de carga.
+        """
+        with self._lock:
+            self._watermark_checked = None
+
+    def _lookup(self, key: str) -> Optional[CacheEntry]:
+        """
+        Busca en el LRU local; si no está o ya no es fresca, prueba en el
+        backend compartido (otra instancia puede haberla recalculado).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if self.shared is None or (entry is not None and self._clock() - entry.created_at < self.ttl):
+            return entry
+        data = self.shared.get(key)
+        if data is not None:
+            shared_entry = CacheEntry.from_bytes(data)
+            if entry is None or shared_entry.created_at > entry.created_at:
+                self._store_local(key, shared_entry)
+                return shared_entry
+        return entry
+
+    def _store_local(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _compute(self, key: str, compute: Callable[[], Any], watermark: Any) -> CacheEntry:
+        start = time.perf_counter()
+        value = compute()
+        entry = CacheEntry(value, watermark, self._clock(), time.perf_counter() - start)
+        self._store_local(key, entry)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, entry.to_bytes())
+            except Exception as e:
+                logging.warning(f"⚠️ No se pudo guardar en la caché compartida: {e}")
+        return entry
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """
+        Devuelve el valor de `key`, calculándolo con `compute()` si no hay
+        una entrada válida para la marca de carga actual.
+        """
+        watermark = self.current_watermark()
+        entry = self._lookup(key)
+        if entry is not None:
+            age = self._clock() - entry.created_at
+            if entry.watermark != watermark:
+                with self._lock:
+                    self._metrics["invalidations"] += 1
+            elif age < self.ttl:
+                with self._lock:
+                    self._metrics["hits"] += 1
+                    self._metrics["saved_seconds"] += entry.compute_seconds
+                return entry.value
+            elif age < self.ttl + self.stale_ttl:
+                with self._lock:
+                    self._metrics["stale_hits"] += 1
+                    self._metrics["saved_seconds"] += entry.compute_seconds
+                self._refresh_in_background(key, compute, watermark)
+                return entry.value
+
+        # Una sola consulta por clave aunque lleguen peticiones simultáneas
+        with self._key_lock(key):
+            entry = self._lookup(key)
+            if entry is not None and entry.watermark == watermark and self._clock() - entry.created_at < self.ttl:
+                with self._lock:
+                    self._metrics["hits"] += 1
+                    self._metrics["saved_seconds"] += entry.compute_seconds
+                return entry.value
+            with self._lock:
+                self._metrics["misses"] += 1
+            return self._compute(key, compute, watermark).value
+
+    def _refresh_in_background(self, key: str, compute: Callable[[], Any], watermark: Any):
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="cache-refresh")
+            self._metrics["refreshes"] += 1
+
+        def _refresh():
+            try:
+                with self._key_lock(key):
+                    self._compute(key, compute, watermark)
+            except Exception as e:
+                logging.warning(f"⚠️ Falló el refresco en segundo plano de {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._executor.submit(_refresh)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._watermark_checked = None
+        if self.shared is not None:
+            self.shared.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self._metrics = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0,
+                             "invalidations": 0, "saved_seconds": 0.0}
+
+    def stats(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            entries = len(self._entries)
+        lookups = metrics["hits"] + metrics["stale_hits"] + metrics["misses"]
+        served = metrics["hits"] + metrics["stale_hits"]
+        return {
+            **metrics,
+            "saved_seconds": round(metrics["saved_seconds"], 3),
+            "hit_ratio": round(served / lookups, 3) if lookups else 0.0,
+            "entries": entries,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+        }
+
+
+def fetch_load_watermark() -> Optional[str]:
+    """
+    Última modificación de LEADS_RAW / LEADS_FINAL. Es una consulta de
+    metadatos (servicios cloud), no arranca el warehouse.
+    """
+    from .snowflake_client import connection
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT MAX(LAST_ALTERED)
+                FROM LEADS_DB.INFORMATION_SCHEMA.TABLES
+                WHERE TABLE_SCHEMA = 'PUBLIC'
+                AND TABLE_NAME IN ('LEADS_RAW', 'LEADS_FINAL')
+            """)
+            row = cursor.fetchone()
+        finally:
+            cursor.close()
+    return str(row[0]) if row and row[0] is not None else None
+
+
+def _shared_backend():
+    if RESULT_CACHE_BACKEND == "s3":
+        return S3Backend()
+    if RESULT_CACHE_BACKEND == "memory":
+        return MemoryBackend()
+    return None
+
+
+result_cache = ResultCache(fetch_load_watermark, shared=_shared_backend())
+
+
+def notify_load():
+    """
+    Llamar tras COPY INTO / cargas en leads_raw o leads_final.
+    """
+    result_cache.notify_load()
@@ -1,25 +1,192 @@
-import boto3
 import json
 import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterable, Iterator, List
 
 # Configuración del endpoint (puedes también usar variables de entorno)
 SAGEMAKER_ENDPOINT = os.getenv("SAGEMAKER_ENDPOINT", "lead-scoring-endpoint")
+# Versión del modelo desplegado (parte de la clave de la caché de predicciones)
+SAGEMAKER_MODEL_VERSION = os.getenv("SAGEMAKER_MODEL_VERSION", "")
 REGION = os.getenv("AWS_REGION", "eu-west-1")
 
-# Cliente SageMaker
-sagemaker_runtime = boto3.client("sagemaker-runtime", region_name=REGION)
+# Cliente SageMaker: se crea en el primer uso (get_runtime) para no pagar
+# boto3 en el arranque en frío
+sagemaker_runtime = None
+_runtime_lock = threading.Lock()
+
+
+def get_runtime():
+    """
+    Devuelve el cliente `sagemaker-runtime` del proceso, creándolo si hace falta.
+    """
+    global sagemaker_runtime
+    if sagemaker_runtime is None:
+        with _runtime_lock:
+            if sagemaker_runtime is None:
+                import boto3
+                from .instrumentation import instrument_client
+                sagemaker_runtime = instrument_client(boto3.client("sagemaker-runtime", region_name=REGION),
+                                                      "sagemaker")
+    return sagemaker_runtime
+
+
+def endpoint_name() -> str:
+    """
+    Endpoint en uso. Se lee del entorno en cada llamada para que un cambio
+    de endpoint en caliente llegue a las invocaciones y a la caché.
+    """
+    return os.getenv("SAGEMAKER_ENDPOINT") or SAGEMAKER_ENDPOINT
+
+
+def model_version() -> str:
+    """
+    Endpoint y versión del modelo en uso (clave de la caché de predicciones).
+    """
+    return f"{endpoint_name()}:{os.getenv('SAGEMAKER_MODEL_VERSION', SAGEMAKER_MODEL_VERSION)}"
+
 
 def call_sagemaker(payload: dict):
     """
     Envía un payload JSON a un endpoint de SageMaker y devuelve la predicción.
     """
+    from .instrumentation import span
+
     try:
-        response = sagemaker_runtime.invoke_endpoint(
-            EndpointName=SAGEMAKER_ENDPOINT,
-            ContentType="application/json",
-            Body=json.dumps(payload)
-        )
-        result = json.loads(response["Body"].read().decode())
+        with span("sagemaker.call"):
+            response = get_runtime().invoke_endpoint(
+                EndpointName=endpoint_name(),
+                ContentType="application/json",
+                Body=json.dumps(payload)
+            )
+            result = json.loads(response["Body"].read().decode())
         return result
     except Exception as e:
         return {"error": str(e)}
+
+
+async def call_sagemaker_async(payload: dict):
+    """
+    Igual que `call_sagemaker`, sin bloquear el event loop: la llamada a boto3
+    se ejecuta en el grupo de hilos de E/S (concurrencia acotada). Las
+    predicciones se cachean y las peticiones idénticas simultáneas comparten
+    una sola invocación (ver `prediction_cache.py`).
+    """
+    from .concurrency import run_io
+    from .prediction_cache import prediction_cache
+    return await prediction_cache.get_or_call(payload, lambda: run_io(call_sagemaker, payload))
+
+
+# Configuración del scoring por lotes
+BATCH_SIZE = int(os.getenv("SAGEMAKER_BATCH_SIZE", 100))
+MAX_IN_FLIGHT = int(os.getenv("SAGEMAKER_MAX_IN_FLIGHT", 4))
+MAX_RETRIES = int(os.getenv("SAGEMAKER_MAX_RETRIES", 5))
+RETRY_BASE_DELAY = float(os.getenv("SAGEMAKER_RETRY_BASE_DELAY", 0.2))
+
+# Errores de SageMaker que indican saturación y merecen reintento
+THROTTLING_CODES = {"ThrottlingException", "TooManyRequestsException", "ServiceUnavailable", "ModelNotReadyException"}
+
+
+def _is_throttling(error: Exception) -> bool:
+    from botocore.exceptions import ClientError
+
+    if not isinstance(error, ClientError):
+        return False
+    code = error.response.get("Error", {}).get("Code")
+    status = error.response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return code in THROTTLING_CODES or status in (429, 503)
+
+
+def invoke_batch(leads: List[dict], max_retries: int = MAX_RETRIES) -> list:
+    """
+    Envía un micro-lote de leads (array JSON) al endpoint y devuelve una
+    predicción por lead, en el mismo orden.
+
+    Reintenta con backoff exponencial y jitter cuando el endpoint responde
+    con throttling; cualquier otro error se propaga.
+    """
+    from .instrumentation import span
+
+    attempt = 0
+    while True:
+        try:
+            with span("sagemaker.batch"):
+                response = get_runtime().invoke_endpoint(
+                    EndpointName=endpoint_name(),
+                    ContentType="application/json",
+                    Body=json.dumps(leads)
+                )
+            break
+        except Exception as e:
+            if attempt >= max_retries or not _is_throttling(e):
+                raise
+            delay = RETRY_BASE_DELAY * (2 ** attempt)
+            time.sleep(random.uniform(0, delay))
+            attempt += 1
+
+    result = json.loads(response["Body"].read().decode())
+    if isinstance(result, dict):
+        result = result.get("predictions")
+    if not isinstance(result, list) or len(result) != len(leads):
+        raise ValueError("La respuesta del endpoint no contiene una predicción por lead.")
+    return result
+
+
+def _score_chunk(start: int, leads: List[Any]) -> List[dict]:
+    # Los leads que no se pudieron parsear llegan como excepciones y no se envían
+    valid = [(start + i, lead) for i, lead in enumerate(leads) if not isinstance(lead, Exception)]
+    results = {
+        start + i: {"index": start + i, "error": str(lead)}
+        for i, lead in enumerate(leads) if isinstance(lead, Exception)
+    }
+    if valid:
+        try:
+            predictions = invoke_batch([lead for _, lead in valid])
+            for (index, _), prediction in zip(valid, predictions):
+                results[index] = {"index": index, "prediction": prediction}
+        except Exception as e:
+            logging.error(f"❌ Error en micro-lote de SageMaker ({len(valid)} leads): {e}")
+            for index, _ in valid:
+                results[index] = {"index": index, "error": str(e)}
+    return [results[start + i] for i in range(len(leads))]
+
+
+def score_leads_batched(leads: Iterable[Any], batch_size: int = BATCH_SIZE,
+                        max_in_flight: int = MAX_IN_FLIGHT) -> Iterator[dict]:
+    """
+    Puntúa un iterable de leads en micro-lotes concurrentes.
+
+    Como mucho `max_in_flight` lotes se envían a la vez; los resultados se
+    devuelven en el orden original a medida que van completándose, con una
+    entrada `{"index", "prediction"}` o `{"index", "error"}` por lead. Los
+    elementos del iterable que sean excepciones (p. ej. líneas inválidas) se
+    devuelven como error sin invocar el endpoint.
+    """
+    if batch_size < 1 or max_in_flight < 1:
+        raise ValueError("batch_size y max_in_flight deben ser mayores que 0.")
+
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        start = 0
+        for batch in _chunked(leads, batch_size):
+            if len(pending) >= max_in_flight:
+                yield from pending.popleft().result()
+            pending.append(executor.submit(_score_chunk, start, batch))
+            start += len(batch)
+        while pending:
+            yield from pending.popleft().result()
+
+
+def _chunked(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
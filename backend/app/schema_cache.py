@@ -0,0 +1,121 @@
+"""
+Caché de esquemas de tabla compartida por los endpoints de lectura.
+
+Evita consultar INFORMATION_SCHEMA en cada petición: el esquema se guarda
+con un TTL y se invalida explícitamente tras cargas que pueden alterarlo
+(COPY INTO, cambios de estructura). Cada esquema guarda además el SQL de
+proyección ya construido y un mapeador fila -> dict compilado.
+"""
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Sequence, Union
+
+SCHEMA_CACHE_TTL = float(os.getenv("SCHEMA_CACHE_TTL", 300))
+
+
+def quote_identifier(name: str) -> str:
+    """
+    Entrecomilla un identificador de Snowflake escapando las comillas dobles.
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+
+def compile_row_mapper(columns: Sequence[str]) -> Callable[[tuple], dict]:
+    """
+    Genera una función `row -> dict` con las claves fijas, más barata que
+    `dict(zip(columns, row))` en cada fila.
+    """
+    items = ", ".join(f"{name!r}: row[{i}]" for i, name in enumerate(columns))
+    namespace = {}
+    exec(f"def to_dict(row):\n    return {{{items}}}\n", namespace)
+    return namespace["to_dict"]
+
+
+class TableSchema:
+    """
+    Esquema de una tabla con sus artefactos precompilados. `hidden` son las
+    columnas técnicas que existen en la tabla pero no se proyectan.
+    """
+
+    __slots__ = ("table", "columns", "hidden", "projection_sql", "to_dict", "loaded_at", "_statements")
+
+    def __init__(self, table: str, columns: Sequence[str], hidden: Sequence[str] = ()):
+        self.table = table
+        self.columns = tuple(columns)
+        self.hidden = tuple(hidden)
+        self.projection_sql = ", ".join(quote_identifier(col) for col in self.columns)
+        self.to_dict = compile_row_mapper(self.columns)
+        self.loaded_at = time.monotonic()
+        self._statements = {}
+
+    def statement(self, key, builder: Callable[["TableSchema"], str]) -> str:
+        """
+        Devuelve (y memoriza) una sentencia SQL derivada de este esquema.
+        """
+        sql = self._statements.get(key)
+        if sql is None:
+            sql = self._statements[key] = builder(self)
+        return sql
+
+    def index(self, column: str) -> int:
+        return self.columns.index(column)
+
+    def has_column(self, column: str) -> bool:
+        return column in self.columns or column in self.hidden
+
+
+class SchemaCache:
+    """
+    Caché de esquemas con TTL, segura entre hilos.
+    """
+
+    def __init__(self, ttl: float = SCHEMA_CACHE_TTL):
+        self.ttl = ttl
+        self._schemas: Dict[str, TableSchema] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, table: str, loader: Callable[[], Union[Sequence[str], TableSchema]]) -> TableSchema:
+        """
+        Devuelve el esquema de `table`; si no está o ha caducado, llama a
+        `loader()` para obtener las columnas (o el esquema ya construido).
+        """
+        with self._lock:
+            schema = self._schemas.get(table)
+            if schema is not None and time.monotonic() - schema.loaded_at < self.ttl:
+                self.hits += 1
+                return schema
+            self.misses += 1
+
+        loaded = loader()
+        schema = loaded if isinstance(loaded, TableSchema) else TableSchema(table, loaded)
+        with self._lock:
+            self._schemas[table] = schema
+        return schema
+
+    def invalidate(self, table: Optional[str] = None):
+        """
+        Olvida el esquema de `table` (o todos si no se indica).
+        """
+        with self._lock:
+            if table is None:
+                self._schemas.clear()
+            else:
+                self._schemas.pop(table, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"tables": sorted(self._schemas), "hits": self.hits, "misses": self.misses, "ttl": self.ttl}
+
+
+schema_cache = SchemaCache()
+
+
+def invalidate(table: Optional[str] = None):
+    """
+    Invalida la caché del proceso. Llamar tras COPY INTO o cargas que alteren
+    el esquema.
+    """
+    schema_cache.invalidate(table)
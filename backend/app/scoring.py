@@ -0,0 +1,99 @@
+"""
+Motor de scoring local y vectorizado.
+
+Replica las reglas de `SCORING_UDF(activity_score, lead_grade, lead_stage)`
+sobre columnas completas de pandas/NumPy, usando tablas de búsqueda para el
+grado y la etapa en lugar de evaluar un CASE fila a fila en Python.
+
+Reglas (las de la UDF publicada en frontend/README.md):
+    score = activity_score + GRADE_POINTS[lead_grade]   (0 si el grado no está en la tabla)
+            + STAGE_POINTS[lead_stage]                 (0 si la etapa no está en la tabla)
+
+Como en el CASE de la UDF, un grado o una etapa NULL caen en la rama ELSE
+(0 puntos); solo un activity_score NULL da un score NULL (NaN en los
+resultados vectorizados). Las comparaciones distinguen mayúsculas.
+"""
+import math
+from typing import Optional
+
+import numpy as np
+
+GRADE_POINTS = {
+    "A": 50.0,
+    "B": 30.0,
+    "C": 10.0,
+}
+
+STAGE_POINTS = {
+    "Qualified": 20.0,
+    "Unreachable": 5.0,
+}
+
+# Columnas de leads_final que alimentan el scoring
+ACTIVITY_COLUMN = "Asymmetrique_Activity_Score"
+GRADE_COLUMN = "Lead_Grade"
+STAGE_COLUMN = "Lead_Stage"
+SCORE_COLUMN = "Lead_Score"
+
+
+def score_lead(activity_score: Optional[float], lead_grade: Optional[str], lead_stage: Optional[str]) -> Optional[float]:
+    """
+    Implementación de referencia fila a fila (misma semántica que la UDF).
+    """
+    if activity_score is None:
+        return None
+    activity = float(activity_score)
+    if math.isnan(activity):
+        return None
+    return activity + GRADE_POINTS.get(lead_grade, 0.0) + STAGE_POINTS.get(lead_stage, 0.0)
+
+
+def _lookup(values, table: dict) -> np.ndarray:
+    """
+    Traduce una columna categórica a puntos con una tabla de búsqueda NumPy.
+    """
+    import pandas as pd
+
+    categorical = pd.Categorical(values, categories=list(table))
+    # código -1 = valor desconocido o nulo -> último hueco de la tabla (0 puntos)
+    points = np.fromiter(table.values(), dtype=np.float64, count=len(table))
+    points = np.append(points, 0.0)
+    return points[categorical.codes]
+
+
+def score_arrays(activity_score, lead_grade, lead_stage) -> np.ndarray:
+    """
+    Puntúa columnas completas de una vez. Acepta arrays NumPy, listas o
+    Series de pandas del mismo tamaño y devuelve un array float64 con NaN
+    donde la UDF devolvería NULL.
+    """
+    import pandas as pd
+
+    activity = pd.to_numeric(pd.Series(activity_score, copy=False), errors="coerce").to_numpy(dtype=np.float64)
+    grade = np.asarray(lead_grade, dtype=object)
+    stage = np.asarray(lead_stage, dtype=object)
+    if not (len(activity) == len(grade) == len(stage)):
+        raise ValueError("Las columnas de entrada deben tener el mismo tamaño.")
+
+    # NaN en activity se propaga como el NULL de la suma en SQL
+    scores = activity + _lookup(grade, GRADE_POINTS)
+    scores += _lookup(stage, STAGE_POINTS)
+    return scores
+
+
+def score_frame(df, activity_column: str = ACTIVITY_COLUMN, grade_column: str = GRADE_COLUMN,
+                stage_column: str = STAGE_COLUMN):
+    """
+    Devuelve una Series con el score de cada fila de un DataFrame de leads.
+    """
+    import pandas as pd
+
+    scores = score_arrays(df[activity_column], df[grade_column], df[stage_column])
+    return pd.Series(scores, index=df.index, name=SCORE_COLUMN)
+
+
+def can_score(columns) -> bool:
+    """
+    Indica si un conjunto de columnas contiene las entradas del scoring.
+    """
+    return {ACTIVITY_COLUMN, GRADE_COLUMN, STAGE_COLUMN}.issubset(set(columns))
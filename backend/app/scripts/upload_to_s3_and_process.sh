@@ -14,10 +14,11 @@ CONTENT_TYPE=$(file --mime-type -b "$FILEPATH")
 API_BASE="https://9muoh3ge72.execute-api.eu-west-1.amazonaws.com"
 
 echo "1. Solicitando URL presigned para subir $FILENAME..."
-RESPONSE=$(curl -s -G "$API_BASE/generate-presigned-url/" --data-urlencode "filename=$FILENAME" --data-urlencode "content_type=$CONTENT_TYPE")
+RESPONSE=$(curl -s -G "$API_BASE/generate-presigned-url" --data-urlencode "filename=$FILENAME" --data-urlencode "content_type=$CONTENT_TYPE")
 
 URL=$(echo "$RESPONSE" | jq -r '.url')
 KEY=$(echo "$RESPONSE" | jq -r '.key')
+COMPLETE_URL=$(echo "$RESPONSE" | jq -r '.complete_url')
 
 if [ "$URL" == "null" ] || [ -z "$URL" ]; then
   echo "Error obteniendo URL presigned:"
@@ -34,7 +35,7 @@ if [ $? -ne 0 ]; then
 fi
 
 echo "3. Notificando backend para procesar archivo..."
-NOTIFY_RESPONSE=$(curl -s -X POST "$API_BASE/process-s3-file/" -H "Content-Type: application/json" -d "{\"s3_key\": \"$KEY\"}")
+NOTIFY_RESPONSE=$(curl -s -X POST "$API_BASE$COMPLETE_URL" -H "Content-Type: application/json" -d "{\"key\": \"$KEY\"}")
 
 echo "Respuesta backend:"
 echo "$NOTIFY_RESPONSE"
@@ -1,12 +1,10 @@
 import os
-import snowflake.connector
 from pathlib import Path
 from dotenv import load_dotenv
 import logging
-import jwt
 import time
-import requests
-from snowflake.connector import connect
+import threading
+from contextlib import contextmanager
 
 # Definir siempre la ruta del .env (aunque no se use en Lambda)
 env_path = Path(__file__).resolve().parent.parent / "env" / ".env"
@@ -19,37 +17,30 @@ if not os.getenv("AWS_LAMBDA_FUNCTION_NAME"):
 # Autenticacion por jwt con RSA
 def generate_snowflake_jwt():
     """
-    Genera un token JWT para autenticar con Snowflake REST API usando claves del .env
+    Genera un token JWT para autenticar con Snowflake REST API usando claves del .env.
+    La clave y el token se cachean hasta poco antes de caducar.
     """
-    account = os.getenv("SNOWFLAKE_ACCOUNT")
-    user = os.getenv("SNOWFLAKE_USER")
-    private_key_path = os.getenv("PRIVATE_KEY_PATH")
-
-    if not all([account, user, private_key_path]):
-        raise Exception("Faltan variables requeridas en el archivo .env")
+    from .snowpipe import get_jwt_provider
+    return get_jwt_provider().token()
 
-    with open(private_key_path, "r") as f:
-        private_key = f.read()
+# Configuración del pool de conexiones (compartido por todo el proceso y
+# reutilizado entre invocaciones "warm" de Lambda)
+POOL_SIZE = int(os.getenv("SNOWFLAKE_POOL_SIZE", 4))
+POOL_IDLE_TIMEOUT = float(os.getenv("SNOWFLAKE_POOL_IDLE_TIMEOUT", 600))
+POOL_VALIDATE_AFTER = float(os.getenv("SNOWFLAKE_POOL_VALIDATE_AFTER", 300))
+POOL_CHECKOUT_TIMEOUT = float(os.getenv("SNOWFLAKE_POOL_CHECKOUT_TIMEOUT", 30))
 
-    now = int(time.time())
-    payload = {
-        "iss": f"{account}.{user}",
-        "sub": f"{account}.{user}",
-        "iat": now,
-        "exp": now + 60
-    }
 
-    encoded_jwt = jwt.encode(payload, private_key, algorithm="RS256")
-    return encoded_jwt
-# Autenticacion usuario y password
-def get_connection():
+def _connect():
     """
-    Establece conexión a Snowflake y verifica si se ha realizado correctamente.
+    Abre una conexión nueva a Snowflake con usuario y password.
+    El conector se importa aquí para no pagarlo en el arranque en frío.
     """
-    try:
-        print("ruta de env: ", env_path) 
-        # Crear la conexión
-        conn = snowflake.connector.connect(
+    import snowflake.connector
+    from .instrumentation import span
+
+    with span("snowflake.connect"):
+        return snowflake.connector.connect(
             user=os.environ.get("SNOWFLAKE_USER"),
             password=os.environ.get("SNOWFLAKE_PASSWORD"),
             account=os.environ.get("SNOWFLAKE_ACCOUNT"),
@@ -60,31 +51,275 @@ def get_connection():
         )
 
 
-        # Intentar realizar una consulta simple para verificar la conexión
-        cursor = conn.cursor() # esto es el numero de identificacion de la uuid  de la carga de dtaos de snowflake en la tabla final de leads 
-        cursor.execute("SELECT CURRENT_TIMESTAMP")
-        result = cursor.fetchone()  # Obtener el resultado de la consulta
-        print(f"Conexión a Snowflake exitosa, Timestamp: {result[0]}")
-        cursor.close()
-        
-        return conn  # Devolver la conexión si todo es correcto
+class ConnectionPool:
+    """
+    Pool de conexiones Snowflake seguro entre hilos.
+
+    - Reutiliza conexiones ociosas (LIFO) en lugar de abrir una por petición.
+    - La comprobación de salud es local (`is_closed()`); solo se lanza un
+      `SELECT 1` si la conexión lleva más de `validate_after` segundos sin usarse.
+    - Las conexiones ociosas más de `idle_timeout` segundos se cierran.
+    - Si se alcanza `size`, `acquire` espera hasta `checkout_timeout` segundos.
+    """
+
+    def __init__(self, factory=_connect, size: int = POOL_SIZE,
+                 idle_timeout: float = POOL_IDLE_TIMEOUT,
+                 validate_after: float = POOL_VALIDATE_AFTER,
+                 checkout_timeout: float = POOL_CHECKOUT_TIMEOUT):
+        if size < 1:
+            raise ValueError("El tamaño del pool debe ser al menos 1.")
+        self._factory = factory
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.validate_after = validate_after
+        self.checkout_timeout = checkout_timeout
+        self._idle = []  # lista de (conexión, instante del último uso)
+        self._open = 0
+        self._cond = threading.Condition()
+        self._metrics = {
+            "hits": 0,
+            "misses": 0,
+            "evicted": 0,
+            "discarded": 0,
+            "checkouts": 0,
+            "checkout_wait_seconds_total": 0.0,
+            "checkout_wait_seconds_max": 0.0,
+        }
+
+    def _evict_idle(self, now: float):
+        # Se llama con el lock tomado; las más antiguas están al principio
+        expired = [item for item in self._idle if now - item[1] > self.idle_timeout]
+        if expired:
+            self._idle = [item for item in self._idle if now - item[1] <= self.idle_timeout]
+            self._open -= len(expired)
+            self._metrics["evicted"] += len(expired)
+        return [conn for conn, _ in expired]
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except Exception as e:
+            logging.warning(f"Error al cerrar conexión de Snowflake: {e}")
+
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        try:
+            if conn.is_closed():
+                return False
+            if idle_for > self.validate_after:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SELECT 1")
+                finally:
+                    cursor.close()
+            return True
+        except Exception as e:
+            logging.warning(f"Conexión de Snowflake no válida, se descarta: {e}")
+            return False
+
+    def acquire(self):
+        """
+        Devuelve una conexión del pool, abriendo una nueva si no hay ociosas.
+        """
+        start = time.monotonic()
+        deadline = start + self.checkout_timeout
+        while True:
+            with self._cond:
+                to_close = self._evict_idle(time.monotonic())
+                item = None
+                create = False
+                while item is None and not create:
+                    if self._idle:
+                        item = self._idle.pop()
+                    elif self._open < self.size:
+                        self._open += 1
+                        create = True
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise TimeoutError("No hay conexiones de Snowflake disponibles en el pool.")
+                        self._cond.wait(remaining)
+            for old in to_close:
+                self._close_quietly(old)
+
+            if create:
+                try:
+                    conn = self._factory()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                self._record_checkout(start, hit=False)
+                return conn
+
+            conn, last_used = item
+            if self._is_healthy(conn, time.monotonic() - last_used):
+                self._record_checkout(start, hit=True)
+                return conn
+            self._discard(conn)
+
+    def _record_checkout(self, start: float, hit: bool):
+        waited = time.monotonic() - start
+        with self._cond:
+            self._metrics["hits" if hit else "misses"] += 1
+            self._metrics["checkouts"] += 1
+            self._metrics["checkout_wait_seconds_total"] += waited
+            self._metrics["checkout_wait_seconds_max"] = max(self._metrics["checkout_wait_seconds_max"], waited)
+
+    def _discard(self, conn):
+        with self._cond:
+            self._open -= 1
+            self._metrics["discarded"] += 1
+            self._cond.notify()
+        self._close_quietly(conn)
+
+    def release(self, conn, discard: bool = False):
+        """
+        Devuelve una conexión al pool (o la cierra si está rota o `discard`).
+        """
+        try:
+            broken = conn.is_closed()
+        except Exception:
+            broken = True
+        if discard or broken:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self) -> dict:
+        with self._cond:
+            checkouts = self._metrics["checkouts"]
+            return {
+                **self._metrics,
+                "size": self.size,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._open - len(self._idle),
+                "hit_ratio": round(self._metrics["hits"] / checkouts, 4) if checkouts else 0.0,
+                "checkout_wait_seconds_avg": self._metrics["checkout_wait_seconds_total"] / checkouts if checkouts else 0.0,
+            }
+
+    def close_all(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open -= len(idle)
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """
+    Devuelve el pool de conexiones del proceso, creándolo en el primer uso.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool()
+    return _pool
+
+
+@contextmanager
+def connection():
+    """
+    Context manager que presta una conexión del pool y la devuelve al salir.
+    Los cursores de la conexión prestada miden `execute` y las lecturas.
+    """
+    from .instrumentation import TimedConnection, span
+
+    pool = get_pool()
+    with span("snowflake.checkout"):
+        conn = pool.acquire()
+    try:
+        yield TimedConnection(conn)
+    finally:
+        pool.release(conn)
+
+
+class _PooledConnection:
+    """
+    Envoltorio de compatibilidad: `close()` devuelve la conexión al pool.
+    """
+
+    def __init__(self, pool: ConnectionPool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            # Al pool vuelve la conexión original, no el envoltorio instrumentado
+            self._pool.release(getattr(conn, "raw", conn))
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+# Autenticacion usuario y password
+def get_connection():
+    """
+    Obtiene una conexión a Snowflake del pool del proceso.
+    Llamar a `close()` la devuelve al pool en lugar de cerrarla.
+    """
+    from .instrumentation import TimedConnection, span
+
+    try:
+        pool = get_pool()
+        with span("snowflake.checkout"):
+            conn = pool.acquire()
+        return _PooledConnection(pool, TimedConnection(conn))
     except Exception as e:
-        print(f"Error al conectar a Snowflake: {str(e)}")
+        logging.error(f"❌ Error al conectar a Snowflake: {str(e)}")
         return None  # Si hay error, devolver None
-    
+
+# Stage interno y formato de la carga en leads_raw
+LOAD_STAGE = "leads_internal_stage"
+LOAD_FILE_FORMAT = "json_as_variant"
+
+
 # Función para subir el archivo a internl stage Snowflake y ejecutar COPY INTO a tabla intermedia
 def upload_to_snowflake(filepath: str, filename: str):
     """
     Sube archivo JSON a un stage y lo carga como objetos JSON en la tabla leads_raw
     """
     import logging
-    sf_stage = "leads_internal_stage"
-    file_format = "json_as_variant"
 
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
+        with connection() as conn:
+            return _put_and_copy(conn, filepath, LOAD_STAGE, LOAD_FILE_FORMAT)
+
+    except Exception as e:
+        logging.error(f"❌ Error al subir el archivo a Snowflake: {e}")
+        return {"status": "error", "message": f"Exception occurred: {str(e)}"}
+
 
+def _put_and_copy(conn, filepath: str, sf_stage: str, file_format: str):
+    actual_filename = put_to_stage(conn, filepath, sf_stage)
+    return copy_into_raw(conn, actual_filename, sf_stage, file_format)
+
+
+def put_to_stage(conn, filepath: str, sf_stage: str = LOAD_STAGE) -> str:
+    """
+    Sube el archivo local a la raíz del stage (PUT) y devuelve el nombre con
+    el que quedó en el stage.
+    """
+    cursor = conn.cursor()
+    try:
         # Subir el archivo directamente a la raíz del stage (sin subcarpeta)
         put_command = f"PUT file://{filepath} @{sf_stage} AUTO_COMPRESS=TRUE OVERWRITE=TRUE"
         cursor.execute(put_command)
@@ -101,7 +336,17 @@ def upload_to_snowflake(filepath: str, filename: str):
 
         if not actual_filename.endswith(".gz") and ".gz_" not in actual_filename:
             raise Exception(f"El archivo renombrado {actual_filename} no tiene el formato esperado .gz_UUID.")
+        return actual_filename
+    finally:
+        cursor.close()
+
 
+def copy_into_raw(conn, actual_filename: str, sf_stage: str = LOAD_STAGE, file_format: str = LOAD_FILE_FORMAT):
+    """
+    Carga en leads_raw un archivo que ya está en el stage (COPY INTO).
+    """
+    cursor = conn.cursor()
+    try:
         # Ejecutar COPY INTO usando el nombre real
         copy_command = f"""
             COPY INTO leads_raw(filename, data)
@@ -116,15 +361,178 @@ def upload_to_snowflake(filepath: str, filename: str):
         cursor.execute(copy_command)
         logging.info("🚀 Datos copiados a leads_raw con éxito.")
 
-        cursor.close()
-        conn.close()
+        # La carga puede traer columnas nuevas: forzar la relectura del esquema
+        from .schema_cache import invalidate
+        invalidate()
+        # y los resultados de scoring cacheados deben comprobar la marca de carga
+        from .result_cache import notify_load
+        notify_load()
 
         return {"status": "file uploaded and copied into Snowflake", "filename": actual_filename}
+    finally:
+        cursor.close()
+
+
+# Puntuaciones calculadas fuera de Snowflake (SageMaker o motor local): una
+# fila por lead en SCORES_TABLE, escrita con Parquet en stage + MERGE
+SCORES_TABLE = os.getenv("SNOWFLAKE_SCORES_TABLE", "LEAD_SCORES")
+SCORES_FILE_FORMAT = os.getenv("SNOWFLAKE_SCORES_FILE_FORMAT", "scores_parquet")
+SCORES_CHUNK_ROWS = int(os.getenv("SCORES_CHUNK_ROWS", 250_000))
+SCORES_COLUMNS = ("Lead_Number", "Lead_Score")
+
+_scores_ready = False
+_scores_lock = threading.Lock()
 
-    except Exception as e:
-        logging.error(f"❌ Error al subir el archivo a Snowflake: {e}")
-        return {"status": "error", "message": f"Exception occurred: {str(e)}"}
 
+def _ensure_scores_table(cursor):
+    """
+    Crea la tabla de puntuaciones y el formato Parquet si no existen (una
+    vez por proceso).
+    """
+    global _scores_ready
+    if _scores_ready:
+        return
+    with _scores_lock:
+        if _scores_ready:
+            return
+        cursor.execute(f"CREATE FILE FORMAT IF NOT EXISTS {SCORES_FILE_FORMAT} TYPE = PARQUET")
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {SCORES_TABLE} (
+                "Lead_Number" NUMBER(38, 0) NOT NULL PRIMARY KEY,
+                "Lead_Score" FLOAT,
+                "Score_Source" VARCHAR,
+                "Scored_At" TIMESTAMP_NTZ
+            )
+        """)
+        _scores_ready = True
+
+
+def _score_tables(scores, score_column: str, chunk_rows: int):
+    """
+    Normaliza las puntuaciones (DataFrame, tabla o RecordBatch de Arrow, o
+    un iterable de ellos) a tablas Arrow (Lead_Number int64, Lead_Score
+    float64) de `chunk_rows` filas. Las filas sin Lead_Number se descartan.
+    """
+    import pandas as pd
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if isinstance(scores, (pd.DataFrame, pa.Table, pa.RecordBatch)):
+        scores = [scores]
+    schema = pa.schema([(SCORES_COLUMNS[0], pa.int64()), (SCORES_COLUMNS[1], pa.float64())])
+    pending, pending_rows = [], 0
+    for batch in scores:
+        if isinstance(batch, pd.DataFrame):
+            missing = [c for c in (SCORES_COLUMNS[0], score_column) if c not in batch.columns]
+            table = None if missing else pa.Table.from_pandas(batch[[SCORES_COLUMNS[0], score_column]],
+                                                              preserve_index=False)
+        else:
+            table = pa.Table.from_batches([batch]) if isinstance(batch, pa.RecordBatch) else batch
+            missing = [c for c in (SCORES_COLUMNS[0], score_column) if c not in table.column_names]
+        if missing:
+            raise ValueError(f"Faltan columnas en las puntuaciones: {', '.join(missing)}")
+        table = table.select([SCORES_COLUMNS[0], score_column]).rename_columns(list(SCORES_COLUMNS)).cast(schema)
+        table = table.filter(pc.is_valid(table[SCORES_COLUMNS[0]]))
+        if not table.num_rows:
+            continue
+        pending.append(table)
+        pending_rows += table.num_rows
+        # Los lotes pequeños se agrupan: un archivo por trozo de `chunk_rows` filas
+        while pending_rows >= chunk_rows:
+            combined = pa.concat_tables(pending)
+            yield combined.slice(0, chunk_rows)
+            rest = combined.slice(chunk_rows)
+            pending, pending_rows = ([rest], rest.num_rows) if rest.num_rows else ([], 0)
+    if pending_rows:
+        yield pa.concat_tables(pending)
+
+
+def write_scores(scores, source: str = "external", score_column: str = "Lead_Score",
+                 chunk_rows: int = SCORES_CHUNK_ROWS, sf_stage: str = LOAD_STAGE) -> dict:
+    """
+    Escribe puntuaciones en bloque en SCORES_TABLE (clave `Lead_Number`).
+
+    Las puntuaciones se parten en trozos de `chunk_rows` filas, cada trozo
+    se escribe como Parquet y se sube al stage (PUT), y un único MERGE lee
+    los archivos del stage e inserta o actualiza todas las filas a la vez,
+    sin INSERT/UPDATE fila a fila. Si un lead aparece varias veces, gana la
+    última puntuación. Los archivos se borran del stage al terminar, también
+    si falla un PUT o el MERGE.
+
+    Returns:
+        dict: filas, trozos, bytes de Parquet, filas insertadas/actualizadas,
+        segundos por fase y filas/s
+    """
+    import uuid
+    import tempfile
+    import pyarrow.parquet as pq
+    from .instrumentation import span
+
+    start = time.perf_counter()
+    stage_path = f"@{sf_stage}/scores/{uuid.uuid4().hex}"
+    stats = {"rows": 0, "chunks": 0, "bytes": 0}
+    with connection() as conn:
+        cursor = conn.cursor()
+        staging = False
+        try:
+            _ensure_scores_table(cursor)
+            with tempfile.TemporaryDirectory() as tmpdir:
+                for table in _score_tables(scores, score_column, chunk_rows):
+                    path = os.path.join(tmpdir, f"scores_{stats['chunks']:05d}.parquet")
+                    with span("scores.write_parquet"):
+                        pq.write_table(table, path, compression="snappy")
+                    stats["bytes"] += os.path.getsize(path)
+                    staging = True
+                    cursor.execute(f"PUT file://{path} {stage_path} AUTO_COMPRESS=FALSE OVERWRITE=TRUE")
+                    os.remove(path)
+                    stats["rows"] += table.num_rows
+                    stats["chunks"] += 1
+            staged = time.perf_counter()
+
+            inserted = updated = 0
+            if stats["rows"]:
+                cursor.execute(f"""
+                    MERGE INTO {SCORES_TABLE} t
+                    USING (
+                        SELECT $1:"Lead_Number"::NUMBER(38, 0) AS lead_number,
+                               $1:"Lead_Score"::FLOAT AS lead_score
+                        FROM {stage_path}/ (FILE_FORMAT => '{SCORES_FILE_FORMAT}')
+                        QUALIFY ROW_NUMBER() OVER (
+                            PARTITION BY lead_number
+                            ORDER BY METADATA$FILENAME DESC, METADATA$FILE_ROW_NUMBER DESC
+                        ) = 1
+                    ) s
+                    ON t."Lead_Number" = s.lead_number
+                    WHEN MATCHED THEN UPDATE SET
+                        "Lead_Score" = s.lead_score, "Score_Source" = %(source)s,
+                        "Scored_At" = CURRENT_TIMESTAMP()
+                    WHEN NOT MATCHED THEN INSERT ("Lead_Number", "Lead_Score", "Score_Source", "Scored_At")
+                        VALUES (s.lead_number, s.lead_score, %(source)s, CURRENT_TIMESTAMP())
+                """, {"source": source})
+                inserted, updated = (cursor.fetchone() or (0, 0))[:2]
+        finally:
+            # También si falla un PUT o el MERGE: no dejar trozos huérfanos en el stage
+            if staging:
+                try:
+                    cursor.execute(f"REMOVE {stage_path}/")
+                except Exception as e:
+                    logging.warning(f"⚠️ No se pudo limpiar {stage_path}: {e}")
+            cursor.close()
+
+    elapsed = time.perf_counter() - start
+    rows_per_s = stats["rows"] / elapsed if elapsed > 0 else 0.0
+    logging.info(f"🧮 {stats['rows']} puntuaciones escritas en {SCORES_TABLE} en {stats['chunks']} trozo(s), "
+                 f"{elapsed:.2f}s ({rows_per_s:,.0f} filas/s)")
+    return {
+        **stats,
+        "table": SCORES_TABLE,
+        "rows_inserted": inserted,
+        "rows_updated": updated,
+        "stage_seconds": round(staged - start, 3),
+        "merge_seconds": round(time.perf_counter() - staged, 3),
+        "seconds": round(elapsed, 3),
+        "rows_per_s": round(rows_per_s, 1),
+    }
 
 def upload_to_snowflake_snowpipe(filepath: str):
     sf_stage = os.getenv("SNOWFLAKE_STAGE", "leads_internal_stage")
@@ -144,9 +552,9 @@ def upload_to_snowflake_snowpipe(filepath: str):
     if not all([snowflake_account, snowflake_user, pipe_name, private_key_path]):
         raise Exception("❌ Faltan variables de entorno necesarias.")
 
-    snowflake_host = f"https://{snowflake_account}.snowflakecomputing.com"
-
     try:
+        from snowflake.connector import connect
+
         conn = connect(
             user=snowflake_user,
             account=snowflake_account,
@@ -171,20 +579,9 @@ def upload_to_snowflake_snowpipe(filepath: str):
         compressed_filename = os.path.basename(full_stage_path)
         print("✅ Nombre del archivo cargado:", compressed_filename)
 
-        # Generar JWT
-        token = generate_snowflake_jwt()
-
-        # Llamar a Snowpipe REST API
-        headers = {
-            "Authorization": f"Bearer {token}",
-            "Content-Type": "application/json"
-        }
-        body = {"files": [{"path": compressed_filename}]}
-        url = f"{snowflake_host}/v1/data/pipes/{pipe_name}/insertFiles"
-
-        response = requests.post(url, headers=headers, json=body)
-        response.raise_for_status()
-        return response.json()
+        # Llamar a Snowpipe REST API (sesión y token compartidos)
+        from .snowpipe import get_notifier
+        return get_notifier().insert_files([compressed_filename])[0]
 
     except Exception as e:
         logging.error(f"❌ Snowpipe error: {e}")
@@ -195,32 +592,29 @@ def upload_to_snowflake_snowpipe_s3(filename: str):
     """
     Activa Snowpipe para un archivo ya cargado al stage desde S3.
     """
-    import os, requests, logging
-    from urllib.parse import quote_plus
+    from .snowpipe import get_notifier
 
-    sf_stage = os.getenv("SNOWFLAKE_STAGE", "leads_internal_stage")
-    pipe_name = os.getenv("SNOWPIPE_NAME")
-    snowflake_account = os.getenv("SNOWFLAKE_ACCOUNT")
-    snowflake_user = os.getenv("SNOWFLAKE_USER")
-    private_key_path = os.getenv("PRIVATE_KEY_PATH")
+    # ⚠️ Snowpipe necesita el path relativo al stage (no la ruta completa de S3)
+    return get_notifier().insert_files([filename])[0]
 
-    if not all([snowflake_account, snowflake_user, pipe_name, private_key_path]):
-        raise Exception("❌ Faltan variables de entorno necesarias.")
 
-    # Generar JWT
-    token = generate_snowflake_jwt()
-    snowflake_host = f"https://{snowflake_account}.snowflakecomputing.com"
+async def upload_to_snowflake_snowpipe_s3_async(filename: str):
+    """
+    Versión asíncrona de `upload_to_snowflake_snowpipe_s3` (cliente httpx).
+    """
+    from .snowpipe import get_notifier
+
+    return (await get_notifier().insert_files_async([filename]))[0]
 
-    # Activar Snowpipe
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
 
-    # ⚠️ Snowpipe necesita el path relativo al stage (no la ruta completa de S3)
-    body = {"files": [{"path": filename}]}
-    url = f"{snowflake_host}/v1/data/pipes/{pipe_name}/insertFiles"
+def notify_snowpipe(filenames):
+    """
+    Encola archivos ya cargados al stage para registrarlos en Snowpipe en
+    llamadas `insertFiles` agrupadas (envío en segundo plano).
+    """
+    from .snowpipe import get_notifier
 
-    response = requests.post(url, headers=headers, json=body)
-    response.raise_for_status()
-    return response.json()
+    notifier = get_notifier()
+    for filename in filenames:
+        notifier.add(filename)
+    return notifier.stats()
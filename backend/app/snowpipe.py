@@ -0,0 +1,272 @@
+"""
+Notificaciones a Snowpipe (REST `insertFiles`) agrupadas por lotes.
+
+- La clave privada se lee y se parsea una sola vez.
+- El JWT se reutiliza hasta poco antes de caducar.
+- Se usa una sesión HTTP con pool de conexiones persistente.
+- Los archivos registrados con `add()` se acumulan y se envían en llamadas
+  `insertFiles` de hasta INSERT_FILES_LIMIT archivos, al llenarse el lote o
+  cada `flush_interval` segundos.
+- `insert_files_async()` usa un cliente httpx asíncrono para no bloquear el
+  event loop desde los endpoints `async`.
+"""
+import os
+import asyncio
+import time
+import uuid
+import logging
+import threading
+from typing import Callable, Iterable, List, Optional
+
+# Límite de archivos por petición insertFiles de la API de Snowpipe
+INSERT_FILES_LIMIT = 5000
+FLUSH_INTERVAL = float(os.getenv("SNOWPIPE_FLUSH_INTERVAL", 1.0))
+# Snowflake acepta JWT de hasta 1 hora; se renuevan un margen antes
+TOKEN_LIFETIME = int(os.getenv("SNOWPIPE_TOKEN_LIFETIME", 3600))
+TOKEN_REFRESH_MARGIN = int(os.getenv("SNOWPIPE_TOKEN_REFRESH_MARGIN", 60))
+
+
+class JWTProvider:
+    """
+    Genera y cachea el JWT RS256 para la API REST de Snowflake.
+    """
+
+    def __init__(self, account: str, user: str, private_key_path: str,
+                 lifetime: int = TOKEN_LIFETIME, refresh_margin: int = TOKEN_REFRESH_MARGIN,
+                 clock: Callable[[], float] = time.time):
+        self.account = account
+        self.user = user
+        self.private_key_path = private_key_path
+        self.lifetime = lifetime
+        self.refresh_margin = refresh_margin
+        self._clock = clock
+        self._key = None
+        self._token = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+
+    def _private_key(self):
+        if self._key is None:
+            from cryptography.hazmat.primitives.serialization import load_pem_private_key
+
+            with open(self.private_key_path, "rb") as f:
+                self._key = load_pem_private_key(f.read(), password=None)
+        return self._key
+
+    def token(self) -> str:
+        import jwt
+
+        with self._lock:
+            now = int(self._clock())
+            if self._token is None or now >= self._expires_at - self.refresh_margin:
+                payload = {
+                    "iss": f"{self.account}.{self.user}",
+                    "sub": f"{self.account}.{self.user}",
+                    "iat": now,
+                    "exp": now + self.lifetime,
+                }
+                self._token = jwt.encode(payload, self._private_key(), algorithm="RS256")
+                self._expires_at = now + self.lifetime
+            return self._token
+
+
+class SnowpipeNotifier:
+    """
+    Cliente de `insertFiles` con agrupación de archivos por tamaño o tiempo.
+    """
+
+    def __init__(self, pipe_name: str, token_provider: JWTProvider, base_url: str,
+                 batch_size: int = INSERT_FILES_LIMIT, flush_interval: float = FLUSH_INTERVAL,
+                 session=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        if not 1 <= batch_size <= INSERT_FILES_LIMIT:
+            raise ValueError(f"batch_size debe estar entre 1 y {INSERT_FILES_LIMIT}.")
+        self.pipe_name = pipe_name
+        self.token_provider = token_provider
+        self.url = f"{base_url.rstrip('/')}/v1/data/pipes/{pipe_name}/insertFiles"
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+            session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+        self.session = session
+        self._pending: List[str] = []
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._async_client = None
+        self._async_loop = None
+        self.requests_sent = 0
+        self.files_sent = 0
+
+    def _request(self, paths: List[str]) -> dict:
+        headers = {
+            "Authorization": f"Bearer {self.token_provider.token()}",
+            "Content-Type": "application/json",
+        }
+        body = {"files": [{"path": path} for path in paths]}
+        return {"headers": headers, "json": body, "params": {"requestId": str(uuid.uuid4())}, "timeout": 30}
+
+    def _post(self, paths: List[str]) -> dict:
+        response = self.session.post(self.url, **self._request(paths))
+        response.raise_for_status()
+        self._count(paths)
+        return response.json()
+
+    def _count(self, paths: List[str]):
+        # Los envíos síncronos y asíncronos pueden ocurrir a la vez
+        with self._stats_lock:
+            self.requests_sent += 1
+            self.files_sent += len(paths)
+
+    def _get_async_client(self):
+        """
+        Cliente httpx asíncrono ligado al event loop actual (se recrea si el
+        loop cambia, p. ej. entre invocaciones con loops distintos).
+        """
+        import httpx
+
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            self._async_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=4))
+            self._async_loop = loop
+        return self._async_client
+
+    async def insert_files_async(self, paths: Iterable[str]) -> List[dict]:
+        """
+        Versión asíncrona de `insert_files` (mismo troceado por petición).
+        """
+        paths = list(paths)
+        client = self._get_async_client()
+        responses = []
+        for i in range(0, len(paths), self.batch_size):
+            batch = paths[i:i + self.batch_size]
+            response = await client.post(self.url, **self._request(batch))
+            response.raise_for_status()
+            self._count(batch)
+            responses.append(response.json())
+        return responses
+
+    def insert_files(self, paths: Iterable[str]) -> List[dict]:
+        """
+        Registra los archivos de inmediato, en tantas llamadas como hagan falta
+        según el límite por petición. Devuelve las respuestas de la API.
+        """
+        paths = list(paths)
+        with self._send_lock:
+            return [self._post(paths[i:i + self.batch_size]) for i in range(0, len(paths), self.batch_size)]
+
+    def add(self, path: str):
+        """
+        Encola un archivo; se envía cuando el lote se llena o vence el intervalo.
+        """
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("El notificador de Snowpipe está cerrado.")
+            self._pending.append(path)
+            self._ensure_thread()
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="snowpipe-notifier", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                deadline = time.monotonic() + self.flush_interval
+                while (not self._closed and len(self._pending) < self.batch_size
+                       and (remaining := deadline - time.monotonic()) > 0):
+                    self._cond.wait(remaining)
+                if self._closed:
+                    # close() hace el último envío
+                    return
+            self.flush()
+
+    def flush(self) -> List[dict]:
+        """
+        Envía todo lo pendiente. Si una llamada falla, sus archivos vuelven a
+        la cola para el siguiente intento.
+        """
+        with self._cond:
+            pending, self._pending = self._pending, []
+        responses = []
+        for i in range(0, len(pending), self.batch_size):
+            batch = pending[i:i + self.batch_size]
+            try:
+                with self._send_lock:
+                    responses.append(self._post(batch))
+            except Exception as e:
+                logging.error(f"❌ Snowpipe insertFiles falló ({len(batch)} archivos): {e}")
+                with self._cond:
+                    self._pending[:0] = pending[i:]
+                break
+        return responses
+
+    def close(self):
+        """
+        Envía lo pendiente y detiene el hilo de fondo.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def stats(self) -> dict:
+        with self._cond:
+            pending = len(self._pending)
+        with self._stats_lock:
+            return {"pending": pending, "requests_sent": self.requests_sent, "files_sent": self.files_sent}
+
+
+_jwt_provider: Optional[JWTProvider] = None
+_jwt_lock = threading.Lock()
+_notifier: Optional[SnowpipeNotifier] = None
+_notifier_lock = threading.Lock()
+
+
+def get_jwt_provider() -> JWTProvider:
+    """
+    Devuelve el proveedor de JWT del proceso. Solo necesita la cuenta, el
+    usuario y la clave privada: no depende de que Snowpipe esté configurado.
+    """
+    global _jwt_provider
+    if _jwt_provider is None:
+        with _jwt_lock:
+            if _jwt_provider is None:
+                account = os.getenv("SNOWFLAKE_ACCOUNT")
+                user = os.getenv("SNOWFLAKE_USER")
+                private_key_path = os.getenv("PRIVATE_KEY_PATH")
+                if not all([account, user, private_key_path]):
+                    raise Exception("Faltan variables requeridas en el archivo .env")
+                _jwt_provider = JWTProvider(account, user, private_key_path)
+    return _jwt_provider
+
+
+def get_notifier() -> SnowpipeNotifier:
+    """
+    Devuelve el notificador del proceso configurado con las variables de
+    entorno; reutiliza el proveedor de JWT compartido.
+    """
+    global _notifier
+    if _notifier is None:
+        with _notifier_lock:
+            if _notifier is None:
+                account = os.getenv("SNOWFLAKE_ACCOUNT")
+                pipe_name = os.getenv("SNOWPIPE_NAME")
+                if not all([account, os.getenv("SNOWFLAKE_USER"), pipe_name, os.getenv("PRIVATE_KEY_PATH")]):
+                    raise Exception("❌ Faltan variables de entorno necesarias.")
+                base_url = os.getenv("SNOWPIPE_BASE_URL", f"https://{account}.snowflakecomputing.com")
+                _notifier = SnowpipeNotifier(pipe_name, get_jwt_provider(), base_url)
+    return _notifier
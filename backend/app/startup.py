@@ -0,0 +1,103 @@
+"""
+Arranque en frío de la Lambda.
+
+Los clientes (S3, Athena, SageMaker, Snowflake) y las librerías pesadas
+(pandas, pyarrow, el conector) se cargan en el primer uso. Si se prefiere
+pagar ese coste durante el init de Lambda (que no cuenta para la latencia
+de la primera petición), se pueden precargar con variables de entorno:
+
+    PREWARM_MODULES=pandas,chardet,app.cleaning
+    PREWARM_CLIENTS=s3,athena,sagemaker
+
+`import_profile()` mide el arranque con `python -X importtime` en un
+proceso limpio; lo usan `benchmarks/bench_startup.py` y el test de
+presupuesto de arranque.
+"""
+import os
+import sys
+import time
+import logging
+import importlib
+from typing import Dict, Iterable, Optional
+
+PREWARM_MODULES = os.getenv("PREWARM_MODULES", "")
+PREWARM_CLIENTS = os.getenv("PREWARM_CLIENTS", "")
+
+# Módulos que no deben cargarse al importar app.main
+HEAVY_MODULES = ("boto3", "botocore", "pandas", "numpy", "pyarrow", "snowflake.connector", "jwt", "chardet")
+
+# Cliente -> (módulo, función que lo crea)
+CLIENT_FACTORIES = {
+    "s3": ("app.upload_s3", "get_s3"),
+    "athena": ("app.athena_client", "get_boto_client"),
+    "sagemaker": ("app.sagemaker_client", "get_runtime"),
+}
+
+last_report: Dict[str, dict] = {}
+
+
+def _split(value) -> list:
+    if isinstance(value, str):
+        value = value.split(",")
+    return [item.strip() for item in value or () if item.strip()]
+
+
+def prewarm(modules: Optional[Iterable[str]] = None, clients: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+    """
+    Importa los módulos y crea los clientes indicados (por defecto, los de
+    PREWARM_MODULES / PREWARM_CLIENTS). Un fallo se registra y no impide
+    el arranque.
+
+    Returns:
+        dict: por elemento, `ms` empleados o `error`
+    """
+    modules = _split(PREWARM_MODULES if modules is None else modules)
+    clients = _split(PREWARM_CLIENTS if clients is None else clients)
+    report = {}
+
+    for name in modules:
+        start = time.perf_counter()
+        try:
+            importlib.import_module(name)
+            report[name] = {"ms": round((time.perf_counter() - start) * 1000, 1)}
+        except Exception as e:
+            report[name] = {"error": str(e)}
+
+    for name in clients:
+        start = time.perf_counter()
+        try:
+            module_name, factory = CLIENT_FACTORIES[name]
+            getattr(importlib.import_module(module_name), factory)()
+            report[f"client:{name}"] = {"ms": round((time.perf_counter() - start) * 1000, 1)}
+        except Exception as e:
+            report[f"client:{name}"] = {"error": str(e)}
+
+    for name, result in report.items():
+        if "error" in result:
+            logging.warning(f"⚠️ Precarga de {name} falló: {result['error']}")
+        else:
+            logging.info(f"🔥 Precargado {name} en {result['ms']} ms")
+    last_report.update(report)
+    return report
+
+
+def import_profile(module: str = "app.main", cwd: Optional[str] = None) -> Dict[str, dict]:
+    """
+    Importa `module` en un intérprete nuevo con `-X importtime` y devuelve,
+    por módulo cargado, el tiempo propio y acumulado en milisegundos.
+    """
+    import subprocess
+
+    cwd = cwd or os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PREWARM_MODULES="", PREWARM_CLIENTS="")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd, env=env, capture_output=True, text=True, check=True,
+    )
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        profile[name.strip()] = {"self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000}
+    return profile
@@ -1,37 +1,115 @@
-import boto3
 import os
 import io
+import time
 import logging
-from typing import Any
-from botocore.exceptions import ClientError, NoCredentialsError
-
-# Configuración del cliente S3
-s3 = boto3.client(
-    "s3",
-    aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID", "test"),
-    aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY", "test"),
-    endpoint_url=os.environ.get("S3_ENDPOINT_URL", "http://localhost:4566"),  # "http://localstack:4566" en docker
-    region_name=os.environ.get("AWS_REGION", "us-east-1")
-)
+import threading
+from typing import Any, BinaryIO, Iterable, List, Tuple
+
+# Concurrencia de las subidas masivas (archivos y partes en paralelo)
+MAX_CONCURRENCY = int(os.environ.get("S3_MAX_CONCURRENCY", 10))
+
+# Cliente S3: se crea en el primer uso (get_s3) para no importar boto3 en el
+# arranque en frío de la Lambda
+s3 = None
+_s3_lock = threading.Lock()
+
+
+def get_s3():
+    """
+    Devuelve el cliente S3 del proceso (LocalStack o AWS), creándolo si hace falta.
+    """
+    global s3
+    if s3 is None:
+        with _s3_lock:
+            if s3 is None:
+                import boto3
+                from botocore.config import Config
+
+                s3 = boto3.client(
+                    "s3",
+                    aws_access_key_id=os.environ.get("AWS_ACCESS_KEY_ID", "test"),
+                    aws_secret_access_key=os.environ.get("AWS_SECRET_ACCESS_KEY", "test"),
+                    endpoint_url=os.environ.get("S3_ENDPOINT_URL", "http://localhost:4566"),  # "http://localstack:4566" en docker
+                    region_name=os.environ.get("AWS_REGION", "us-east-1"),
+                    # Una conexión por hilo de transferencia
+                    config=Config(max_pool_connections=MAX_CONCURRENCY * 2)
+                )
+                from .instrumentation import instrument_client
+                instrument_client(s3, "s3")
+    return s3
 
 # Nombre del bucket
 bucket = os.environ.get("S3_BUCKET", "leads-raw")
 
+# Orígenes del navegador que suben partes directamente al bucket (Upload.js)
+CORS_ORIGINS = [o.strip() for o in os.environ.get("S3_CORS_ORIGINS", "*").split(",") if o.strip()]
+
+# CORS del bucket: el navegador hace PUT a las URLs firmadas y lee el ETag de
+# cada parte para completar la subida multipart, así que hay que exponerlo
+CORS_RULE = {
+    "AllowedOrigins": CORS_ORIGINS,
+    "AllowedMethods": ["PUT", "GET", "HEAD"],
+    "AllowedHeaders": ["*"],
+    "ExposeHeaders": ["ETag"],
+    "MaxAgeSeconds": 3000,
+}
+
+# El bucket se comprueba una sola vez por proceso
+_bucket_checked = False
+_bucket_lock = threading.Lock()
+
 def ensure_bucket_exists():
     """
-    Verifica si el bucket existe y lo crea si no.
-    Solo necesario en LocalStack o entornos de prueba.
+    Verifica si el bucket existe y lo crea si no (solo necesario en LocalStack
+    o entornos de prueba), y se asegura de que su CORS expone el ETag.
+    La comprobación se hace una vez por proceso.
+    """
+    from botocore.exceptions import ClientError
+
+    global _bucket_checked
+    if _bucket_checked:
+        return
+    with _bucket_lock:
+        if _bucket_checked:
+            return
+        s3 = get_s3()
+        try:
+            s3.head_bucket(Bucket=bucket)
+        except ClientError as e:
+            error_code = e.response['Error']['Code']
+            if error_code == '404' or error_code == 'NoSuchBucket':
+                logging.warning(f"Bucket '{bucket}' no encontrado. Creando...")
+                s3.create_bucket(Bucket=bucket)
+            else:
+                logging.error(f"Error al verificar bucket: {e}")
+                raise
+        ensure_bucket_cors(s3)
+        _bucket_checked = True
+
+
+def _exposes_etag(rules: List[dict]) -> bool:
+    return any("PUT" in rule.get("AllowedMethods", []) and
+               any(h.lower() == "etag" for h in rule.get("ExposeHeaders", []))
+               for rule in rules)
+
+
+def ensure_bucket_cors(s3) -> None:
+    """
+    Aplica CORS_RULE al bucket si sus reglas no exponen ya el ETag a los PUT
+    del navegador (sin él, Upload.js no puede completar la subida multipart).
     """
+    from botocore.exceptions import ClientError
+
     try:
-        s3.head_bucket(Bucket=bucket)
+        rules = s3.get_bucket_cors(Bucket=bucket).get("CORSRules", [])
     except ClientError as e:
-        error_code = e.response['Error']['Code']
-        if error_code == '404' or error_code == 'NoSuchBucket':
-            logging.warning(f"Bucket '{bucket}' no encontrado. Creando...")
-            s3.create_bucket(Bucket=bucket)
-        else:
-            logging.error(f"Error al verificar bucket: {e}")
+        if e.response['Error']['Code'] != 'NoSuchCORSConfiguration':
             raise
+        rules = []
+    if _exposes_etag(rules):
+        return
+    logging.warning(f"🌐 Bucket '{bucket}' sin CORS que exponga ETag. Configurando...")
+    s3.put_bucket_cors(Bucket=bucket, CORSConfiguration={"CORSRules": rules + [CORS_RULE]})
 
 def upload_file(filename: str, content: Any) -> str:
     """
@@ -47,6 +125,8 @@ def upload_file(filename: str, content: Any) -> str:
     Raises:
         Exception: si la subida falla
     """
+    from botocore.exceptions import ClientError, NoCredentialsError
+
     if not filename or not content:
         raise ValueError("El nombre y contenido del archivo no pueden estar vacíos.")
     
@@ -54,7 +134,7 @@ def upload_file(filename: str, content: Any) -> str:
         ensure_bucket_exists()
         file_obj = io.BytesIO(content)
 
-        s3.upload_fileobj(file_obj, bucket, filename)
+        get_s3().upload_fileobj(file_obj, bucket, filename)
         logging.info(f"✅ Archivo '{filename}' subido correctamente a bucket '{bucket}'")
         return filename
 
@@ -69,3 +149,164 @@ def upload_file(filename: str, content: Any) -> str:
     except Exception as e:
         logging.error(f"❌ Error inesperado: {e}")
         raise Exception(f"Error inesperado al subir a S3: {e}")
+
+
+# Tamaño mínimo de parte que acepta S3 en multipart (salvo la última)
+MIN_PART_SIZE = 5 * 1024 * 1024
+PART_SIZE = max(int(os.environ.get("S3_PART_SIZE", 8 * 1024 * 1024)), MIN_PART_SIZE)
+
+
+def upload_stream(filename: str, chunks: Iterable[bytes], part_size: int = PART_SIZE) -> str:
+    """
+    Sube a S3 un contenido que llega por bloques (generador de bytes) sin
+    materializarlo entero en memoria.
+
+    Los bloques se acumulan hasta `part_size` y se envían como partes de una
+    subida multipart; si el contenido total cabe en una sola parte se usa un
+    `put_object` simple. La memoria usada queda acotada a ~`part_size`.
+
+    Args:
+        filename (str): key de destino en S3
+        chunks (Iterable[bytes]): bloques de contenido en orden
+
+    Returns:
+        str: nombre del archivo subido (key en S3)
+    """
+    from botocore.exceptions import ClientError
+
+    if not filename:
+        raise ValueError("El nombre del archivo no puede estar vacío.")
+
+    ensure_bucket_exists()
+    s3 = get_s3()
+    buffer = bytearray()
+    upload_id = None
+    parts = []
+
+    def _flush_part():
+        nonlocal upload_id
+        if upload_id is None:
+            upload_id = s3.create_multipart_upload(Bucket=bucket, Key=filename)["UploadId"]
+        part_number = len(parts) + 1
+        response = s3.upload_part(
+            Bucket=bucket, Key=filename, UploadId=upload_id,
+            PartNumber=part_number, Body=bytes(buffer),
+        )
+        parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        buffer.clear()
+
+    try:
+        for chunk in chunks:
+            buffer.extend(chunk)
+            if len(buffer) >= part_size:
+                _flush_part()
+
+        if upload_id is None:
+            if not buffer:
+                raise ValueError("El contenido del archivo no puede estar vacío.")
+            s3.put_object(Bucket=bucket, Key=filename, Body=bytes(buffer))
+        else:
+            if buffer:
+                _flush_part()
+            s3.complete_multipart_upload(
+                Bucket=bucket, Key=filename, UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        logging.info(f"✅ Archivo '{filename}' subido en {max(len(parts), 1)} parte(s) a bucket '{bucket}'")
+        return filename
+
+    except Exception as e:
+        if upload_id is not None:
+            try:
+                s3.abort_multipart_upload(Bucket=bucket, Key=filename, UploadId=upload_id)
+            except ClientError as abort_error:
+                logging.warning(f"No se pudo abortar la subida multipart: {abort_error}")
+        if isinstance(e, ValueError):
+            raise
+        logging.error(f"❌ Error al subir archivo por partes a S3: {e}")
+        raise Exception(f"Error al subir archivo por partes a S3: {e}")
+
+
+# Partes de 16 MB a partir de 16 MB: menos peticiones que el valor por defecto (8 MB)
+MULTIPART_THRESHOLD = int(os.environ.get("S3_MULTIPART_THRESHOLD", 16 * 1024 * 1024))
+MULTIPART_CHUNKSIZE = int(os.environ.get("S3_MULTIPART_CHUNKSIZE", 16 * 1024 * 1024))
+
+_transfer_manager = None
+_transfer_lock = threading.Lock()
+
+
+def get_transfer_manager():
+    """
+    Devuelve el TransferManager compartido del proceso (reutiliza hilos y
+    conexiones entre subidas).
+    """
+    global _transfer_manager
+    if _transfer_manager is None:
+        with _transfer_lock:
+            if _transfer_manager is None:
+                from boto3.s3.transfer import TransferConfig, create_transfer_manager
+
+                config = TransferConfig(
+                    multipart_threshold=MULTIPART_THRESHOLD,
+                    multipart_chunksize=MULTIPART_CHUNKSIZE,
+                    max_concurrency=MAX_CONCURRENCY,
+                    use_threads=True,
+                )
+                _transfer_manager = create_transfer_manager(get_s3(), config)
+    return _transfer_manager
+
+
+class _TimingSubscriber:
+    """
+    Registra el instante en que termina cada transferencia (s3transfer solo
+    necesita el método `on_done`, sin heredar de BaseSubscriber).
+    """
+
+    def __init__(self):
+        self.done_at = None
+
+    def on_done(self, future, **kwargs):
+        self.done_at = time.perf_counter()
+
+
+def upload_files(files: Iterable[Tuple[str, BinaryIO]], prefix: str = "") -> List[dict]:
+    """
+    Sube varios archivos a S3 en paralelo con el TransferManager compartido
+    (multipart para archivos grandes).
+
+    Args:
+        files: pares (nombre, objeto archivo binario)
+        prefix (str): prefijo opcional de las keys
+
+    Returns:
+        list: por archivo, `key`, `etag`, `size` y `seconds`, o `error` si falló
+    """
+    ensure_bucket_exists()
+    manager = get_transfer_manager()
+    prefix = prefix.strip("/")
+
+    submitted = []
+    for filename, fileobj in files:
+        key = f"{prefix}/{filename}" if prefix else filename
+        subscriber = _TimingSubscriber()
+        start = time.perf_counter()
+        future = manager.upload(fileobj, bucket, key, subscribers=[subscriber])
+        submitted.append((filename, key, future, subscriber, start))
+
+    results = []
+    for filename, key, future, subscriber, start in submitted:
+        try:
+            future.result()
+            head = get_s3().head_object(Bucket=bucket, Key=key)
+            results.append({
+                "filename": filename,
+                "key": key,
+                "etag": head["ETag"].strip('"'),
+                "size": head["ContentLength"],
+                "seconds": round((subscriber.done_at or time.perf_counter()) - start, 3),
+            })
+        except Exception as e:
+            logging.error(f"❌ Error al subir '{filename}' a S3: {e}")
+            results.append({"filename": filename, "key": key, "error": str(e)})
+    logging.info(f"✅ {len(results)} archivo(s) subidos a bucket '{bucket}'")
+    return results
@@ -0,0 +1,283 @@
+"""
+Benchmark del pipeline completo contra sustitutos locales.
+
+Ejecuta la aplicación real (`app.main`) en proceso con `TestClient`, con S3,
+Snowflake, SageMaker y Athena sustituidos (ver `stand_ins.py`), sobre CSV
+sintéticos de leads de los tamaños indicados. Para cada escenario registra
+percentiles de latencia, rendimiento (filas/s y MB/s) y pico de RSS, y
+puede guardar el resultado como línea base o compararlo con una anterior
+(sale con código 1 si hay regresiones).
+
+Uso (desde backend/):
+    python benchmarks/bench_pipeline.py --sizes 1000,100000 --repeat 5
+    python benchmarks/bench_pipeline.py --save-baseline benchmarks/baselines/pipeline.json
+    python benchmarks/bench_pipeline.py --compare benchmarks/baselines/pipeline.json --tolerance 0.25
+
+Tamaños grandes (p. ej. 10000000) generan archivos de ~1 GB en el
+directorio temporal; el CSV se escribe en streaming pero TestClient envía
+la subida desde memoria.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("DEDUP_INDEX_PATH", os.path.join(tempfile.gettempdir(), "bench_leads_hash_index.npz"))
+
+from stand_ins import install, synthetic_csv  # noqa: E402
+
+DEFAULT_SIZES = "1000,10000,100000"
+# Métricas en las que subir es peor / bajar es peor
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "peak_rss_mb")
+HIGHER_IS_BETTER = ("rows_per_s",)
+# Por debajo de estos valores absolutos no se marcan regresiones (ruido)
+NOISE_FLOOR = {"p50_ms": 2.0, "p95_ms": 5.0, "peak_rss_mb": 10.0, "rows_per_s": 0.0}
+
+
+class PeakRSS:
+    """
+    Muestrea el RSS del proceso en un hilo mientras dura el bloque y guarda
+    el pico sobre el valor inicial (MB). Sin /proc usa ru_maxrss.
+    """
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._stop = threading.Event()
+        self._page_mb = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024) if hasattr(os, "sysconf") else 0
+
+    def _current_mb(self) -> float:
+        try:
+            with open("/proc/self/statm") as f:
+                return int(f.read().split()[1]) * self._page_mb
+        except OSError:
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, self._current_mb())
+
+    def __enter__(self):
+        self._start = self._peak = self._current_mb()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._peak = max(self._peak, self._current_mb())
+        self.peak_mb = round(self._peak - self._start, 1)
+
+
+def _summarize(name: str, size: int, latencies: List[float], rows: int, nbytes: int, peak_mb: float) -> dict:
+    arr = np.array(latencies) * 1000
+    total = sum(latencies)
+    return {
+        "scenario": name,
+        "size": size,
+        "runs": len(latencies),
+        "p50_ms": round(float(np.percentile(arr, 50)), 2),
+        "p95_ms": round(float(np.percentile(arr, 95)), 2),
+        "p99_ms": round(float(np.percentile(arr, 99)), 2),
+        "max_ms": round(float(arr.max()), 2),
+        "rows_per_s": round(rows * len(latencies) / total) if rows and total else None,
+        "mb_per_s": round(nbytes * len(latencies) / total / (1024 * 1024), 2) if nbytes and total else None,
+        "peak_rss_mb": peak_mb,
+    }
+
+
+def _measure(call: Callable[[], object], repeat: int, before: Optional[Callable[[], None]] = None):
+    # Una llamada de calentamiento fuera de la medida (imports perezosos, pool)
+    if before:
+        before()
+    call()
+    latencies = []
+    with PeakRSS() as rss:
+        for _ in range(repeat):
+            if before:
+                before()
+            start = time.perf_counter()
+            response = call()
+            latencies.append(time.perf_counter() - start)
+            if getattr(response, "status_code", 200) >= 400:
+                raise RuntimeError(f"Respuesta {response.status_code}: {response.text[:200]}")
+    return latencies, rss.peak_mb
+
+
+def run_suite(sizes: List[int], repeat: int = 3, snowflake_latency_ms: float = 5.0,
+              sagemaker_latency_ms: float = 20.0, athena_latency_ms: float = 50.0, s3: str = "memory",
+              scenarios: Optional[List[str]] = None) -> dict:
+    """
+    Ejecuta todos los escenarios y devuelve {"meta": ..., "results": [...]}.
+    """
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    results = []
+    table_rows = max(sizes)
+
+    def wanted(name: str) -> bool:
+        return not scenarios or name in scenarios
+
+    with install(table_rows=table_rows, snowflake_latency=snowflake_latency_ms / 1000,
+                 sagemaker_latency=sagemaker_latency_ms / 1000, athena_latency=athena_latency_ms / 1000,
+                 s3=s3) as stand_ins, tempfile.TemporaryDirectory() as tmp:
+        client = TestClient(app)
+
+        for size in sizes:
+            path = os.path.join(tmp, f"leads_{size}.csv")
+            nbytes = synthetic_csv(path, size)
+            with open(path, "rb") as f:
+                content = f.read()
+
+            def upload(url: str, name: str = f"leads_{size}.csv"):
+                return lambda: client.post(url, files={"file": (name, content, "text/csv")})
+
+            for name, url in (("clean-upload-csv", "/clean-upload-and-generate-url"),
+                              ("clean-upload-parquet", "/clean-upload-and-generate-url?output=parquet"),
+                              ("upload-and-load", "/upload-and-load?dedup=false")):
+                if wanted(name):
+                    latencies, peak = _measure(upload(url), repeat)
+                    results.append(_summarize(name, size, latencies, size, nbytes, peak))
+            del content
+
+            if wanted("leads-stream-ndjson"):
+                latencies, peak = _measure(lambda: client.get("/leads", params={"format": "ndjson", "limit": size}),
+                                           repeat)
+                results.append(_summarize("leads-stream-ndjson", size, latencies, size, 0, peak))
+
+            if wanted("score-all-leads-cold"):
+                limit = min(size, 10_000)
+                latencies, peak = _measure(lambda: client.get("/score-all-leads", params={"limit": limit}), repeat,
+                                           before=lambda: client.post("/result-cache/invalidate"))
+                results.append(_summarize("score-all-leads-cold", size, latencies, limit, 0, peak))
+
+            if wanted("score-leads-batch"):
+                body = "\n".join(json.dumps({"Lead_Number": 660000 + i, "Lead_Grade": "A"}) for i in range(size))
+                latencies, peak = _measure(lambda: client.post("/score-leads/batch", content=body,
+                                                               headers={"Content-Type": "application/x-ndjson"}),
+                                           repeat)
+                results.append(_summarize("score-leads-batch", size, latencies, size, len(body), peak))
+
+        # Escenarios que no dependen del tamaño del archivo
+        fixed = [
+            ("leads-page-json", lambda: client.get("/leads", params={"limit": 100})),
+            ("score-all-leads-warm", lambda: client.get("/score-all-leads", params={"limit": 100})),
+            ("score-lead", lambda: client.post("/score-lead", json={"Lead_Grade": "A", "Lead_Stage": "Lead"})),
+            ("lead-count", lambda: client.get("/lead-count")),
+        ]
+        for name, call in fixed:
+            if wanted(name):
+                latencies, peak = _measure(call, max(repeat, 10))
+                results.append(_summarize(name, 0, latencies, 0, 0, peak))
+
+        stand_ins_stats = {"snowflake_statements": stand_ins.snowflake.statements,
+                           "sagemaker_invocations": stand_ins.sagemaker.invocations,
+                           "athena_queries": stand_ins.athena.queries}
+
+    return {
+        "meta": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "sizes": sizes,
+            "repeat": repeat,
+            "latency_ms": {"snowflake": snowflake_latency_ms, "sagemaker": sagemaker_latency_ms,
+                           "athena": athena_latency_ms},
+            "s3": s3,
+            "stand_ins": stand_ins_stats,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float = 0.2) -> List[dict]:
+    """
+    Devuelve las regresiones de `current` frente a `baseline`: métricas que
+    empeoran más de `tolerance` (fracción) en el mismo escenario y tamaño.
+    """
+    base: Dict[tuple, dict] = {(r["scenario"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        previous = base.get((result["scenario"], result["size"]))
+        if previous is None:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            old, new = previous.get(metric), result.get(metric)
+            if old is None or new is None:
+                continue
+            if metric in LOWER_IS_BETTER:
+                worse = new > old * (1 + tolerance) and new - old > NOISE_FLOOR[metric]
+            else:
+                worse = new < old * (1 - tolerance)
+            if worse:
+                regressions.append({"scenario": result["scenario"], "size": result["size"], "metric": metric,
+                                    "baseline": old, "current": new,
+                                    "change": round((new - old) / old, 3) if old else None})
+    return regressions
+
+
+def _print_table(report: dict):
+    print(f"{'escenario':<24}{'tamaño':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'filas/s':>12}{'MB/s':>8}{'RSS MB':>9}")
+    for r in report["results"]:
+        print(f"{r['scenario']:<24}{r['size']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}"
+              f"{r['rows_per_s'] or '-':>12}{r['mb_per_s'] or '-':>8}{r['peak_rss_mb']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="filas de los CSV sintéticos, separadas por comas")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--scenarios", default="", help="solo estos escenarios (separados por comas)")
+    parser.add_argument("--snowflake-latency-ms", type=float, default=5.0)
+    parser.add_argument("--sagemaker-latency-ms", type=float, default=20.0)
+    parser.add_argument("--athena-latency-ms", type=float, default=50.0)
+    parser.add_argument("--s3", choices=("memory", "moto"), default="memory")
+    parser.add_argument("--json", help="guardar el informe en este archivo")
+    parser.add_argument("--save-baseline", help="guardar el informe como línea base")
+    parser.add_argument("--compare", help="línea base con la que comparar")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    report = run_suite(
+        sizes=[int(s) for s in args.sizes.split(",") if s],
+        repeat=args.repeat,
+        snowflake_latency_ms=args.snowflake_latency_ms,
+        sagemaker_latency_ms=args.sagemaker_latency_ms,
+        athena_latency_ms=args.athena_latency_ms,
+        s3=args.s3,
+        scenarios=[s for s in args.scenarios.split(",") if s],
+    )
+    _print_table(report)
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"💾 Informe guardado en {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regresiones frente a {args.compare}:")
+            for r in regressions:
+                print(f"   {r['scenario']} ({r['size']}): {r['metric']} {r['baseline']} -> {r['current']}")
+            sys.exit(1)
+        print(f"✅ Sin regresiones frente a {args.compare} (tolerancia {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
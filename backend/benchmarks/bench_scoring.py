@@ -0,0 +1,55 @@
+"""
+Benchmark del motor de scoring local.
+
+Compara el scoring vectorizado (`score_frame`) con la implementación de
+referencia fila a fila y muestra filas/s.
+
+Uso (desde backend/):
+    python benchmarks/bench_scoring.py --rows 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.scoring import GRADE_POINTS, STAGE_POINTS, score_frame, score_lead  # noqa: E402
+
+
+def synthetic_leads(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "Asymmetrique_Activity_Score": rng.uniform(0, 20, rows),
+        "Lead_Grade": rng.choice(list(GRADE_POINTS) + ["D", None], rows),
+        "Lead_Stage": rng.choice(list(STAGE_POINTS) + ["Lead", None], rows),
+    })
+
+
+def _timed(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--reference-rows", type=int, default=100_000,
+                        help="filas para la referencia fila a fila (más lenta)")
+    args = parser.parse_args()
+
+    df = synthetic_leads(args.rows)
+    vectorized = _timed(lambda: score_frame(df))
+    print(f"vectorizado : {args.rows:>10} filas en {vectorized:.3f}s -> {args.rows / vectorized:,.0f} filas/s")
+
+    sample = df.head(args.reference_rows)
+    reference = _timed(lambda: [score_lead(*row) for row in sample.itertuples(index=False)])
+    print(f"fila a fila : {len(sample):>10} filas en {reference:.3f}s -> {len(sample) / reference:,.0f} filas/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Benchmark de la serialización de respuestas de lectura.
+
+Compara, para N filas como las de `/score-all-leads`:
+
+- dict: un dict por fila validado con `LeadScore` y serializado como lo
+  hace FastAPI (`jsonable_encoder` + json), el camino anterior.
+- columnar-json: `ColumnarResult` -> JSON por bloques.
+- columnar-arrow: `ColumnarResult` -> Arrow IPC.
+
+Cada camino se ejecuta en un subproceso para medir su pico de RSS por
+separado. Muestra filas/s y pico de RSS sobre la línea base del proceso.
+
+Uso (desde backend/):
+    python benchmarks/bench_serialization.py --rows 100000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from decimal import Decimal
+from typing import List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PATHS = ("dict", "columnar-json", "columnar-arrow")
+COLUMNS = ("id", "activity_score", "lead_grade", "lead_stage", "score")
+
+
+def synthetic_rows(rows: int) -> list:
+    grades = ("A", "B", "C", "D")
+    stages = ("Lead", "Interested", "Closed")
+    return [(660000 + i, Decimal(i % 20), grades[i % 4], stages[i % 3], (i % 100) / 100) for i in range(rows)]
+
+
+def _max_rss_mb() -> float:
+    # ru_maxrss está en KB en Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_dict(rows: list) -> int:
+    from fastapi.encoders import jsonable_encoder
+    from pydantic import BaseModel, TypeAdapter
+
+    class LeadScore(BaseModel):
+        id: Optional[int]
+        activity_score: Optional[float]
+        lead_grade: Optional[str]
+        lead_stage: Optional[str]
+        score: Optional[float]
+
+    records = [dict(zip(COLUMNS, row)) for row in rows]
+    models = TypeAdapter(List[LeadScore]).validate_python(records)
+    return len(json.dumps(jsonable_encoder(models)).encode("utf-8"))
+
+
+def _run_columnar(rows: list, arrow: bool) -> int:
+    from app.columnar import ColumnarResult
+
+    batch = 1000
+    result = ColumnarResult.from_batches(COLUMNS, (rows[i:i + batch] for i in range(0, len(rows), batch)))
+    return len(result.to_arrow_ipc() if arrow else result.to_json())
+
+
+def run_one(path: str, rows: int) -> dict:
+    data = synthetic_rows(rows)
+    if path == "columnar-arrow":
+        import pyarrow  # noqa: F401  (fuera de la medida, como en el servidor ya importado)
+    baseline = _max_rss_mb()
+    start = time.perf_counter()
+    if path == "dict":
+        size = _run_dict(data)
+    else:
+        size = _run_columnar(data, arrow=path == "columnar-arrow")
+    seconds = time.perf_counter() - start
+    return {"path": path, "rows": rows, "seconds": round(seconds, 4), "rows_per_s": round(rows / seconds),
+            "peak_rss_mb": round(_max_rss_mb() - baseline, 1), "bytes": size}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--only", choices=PATHS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.only:
+        print(json.dumps(run_one(args.only, args.rows)))
+        return
+
+    print(f"{'camino':<16}{'filas/s':>14}{'segundos':>11}{'pico RSS MB':>14}{'bytes':>14}")
+    for path in PATHS:
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--only", path, "--rows", str(args.rows)],
+                                check=True, capture_output=True, text=True).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{r['path']:<16}{r['rows_per_s']:>14,}{r['seconds']:>11}{r['peak_rss_mb']:>14}{r['bytes']:>14,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Benchmark del arranque en frío del handler de Lambda.
+
+Importa `app.main` varias veces en intérpretes nuevos con
+`python -X importtime`, muestra la mediana del tiempo de importación, los
+módulos más lentos y si se cargó alguna librería pesada. Con `--budget-ms`
+termina con código 1 si la mediana supera el presupuesto (útil en CI).
+
+Uso (desde backend/):
+    python benchmarks/bench_startup.py --runs 5 --budget-ms 1500
+"""
+import argparse
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.startup import HEAVY_MODULES, import_profile  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    args = parser.parse_args()
+
+    profiles = [import_profile(args.module) for _ in range(args.runs)]
+    totals = [p[args.module]["cumulative_ms"] for p in profiles]
+    median = statistics.median(totals)
+
+    print(f"{args.module}: mediana {median:.1f} ms (min {min(totals):.1f}, max {max(totals):.1f}, {args.runs} runs)")
+    last = profiles[-1]
+    print("Módulos más lentos (tiempo propio, última ejecución):")
+    for name, times in sorted(last.items(), key=lambda item: item[1]["self_ms"], reverse=True)[:args.top]:
+        print(f"  {times['self_ms']:8.1f} ms  {name}")
+
+    heavy = [name for name in HEAVY_MODULES if name in last]
+    if heavy:
+        print(f"⚠️ Librerías pesadas cargadas en el arranque: {', '.join(heavy)}")
+
+    if args.budget_ms is not None and (median > args.budget_ms or heavy):
+        print(f"❌ Arranque fuera de presupuesto ({args.budget_ms:.0f} ms)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Prueba de carga: throughput con peticiones concurrentes.
+
+Lanza ráfagas de peticiones con concurrencia creciente contra un servidor
+en marcha (o lo arranca con uvicorn y N workers con `--serve`) y muestra
+peticiones/s y latencias p50/p95 por nivel. Si el servicio no bloquea el
+event loop, el throughput debe crecer con la concurrencia hasta saturar
+los límites de IO_CONCURRENCY / CPU_CONCURRENCY y de workers.
+
+Uso (desde backend/):
+    python benchmarks/load_test.py --serve --workers 4 --path /score-lead --json '{"Lead_Grade": "A"}'
+    python benchmarks/load_test.py --url http://127.0.0.1:3000 --levels 1,8,32
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+async def _burst(client: httpx.AsyncClient, method: str, path: str, body, concurrency: int, requests: int):
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(requests):
+        queue.put_nowait(None)
+
+    async def _worker():
+        nonlocal errors
+        while not queue.empty():
+            queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                if response.status_code >= 500:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "rps": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+async def run(url: str, method: str, path: str, body, levels, requests: int):
+    limits = httpx.Limits(max_connections=max(levels))
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60) as client:
+        for concurrency in levels:
+            result = await _burst(client, method, path, body, concurrency, max(requests, concurrency))
+            print(f"c={result['concurrency']:>4}  {result['rps']:9.1f} req/s  "
+                  f"p50 {result['p50_ms']:7.1f} ms  p95 {result['p95_ms']:7.1f} ms  errores {result['errors']}")
+
+
+def _wait_ready(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/healthcheck").status_code == 200:
+                return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError("El servidor no arrancó a tiempo.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:3000")
+    parser.add_argument("--path", default="/healthcheck")
+    parser.add_argument("--method", default=None)
+    parser.add_argument("--json", default=None, help="cuerpo JSON (implica POST)")
+    parser.add_argument("--levels", default="1,2,4,8,16,32")
+    parser.add_argument("--requests", type=int, default=200, help="peticiones por nivel")
+    parser.add_argument("--serve", action="store_true", help="arranca uvicorn con app.main:app")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    body = json.loads(args.json) if args.json else None
+    method = args.method or ("POST" if body is not None else "GET")
+    levels = [int(level) for level in args.levels.split(",")]
+
+    server = None
+    if args.serve:
+        port = args.url.rsplit(":", 1)[-1]
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", port, "--workers", str(args.workers),
+             "--log-level", "warning"],
+            cwd=BACKEND_DIR,
+        )
+        _wait_ready(args.url)
+    try:
+        print(f"{method} {args.url}{args.path} ({args.workers} worker(s))" if args.serve else f"{method} {args.url}{args.path}")
+        asyncio.run(run(args.url, method, args.path, body, levels, args.requests))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Sustitutos locales de los servicios externos para los benchmarks.
+
+- `LocalS3`: S3 en memoria (put/get/head, multipart, listados, URLs
+  firmadas). Con `s3="moto"` se usa moto en su lugar si está instalado.
+- Snowflake: conexiones falsas con latencia configurable por sentencia que
+  responden a INFORMATION_SCHEMA, las consultas de LEADS_FINAL (keyset y
+  scoring) y a PUT/COPY.
+- `StubSageMaker` y `StubAthena`: respuestas fijas con latencia.
+
+`install()` los engancha en los módulos de `app` (los mismos puntos que
+parchean los tests) y devuelve un objeto con los sustitutos.
+"""
+import io
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional
+
+LEADS_FINAL_COLUMNS = ["FILENAME", "LOAD_TS", "Lead_Number", "Lead_Grade", "Lead_Stage",
+                       "Asymmetrique_Activity_Score", "City"]
+GRADES = ("A", "B", "C", "D")
+STAGES = ("Lead", "Interested", "Closed")
+
+
+class LocalS3:
+    """
+    Cliente S3 en memoria con la parte de la API que usa la aplicación.
+    """
+
+    def __init__(self):
+        self.objects = {}
+        self._uploads = {}
+        self._lock = threading.Lock()
+
+    def head_bucket(self, Bucket):
+        return {}
+
+    def create_bucket(self, **kwargs):
+        return {}
+
+    def put_object(self, Bucket, Key, Body):
+        data = Body if isinstance(Body, bytes) else Body.read()
+        with self._lock:
+            self.objects[Key] = bytes(data)
+        return {"ETag": f'"{len(data)}"'}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, **kwargs):
+        self.put_object(Bucket, Key, Fileobj.read())
+
+    def get_object(self, Bucket, Key):
+        from botocore.exceptions import ClientError
+        with self._lock:
+            if Key not in self.objects:
+                raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+            data = self.objects[Key]
+        return {"Body": io.BytesIO(data), "ContentLength": len(data)}
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.get_object(Bucket, Key)["Body"].getvalue())}
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self.objects.pop(Key, None)
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        with self._lock:
+            upload_id = f"u{len(self._uploads) + 1}-{time.monotonic_ns()}"
+            self._uploads[upload_id] = {}
+        return {"UploadId": upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self._lock:
+            self._uploads[UploadId][PartNumber] = bytes(Body)
+        return {"ETag": f'"{UploadId}-{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        with self._lock:
+            parts = self._uploads.pop(UploadId)
+            self.objects[Key] = b"".join(parts[p["PartNumber"]] for p in MultipartUpload["Parts"])
+        return {}
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+
+    def list_objects_v2(self, Bucket, Prefix="", **kwargs):
+        with self._lock:
+            keys = sorted(k for k in self.objects if k.startswith(Prefix))
+        return {"Contents": [{"Key": k, "Size": len(self.objects[k])} for k in keys], "KeyCount": len(keys)}
+
+    def get_paginator(self, operation):
+        s3 = self
+
+        class _Paginator:
+            def paginate(self, **kwargs):
+                yield getattr(s3, operation)(**kwargs)
+
+        return _Paginator()
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn=3600, **kwargs):
+        return f"http://local-s3/{Params['Bucket']}/{Params['Key']}?expires={ExpiresIn}"
+
+
+class _Cursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._rows = []
+        self._pos = 0
+
+    def execute(self, sql, params=None):
+        if self._conn.latency:
+            time.sleep(self._conn.latency)
+        self._rows = self._conn.respond(sql, params or {})
+        self._pos = 0
+        return self
+
+    def fetchone(self):
+        rows = self.fetchmany(1)
+        return rows[0] if rows else None
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchall(self):
+        return self.fetchmany(len(self._rows) - self._pos)
+
+    def close(self):
+        pass
+
+
+class FakeSnowflake:
+    """
+    Fábrica de conexiones falsas sobre una LEADS_FINAL sintética de
+    `table_rows` filas. `latency` se aplica a cada `execute`.
+    """
+
+    def __init__(self, table_rows: int = 10_000, latency: float = 0.0):
+        self.latency = latency
+        self.table = [(660000 + i, GRADES[i % 4], STAGES[i % 3], float(i % 20), f"City {i % 50}")
+                      for i in range(table_rows)]
+        self.statements = 0
+        self.loaded_at = "2026-01-01 00:00:00"
+
+    def __call__(self):
+        return _Connection(self)
+
+    def respond(self, sql: str, params: dict) -> list:
+        self.statements += 1
+        if "INFORMATION_SCHEMA.COLUMNS" in sql:
+            return [(name,) for name in LEADS_FINAL_COLUMNS]
+        if "INFORMATION_SCHEMA.TABLES" in sql:
+            return [(self.loaded_at,)]
+        statement = sql.lstrip().upper()
+        if statement.startswith("PUT"):
+            # Mismas columnas que el PUT real: (origen, destino, ...)
+            source = sql.split("file://", 1)[1].split()[0].rsplit("/", 1)[-1]
+            return [(source, f"{source}.gz", 0, 0, "NONE", "GZIP", "UPLOADED", "")]
+        if statement.startswith("COPY"):
+            self.loaded_at = time.strftime("%Y-%m-%d %H:%M:%S")
+            return [("ok",)]
+        if "SCORING_UDF" in sql:
+            limit = params.get("limit", len(self.table))
+            return [(n, activity, grade, stage, activity / 20) for n, grade, stage, activity, _ in self.table[:limit]]
+        if "LEADS_FINAL" in sql.upper():
+            rows = self.table
+            after = params.get("after")
+            if after is not None:
+                # Lead_Number es consecutivo: la posición se calcula directamente
+                start = max(0, min(len(rows), after - 660000 + 1))
+                rows = rows[start:]
+            if params.get("limit") is not None:
+                rows = rows[:params["limit"]]
+            return [(n, grade, stage, activity, city) for n, grade, stage, activity, city in rows]
+        return []
+
+
+class _Connection:
+    def __init__(self, source: FakeSnowflake):
+        self._source = source
+        self.latency = source.latency
+        self.closed = False
+
+    def cursor(self):
+        return _Cursor(self)
+
+    def respond(self, sql, params):
+        return self._source.respond(sql, params)
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+class _Body:
+    def __init__(self, data: bytes):
+        self._data = data
+
+    def read(self) -> bytes:
+        return self._data
+
+
+class StubSageMaker:
+    """
+    Endpoint de SageMaker simulado: una predicción por lead.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.invocations = 0
+
+    def invoke_endpoint(self, EndpointName, ContentType, Body):
+        if self.latency:
+            time.sleep(self.latency)
+        self.invocations += 1
+        payload = json.loads(Body)
+        if isinstance(payload, list):
+            result = {"predictions": [{"score": 0.5} for _ in payload]}
+        else:
+            result = {"score": 0.5}
+        return {"Body": _Body(json.dumps(result).encode("utf-8"))}
+
+
+class StubAthena:
+    """
+    Athena simulada: cada consulta termina en el primer sondeo y devuelve
+    un único valor.
+    """
+
+    def __init__(self, latency: float = 0.0, value: str = "10000"):
+        self.latency = latency
+        self.value = value
+        self.queries = 0
+
+    def start_query_execution(self, **kwargs):
+        self.queries += 1
+        return {"QueryExecutionId": f"q{self.queries}"}
+
+    def get_query_execution(self, QueryExecutionId):
+        if self.latency:
+            time.sleep(self.latency)
+        return {"QueryExecution": {"Status": {"State": "SUCCEEDED"}}}
+
+    def get_query_results(self, QueryExecutionId, MaxResults, NextToken=None):
+        return {"ResultSet": {
+            "Rows": [{"Data": [{"VarCharValue": "total"}]}, {"Data": [{"VarCharValue": self.value}]}],
+            "ResultSetMetadata": {"ColumnInfo": [{"Name": "total", "Type": "bigint"}]},
+        }}
+
+
+class StandIns:
+    def __init__(self, s3, snowflake: FakeSnowflake, sagemaker: StubSageMaker, athena: StubAthena):
+        self.s3 = s3
+        self.snowflake = snowflake
+        self.sagemaker = sagemaker
+        self.athena = athena
+
+
+@contextmanager
+def install(table_rows: int = 10_000, snowflake_latency: float = 0.0, sagemaker_latency: float = 0.0,
+            athena_latency: float = 0.0, s3: str = "memory"):
+    """
+    Sustituye los clientes de S3, Snowflake, SageMaker y Athena de la
+    aplicación mientras dure el bloque y los restaura al salir.
+    """
+    from app import aggregates, athena_client, sagemaker_client, snowflake_client, upload_s3
+    from app.result_cache import result_cache
+    from app.schema_cache import invalidate
+
+    mock = None
+    if s3 == "moto":
+        import boto3
+        from moto import mock_aws
+        mock = mock_aws()
+        mock.start()
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket=upload_s3.bucket)
+    else:
+        s3_client = LocalS3()
+
+    snowflake = FakeSnowflake(table_rows, snowflake_latency)
+    stand_ins = StandIns(s3_client, snowflake, StubSageMaker(sagemaker_latency), StubAthena(athena_latency))
+    saved = [
+        (upload_s3, "s3", upload_s3.s3),
+        (upload_s3, "_bucket_checked", upload_s3._bucket_checked),
+        (snowflake_client, "_pool", snowflake_client._pool),
+        (sagemaker_client, "sagemaker_runtime", sagemaker_client.sagemaker_runtime),
+        (athena_client, "athena", athena_client.athena),
+    ]
+    upload_s3.s3 = s3_client
+    upload_s3._bucket_checked = True
+    snowflake_client._pool = snowflake_client.ConnectionPool(factory=snowflake)
+    sagemaker_client.sagemaker_runtime = stand_ins.sagemaker
+    athena_client.athena = stand_ins.athena
+    invalidate()
+    result_cache.invalidate()
+    result_cache.reset_stats()
+    # Los resúmenes de agregados en memoria son de otro S3
+    aggregates._stores.clear()
+    try:
+        yield stand_ins
+    finally:
+        snowflake_client._pool.close_all()
+        for module, name, value in saved:
+            setattr(module, name, value)
+        invalidate()
+        result_cache.invalidate()
+        aggregates._stores.clear()
+        if mock is not None:
+            mock.stop()
+
+
+def synthetic_csv(path: str, rows: int, bad_every: Optional[int] = None, seed: int = 0) -> int:
+    """
+    Escribe un CSV de leads de `rows` filas en `path` sin tenerlo entero en
+    memoria. Con `bad_every` una de cada N filas lleva un campo de menos.
+    Devuelve el tamaño en bytes.
+    """
+    import random
+
+    rng = random.Random(seed)
+    header = "Prospect ID,Lead Number,Lead Origin,Lead Source,Lead Grade,Lead Stage,Asymmetrique Activity Score,City\n"
+    origins = ("API", "Landing Page Submission", "Lead Add Form")
+    sources = ("Google", "Direct Traffic", "Olark Chat", "")
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(header)
+        batch: List[str] = []
+        for i in range(rows):
+            line = (f"p-{i},{660000 + i},{origins[i % 3]},{sources[rng.randrange(4)]},"
+                    f"{GRADES[i % 4] if i % 7 else ''},{STAGES[i % 3]},{rng.randint(0, 20)},City {i % 50}")
+            if bad_every and i % bad_every == bad_every - 1:
+                line = line.rsplit(",", 1)[0]
+            batch.append(line)
+            if len(batch) == 10_000:
+                f.write("\n".join(batch) + "\n")
+                batch.clear()
+        if batch:
+            f.write("\n".join(batch) + "\n")
+        return f.tell()
@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+
+class FakeCursor:
+    """Cursor mínimo compatible con el de snowflake-connector-python."""
+
+    def __init__(self, conn):
+        self._conn = conn
+        self._rows = []
+        self._pos = 0
+        self.description = None
+
+    def execute(self, sql, params=None):
+        if self._conn.latency:
+            time.sleep(self._conn.latency)
+        self._conn.executed.append((sql, params))
+        result = self._conn.responder(sql, params) if self._conn.responder else []
+        # El responder puede devolver filas o (columnas, filas)
+        if isinstance(result, tuple):
+            columns, rows = result
+            self.description = [(name,) for name in columns]
+        else:
+            rows = result
+        self._rows = list(rows)
+        self._pos = 0
+        return self
+
+    def fetchone(self):
+        if self._pos >= len(self._rows):
+            return None
+        row = self._rows[self._pos]
+        self._pos += 1
+        return row
+
+    def fetchmany(self, size=1):
+        rows = self._rows[self._pos:self._pos + size]
+        self._pos += len(rows)
+        return rows
+
+    def fetchall(self):
+        rows = self._rows[self._pos:]
+        self._pos = len(self._rows)
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeSnowflakeConnection:
+    """Conexión falsa de Snowflake: registra las sentencias y responde con `responder(sql, params)`."""
+
+    def __init__(self, responder=None, latency: float = 0.0):
+        self.responder = responder
+        self.latency = latency
+        self.executed = []
+        self.closed = False
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def is_closed(self):
+        return self.closed
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_snowflake(monkeypatch):
+    """
+    Sustituye el pool de Snowflake del proceso por uno que crea conexiones
+    falsas. Devuelve un objeto para fijar el `responder` y ver las conexiones.
+    """
+    from app import snowflake_client
+    from app.result_cache import result_cache
+    from app.schema_cache import invalidate
+
+    class _Factory:
+        def __init__(self):
+            self.responder = None
+            self.latency = 0.0
+            self.connections = []
+
+        def __call__(self):
+            conn = FakeSnowflakeConnection(self.responder, self.latency)
+            self.connections.append(conn)
+            return conn
+
+        @property
+        def executed(self):
+            return [stmt for conn in self.connections for stmt in conn.executed]
+
+    factory = _Factory()
+    pool = snowflake_client.ConnectionPool(factory=factory, size=2)
+    monkeypatch.setattr(snowflake_client, "_pool", pool)
+    factory.pool = pool
+    invalidate()
+    result_cache.invalidate()
+    result_cache.reset_stats()
+    return factory
+
+
+@pytest.fixture(autouse=True)
+def prediction_cache(monkeypatch):
+    """
+    Caché de predicciones vacía en cada test: los payloads se repiten entre
+    tests y una respuesta cacheada ocultaría las llamadas al modelo.
+    """
+    from app import prediction_cache as module
+
+    cache = module.PredictionCache()
+    monkeypatch.setattr(module, "prediction_cache", cache)
+    return cache
@@ -0,0 +1,122 @@
+import pandas as pd
+import pytest
+from fastapi.testclient import TestClient
+
+from app import aggregates, athena_client, ingestion, upload_s3
+from app.aggregates import FileAggregate, get_store
+from app.athena_client import AthenaClient
+from app.main import app
+from tests.test_athena_client import StubAthena
+from tests.test_exports import ExportS3
+from tests.test_ingestion import _Queue, _responder
+
+
+class AggregateS3(ExportS3):
+    """ExportS3 con listados paginados."""
+
+    def get_paginator(self, operation):
+        s3 = self
+
+        class _Paginator:
+            def paginate(self, Bucket, Prefix=""):
+                yield {"Contents": [{"Key": k} for k in sorted(s3.objects) if k.startswith(Prefix)]}
+
+        return _Paginator()
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    fake = AggregateS3()
+    monkeypatch.setattr(upload_s3, "s3", fake)
+    monkeypatch.setattr(upload_s3, "_bucket_checked", True)
+    monkeypatch.setattr(aggregates, "_stores", {})
+    return fake
+
+
+def _frame():
+    return pd.DataFrame({
+        "Lead_Number": ["1", "2", "3", "4"],
+        "Lead_Grade": ["A", "A", None, "D"],
+        "Lead_Stage": ["Customer", "Lead", "Lead", "Lead"],
+        "Asymmetrique_Activity_Score": ["20", "0", "10", "5"],
+    })
+
+
+def _aggregate(frame=None) -> FileAggregate:
+    aggregate = FileAggregate()
+    aggregate.add(frame if frame is not None else _frame())
+    return aggregate
+
+
+def test_file_aggregate_counts_grades_stages_and_score_buckets():
+    counts = _aggregate().to_dict()
+    assert counts["rows"] == 4
+    assert counts["by_grade"] == {"A": 2, "D": 1, "null": 1}
+    assert counts["by_stage"] == {"Customer": 1, "Lead": 3}
+    # 20+50=70; 0+50=50; sin grado -> 10; 5 (D no suma)
+    assert counts["by_score"] == {"60-80": 1, "40-60": 1, "0-20": 2}
+
+
+def test_record_replaces_file_and_rebuild_uses_partials(s3):
+    store = get_store("loaded")
+    store.record("a.csv", _aggregate())
+    store.record("b.csv", _aggregate(_frame().head(1)))
+    store.record("a.csv", _aggregate(_frame().head(2)))
+    summary = store.summary()
+    assert summary["totals"]["rows"] == 3
+    assert summary["files"] == {"a.csv": 2, "b.csv": 1}
+    assert summary["totals"]["by_grade"] == {"A": 3}
+
+    # Otra instancia pisó el resumen: los parciales lo recomponen
+    del s3.objects["aggregates/loaded/summary.json"]
+    store.invalidate()
+    assert store.summary()["totals"]["rows"] == 0
+    assert store.rebuild()["totals"] == summary["totals"]
+
+
+def test_ingestion_updates_counts_served_without_athena(fake_snowflake, s3, monkeypatch):
+    monkeypatch.setattr(ingestion, "_jobs", {})
+    monkeypatch.setattr(ingestion, "_queue", _Queue())
+    fake_snowflake.responder = _responder()
+    csv = _frame().to_csv(index=False).replace("_", " ").encode()
+    client = TestClient(app)
+    client.post("/ingestions", params={"dedup": False}, files={"file": ("leads.csv", csv, "text/csv")})
+    ingestion.get_queue().drain()
+
+    athena = StubAthena([("999",)], [("total", "bigint")], running_polls=0)
+    monkeypatch.setattr(athena_client, "_client", AthenaClient(client=athena))
+    count = client.get("/lead-count").json()
+    assert count["total"] == 4 and count["source"] == "aggregate"
+    assert athena.started == []
+    body = client.get("/lead-breakdown").json()
+    assert body["by_stage"] == {"Customer": 1, "Lead": 3}
+    assert body["files"] == 1
+    assert client.get("/lead-breakdown", params={"scope": "cleaned"}).json()["total"] == 0
+
+
+def test_reconcile_reports_drift_and_repairs(fake_snowflake, s3):
+    get_store("loaded").record("a.csv", _aggregate())
+    # LEADS_FINAL tiene dos filas más (cargadas por Snowpipe) que los parciales
+    final = [("A", "Customer", 80, 1), ("A", "Lead", 40, 1), (None, "Lead", None, 1), ("D", "Lead", 20, 1),
+             ("B", "Lead", 40, 2)]
+    fake_snowflake.responder = lambda sql, params: final
+
+    client = TestClient(app)
+    report = client.post("/aggregates/reconcile").json()
+    assert report["ok"] is False
+    assert report["checks"]["rows"] == {"expected": 6, "actual": 4, "ok": False}
+    assert report["checks"]["by_stage"]["expected"] == {"Customer": 1, "Lead": 5}
+    assert all("LEADS_FINAL" in sql and "leads_raw" not in sql for sql, _ in fake_snowflake.executed)
+
+    report = client.post("/aggregates/reconcile", params={"repair": True}).json()
+    assert report["repaired"] is True
+    aggregate = report["aggregate"]
+    assert aggregate["total"] == 6
+    # Total y desgloses salen de la misma tabla: cuadran tras el ajuste
+    for name in aggregates.BREAKDOWNS:
+        assert sum(aggregate[name].values()) == aggregate["total"]
+    assert aggregate["by_score"] == {"80-100": 1, "40-60": 3, "20-40": 1, "null": 1}
+    assert client.post("/aggregates/reconcile").json()["ok"] is True
+    # El ajuste sobrevive a una reconstrucción y a nuevos archivos
+    get_store("loaded").record("b.csv", _aggregate(_frame().head(1)))
+    assert get_store("loaded").rebuild()["totals"]["rows"] == 7
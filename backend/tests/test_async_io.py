@@ -0,0 +1,60 @@
+import asyncio
+import threading
+import time
+
+import httpx
+from anyio import CapacityLimiter
+
+from app import concurrency, sagemaker_client
+from app.main import app
+
+
+class SlowModel:
+    """Endpoint de SageMaker simulado con latencia bloqueante fija."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, payload):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return {"score": payload["id"]}
+
+
+async def _score_concurrently(n):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.post("/score-lead", json={"id": i}) for i in range(n)))
+        return responses, time.perf_counter() - start
+
+
+def test_blocking_scoring_does_not_serialize_requests(monkeypatch):
+    model = SlowModel(0.2)
+    monkeypatch.setattr(sagemaker_client, "call_sagemaker", model)
+
+    responses, elapsed = asyncio.run(_score_concurrently(8))
+
+    assert [r.json()["score"] for r in responses] == list(range(8))
+    # En serie serían 1.6 s
+    assert elapsed < 0.8
+    assert model.peak > 1
+
+
+def test_io_concurrency_limit_is_enforced(monkeypatch):
+    model = SlowModel(0.05)
+    monkeypatch.setattr(sagemaker_client, "call_sagemaker", model)
+    monkeypatch.setattr(concurrency, "io_limiter", CapacityLimiter(2))
+
+    responses, _ = asyncio.run(_score_concurrently(6))
+
+    assert all(r.status_code == 200 for r in responses)
+    assert model.peak == 2
+    assert concurrency.stats()["io"] == {"in_use": 0, "limit": 2, "waiting": 0}
@@ -0,0 +1,111 @@
+import asyncio
+from datetime import date
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import athena_client
+from app.athena_client import AthenaClient, AthenaQueryError
+from app.main import app
+
+
+class StubAthena:
+    """Cliente boto3 de Athena simulado: la consulta termina tras `running_polls` sondeos."""
+
+    def __init__(self, rows, columns, running_polls=3, page_size_cap=None, final_state="SUCCEEDED"):
+        self.rows = rows
+        self.columns = columns
+        self.running_polls = running_polls
+        self.final_state = final_state
+        self.started = []
+        self.polls = 0
+        self.result_calls = []
+
+    def start_query_execution(self, **kwargs):
+        self.started.append(kwargs)
+        return {"QueryExecutionId": f"q{len(self.started)}"}
+
+    def get_query_execution(self, QueryExecutionId):
+        self.polls += 1
+        state = "RUNNING" if self.polls <= self.running_polls else self.final_state
+        return {"QueryExecution": {"Status": {"State": state, "StateChangeReason": "boom"}}}
+
+    def get_query_results(self, QueryExecutionId, MaxResults, NextToken=None):
+        self.result_calls.append(NextToken)
+        header = [{"Data": [{"VarCharValue": name} for name, _ in self.columns]}]
+        data = [{"Data": [{"VarCharValue": v} if v is not None else {} for v in row]} for row in self.rows]
+        everything = header + data
+        start = int(NextToken or 0)
+        page = everything[start:start + MaxResults]
+        next_start = start + MaxResults
+        response = {"ResultSet": {"Rows": page, "ResultSetMetadata": {
+            "ColumnInfo": [{"Name": name, "Type": t} for name, t in self.columns]}}}
+        if next_start < len(everything):
+            response["NextToken"] = str(next_start)
+        return response
+
+
+COLUMNS = [("lead_number", "bigint"), ("score", "double"), ("grade", "varchar"), ("day", "date")]
+ROWS = [(str(660000 + i), str(i / 10), "A", "2024-01-02") for i in range(25)] + [("1", None, None, None)]
+
+
+def test_iter_rows_paginates_with_types():
+    stub = StubAthena(ROWS, COLUMNS)
+    client = AthenaClient(client=stub, poll_initial=0.001, poll_max=0.004)
+    rows = asyncio.run(client.fetch_all("SELECT * FROM leads_raw"))
+
+    assert len(rows) == 26
+    assert rows[0] == {"lead_number": 660000, "score": 0.0, "grade": "A", "day": date(2024, 1, 2)}
+    assert rows[-1] == {"lead_number": 1, "score": None, "grade": None, "day": None}
+
+
+def test_page_size_controls_pagination():
+    stub = StubAthena(ROWS, COLUMNS, running_polls=0)
+    client = AthenaClient(client=stub)
+
+    async def _collect():
+        return [row async for row in client.iter_rows("SELECT 1", page_size=10)]
+
+    assert len(asyncio.run(_collect())) == 26
+    assert stub.result_calls == [None, "10", "20"]
+
+
+def test_polling_backs_off_and_fails():
+    stub = StubAthena([], COLUMNS, running_polls=4, final_state="FAILED")
+    client = AthenaClient(client=stub, poll_initial=0.001, poll_max=0.002)
+    with pytest.raises(AthenaQueryError):
+        asyncio.run(client.scalar("SELECT COUNT(*) FROM leads_raw"))
+    assert stub.polls == 5
+    # La ejecución fallida no se reutiliza
+    stub.polls, stub.final_state = 0, "SUCCEEDED"
+    stub.rows = [("7",)]
+    stub.columns = [("total", "bigint")]
+    assert asyncio.run(client.scalar("SELECT COUNT(*) FROM leads_raw")) == 7
+    assert len(stub.started) == 2
+
+
+def test_repeated_scalar_is_cached():
+    stub = StubAthena([("42",)], [("total", "bigint")], running_polls=1)
+    client = AthenaClient(client=stub, poll_initial=0.001)
+
+    async def _twice():
+        return await client.scalar("SELECT COUNT(*)  FROM leads_raw"), await client.scalar("SELECT COUNT(*) FROM leads_raw")
+
+    assert asyncio.run(_twice()) == (42, 42)
+    assert len(stub.started) == 1
+    assert stub.started[0]["ResultReuseConfiguration"]["ResultReuseByAgeConfiguration"]["Enabled"]
+
+
+def test_lead_count_endpoint(monkeypatch):
+    stub = StubAthena([("123",)], [("total", "bigint")], running_polls=0)
+    monkeypatch.setattr(athena_client, "_client", AthenaClient(client=stub))
+    assert TestClient(app).get("/lead-count", params={"source": "athena"}).json() == {"total": 123, "source": "athena"}
+
+
+def test_lead_count_endpoint_returns_minus_one_on_any_failure(monkeypatch):
+    class _Broken(StubAthena):
+        def start_query_execution(self, **kwargs):
+            raise RuntimeError("Unable to locate credentials")
+
+    monkeypatch.setattr(athena_client, "_client", AthenaClient(client=_Broken([], [])))
+    assert TestClient(app).get("/lead-count", params={"source": "athena"}).json() == {"total": -1, "source": "athena"}
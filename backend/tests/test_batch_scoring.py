@@ -0,0 +1,105 @@
+import io
+import json
+import threading
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+from fastapi.testclient import TestClient
+
+from app import sagemaker_client
+from app.main import app
+
+
+class FakeEndpoint:
+    """Endpoint SageMaker local: puntúa `activity_score / 100` y simula throttling."""
+
+    def __init__(self, throttle_every: int = 0, fail_on: str = None, latency: float = 0.0):
+        self.throttle_every = throttle_every
+        self.fail_on = fail_on
+        self.latency = latency
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def invoke_endpoint(self, EndpointName, ContentType, Body):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(self.latency)
+            if self.throttle_every and call % self.throttle_every == 0:
+                raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "slow down"},
+                                   "ResponseMetadata": {"HTTPStatusCode": 400}}, "InvokeEndpoint")
+            leads = json.loads(Body)
+            if self.fail_on and any(lead.get("id") == self.fail_on for lead in leads):
+                raise ClientError({"Error": {"Code": "ModelError", "Message": "bad lead"}}, "InvokeEndpoint")
+            predictions = [float(lead["activity_score"]) / 100 for lead in leads]
+            return {"Body": io.BytesIO(json.dumps(predictions).encode())}
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    fake = FakeEndpoint(latency=0.005)
+    monkeypatch.setattr(sagemaker_client, "sagemaker_runtime", fake)
+    monkeypatch.setattr(sagemaker_client, "RETRY_BASE_DELAY", 0.001)
+    return fake
+
+
+def _leads(n):
+    return [{"id": f"l{i}", "activity_score": i} for i in range(n)]
+
+
+def test_results_keep_order_and_bound_concurrency(endpoint):
+    results = list(sagemaker_client.score_leads_batched(_leads(1000), batch_size=50, max_in_flight=3))
+
+    assert [r["index"] for r in results] == list(range(1000))
+    assert results[999]["prediction"] == pytest.approx(9.99)
+    assert endpoint.calls == 20
+    assert endpoint.max_in_flight <= 3
+
+
+def test_throttling_is_retried(endpoint):
+    endpoint.throttle_every = 3
+    results = list(sagemaker_client.score_leads_batched(_leads(100), batch_size=10, max_in_flight=2))
+    assert all("prediction" in r for r in results)
+    assert endpoint.calls > 10
+
+
+def test_failed_batch_reports_error_per_lead(endpoint):
+    endpoint.fail_on = "l12"
+    results = list(sagemaker_client.score_leads_batched(_leads(30), batch_size=10, max_in_flight=2))
+    errors = [r["index"] for r in results if "error" in r]
+    assert errors == list(range(10, 20))
+
+
+def test_batch_endpoint_accepts_json_lines_and_csv(endpoint):
+    client = TestClient(app)
+    body = "\n".join(json.dumps(lead) for lead in _leads(5)) + "\nnot-json\n"
+    response = client.post("/score-leads/batch?batch_size=2", content=body,
+                           headers={"content-type": "application/x-ndjson"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [l["index"] for l in lines] == list(range(6))
+    assert lines[4]["prediction"] == pytest.approx(0.04)
+    assert "error" in lines[5]
+
+    csv_body = "id,activity_score\na,10\nb,20\n"
+    response = client.post("/score-leads/batch", content=csv_body, headers={"content-type": "text/csv"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [l["prediction"] for l in lines] == [pytest.approx(0.1), pytest.approx(0.2)]
+
+
+def test_batch_endpoint_reports_array_items_that_are_not_objects(endpoint):
+    response = TestClient(app).post("/score-leads/batch", content=json.dumps([_leads(2)[0], 2, "x", _leads(2)[1]]),
+                                    headers={"content-type": "application/json"})
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [l["index"] for l in lines] == [0, 1, 2, 3]
+    assert ["error" in l for l in lines] == [False, True, True, False]
+    assert "objeto JSON" in lines[1]["error"]
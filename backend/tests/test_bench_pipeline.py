@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from bench_pipeline import compare, run_suite  # noqa: E402
+
+
+def test_suite_runs_every_scenario_against_stand_ins():
+    report = run_suite([200], repeat=1, snowflake_latency_ms=0, sagemaker_latency_ms=0, athena_latency_ms=0)
+
+    scenarios = {r["scenario"] for r in report["results"]}
+    assert {"clean-upload-csv", "clean-upload-parquet", "upload-and-load", "leads-stream-ndjson",
+            "score-all-leads-cold", "score-leads-batch", "score-lead", "lead-count"} <= scenarios
+    assert all(r["p50_ms"] > 0 for r in report["results"])
+    assert report["meta"]["stand_ins"]["sagemaker_invocations"] > 0
+
+
+def test_compare_flags_only_regressions_beyond_tolerance():
+    def report(p50, rows_per_s):
+        return {"results": [{"scenario": "clean-upload-csv", "size": 1000, "p50_ms": p50, "p95_ms": p50,
+                             "peak_rss_mb": 1.0, "rows_per_s": rows_per_s}]}
+
+    baseline = report(100.0, 10_000)
+    assert compare(report(110.0, 9_500), baseline, tolerance=0.2) == []
+    regressions = compare(report(150.0, 5_000), baseline, tolerance=0.2)
+    assert {r["metric"] for r in regressions} == {"p50_ms", "p95_ms", "rows_per_s"}
@@ -0,0 +1,67 @@
+"""
+Pruebas de subida masiva contra LocalStack (S3_ENDPOINT_URL, por defecto
+http://localhost:4566). Se omiten si LocalStack no está levantado:
+
+    docker-compose up localstack
+"""
+import io
+import socket
+import zipfile
+from urllib.parse import urlparse
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import upload_s3
+from app.main import app
+
+
+def _localstack_available() -> bool:
+    url = urlparse(upload_s3.get_s3().meta.endpoint_url)
+    try:
+        with socket.create_connection((url.hostname, url.port or 80), timeout=0.5):
+            return True
+    except OSError:
+        return False
+
+
+pytestmark = pytest.mark.skipif(not _localstack_available(), reason="LocalStack no disponible")
+
+
+@pytest.fixture(autouse=True)
+def fresh_bucket_check(monkeypatch):
+    monkeypatch.setattr(upload_s3, "_bucket_checked", False)
+
+
+def test_upload_files_in_parallel_with_multipart(monkeypatch):
+    calls = []
+    original = upload_s3.get_s3().head_bucket
+    monkeypatch.setattr(upload_s3.get_s3(), "head_bucket", lambda **kw: calls.append(kw) or original(**kw))
+
+    big = b"a,b\n" + b"1,2\n" * (5 * 1024 * 1024)  # ~20 MB -> multipart
+    files = [(f"bulk/lead_{i}.csv", io.BytesIO(b"a,b\n1,2\n")) for i in range(5)] + [("bulk/big.csv", io.BytesIO(big))]
+    results = upload_s3.upload_files(files, prefix="tests")
+
+    assert [r["key"] for r in results] == [f"tests/{name}" for name, _ in files]
+    assert all("error" not in r and r["etag"] for r in results)
+    assert results[-1]["size"] == len(big)
+    assert "-" in results[-1]["etag"]  # ETag de subida multipart
+    upload_s3.upload_files([("again.csv", io.BytesIO(b"x"))])
+    assert len(calls) == 1
+
+
+def test_bulk_upload_endpoint_expands_zip():
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("one.csv", "a\n1\n")
+        zf.writestr("two.csv", "a\n2\n")
+    client = TestClient(app)
+    response = client.post(
+        "/bulk-upload?prefix=zipped",
+        files=[("files", ("leads.zip", archive.getvalue(), "application/zip")),
+               ("files", ("plain.csv", b"a\n3\n", "text/csv"))],
+    )
+    body = response.json()
+    assert response.status_code == 200
+    assert body["count"] == 3 and body["failed"] == 0
+    assert {f["key"] for f in body["files"]} == {"zipped/one.csv", "zipped/two.csv", "zipped/plain.csv"}
@@ -0,0 +1,147 @@
+import io
+
+import pandas as pd
+import pytest
+
+from app import upload_s3
+from app.cleaning import clean_csv_to_s3, detect_encoding, iter_cleaned_csv
+
+
+class FakeS3:
+    """Cliente S3 en memoria con la API multipart mínima que usa upload_stream."""
+
+    def __init__(self):
+        self.objects = {}
+        self.uploads = {}
+        self.part_sizes = []
+        self.cors_rules = None
+        self.cors_puts = []
+
+    def head_bucket(self, Bucket):
+        return {}
+
+    def get_bucket_cors(self, Bucket):
+        from botocore.exceptions import ClientError
+
+        if self.cors_rules is None:
+            raise ClientError({"Error": {"Code": "NoSuchCORSConfiguration"}}, "GetBucketCors")
+        return {"CORSRules": self.cors_rules}
+
+    def put_bucket_cors(self, Bucket, CORSConfiguration):
+        self.cors_puts.append(CORSConfiguration)
+        self.cors_rules = CORSConfiguration["CORSRules"]
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, Bucket, Key):
+        self.uploads["u1"] = {}
+        return {"UploadId": "u1"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        self.part_sizes.append(len(Body))
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        numbers = [p["PartNumber"] for p in MultipartUpload["Parts"]]
+        self.objects[Key] = b"".join(parts[n] for n in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId, None)
+
+
+@pytest.fixture
+def fake_s3(monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(upload_s3, "s3", fake)
+    return fake
+
+
+def _sample_csv(rows: int, encoding: str = "utf-8") -> bytes:
+    lines = [" Prospect ID,Lead Number,Lead Grade ,City"]
+    for i in range(rows):
+        grade = "" if i % 7 == 0 else "A"
+        lines.append(f"p-{i},{660000 + i},{grade},Málaga")
+    return ("\n".join(lines) + "\n").encode(encoding)
+
+
+def test_detect_encoding_uses_bounded_sample():
+    data = io.BytesIO(_sample_csv(200, "latin1"))
+    data.seek(10)
+    encoding = detect_encoding(data, sample_size=4096)
+    assert data.tell() == 10
+    assert "Málaga".encode("latin1").decode(encoding) == "Málaga"
+
+
+def test_chunked_output_matches_full_read():
+    raw = _sample_csv(1000)
+    expected = pd.read_csv(io.BytesIO(raw), dtype=str).fillna("")
+    expected.columns = [c.strip().replace(" ", "_") for c in expected.columns]
+
+    stats = {}
+    cleaned = b"".join(iter_cleaned_csv(io.BytesIO(raw), "utf-8", chunk_rows=97, stats=stats))
+
+    assert stats["rows"] == 1000
+    assert cleaned.decode("utf-8") == expected.to_csv(index=False)
+
+
+def test_clean_csv_to_s3_streams_multipart(fake_s3):
+    raw = _sample_csv(20000, "latin1")
+    result = clean_csv_to_s3(io.BytesIO(raw), "leads_cleaned.csv", chunk_rows=500)
+
+    body = fake_s3.objects["leads_cleaned.csv"]
+    assert result["rows"] == 20000
+    assert result["bytes_in"] == len(raw)
+    assert result["bytes_out"] == len(body)
+    assert body.startswith(b"Prospect_ID,Lead_Number,Lead_Grade,City\n")
+    assert "Málaga" in body.decode("utf-8")
+    assert result["mb_per_s"] >= 0
+
+
+def test_upload_stream_splits_parts(fake_s3):
+    chunks = [b"x" * 1024] * 30
+    upload_s3.upload_stream("big.csv", chunks, part_size=10 * 1024)
+
+    assert fake_s3.part_sizes == [10 * 1024, 10 * 1024, 10 * 1024]
+    assert fake_s3.objects["big.csv"] == b"x" * 30 * 1024
+
+
+def test_upload_stream_aborts_on_error(fake_s3):
+    def _broken():
+        yield b"x" * 2048
+        raise RuntimeError("boom")
+
+    with pytest.raises(Exception):
+        upload_s3.upload_stream("broken.csv", _broken(), part_size=1024)
+    assert fake_s3.uploads == {}
+
+
+def test_upload_and_load_streams_original_and_removes_temp_file(fake_s3, monkeypatch, tmp_path):
+    import tempfile
+    from app import cleaning, main, snowflake_client
+
+    monkeypatch.setattr(upload_s3, "_bucket_checked", True)
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    monkeypatch.setattr(snowflake_client, "upload_to_snowflake",
+                        lambda path, name: {"status": "ok", "filename": name})
+    raw = b"Lead Number,City\n1,Madrid\n2,Sevilla\n"
+    spooled = tempfile.SpooledTemporaryFile()
+    spooled.write(raw)
+    spooled.seek(0)
+
+    result = main._clean_and_load(spooled, "leads.csv", dedup=False)
+    assert result["rows_loaded"] == 2
+    assert fake_s3.objects["leads.csv"] == raw
+    assert list(tmp_path.iterdir()) == []
+
+    def _broken(*args, **kwargs):
+        raise OSError("disco lleno")
+        yield
+
+    monkeypatch.setattr(cleaning, "iter_cleaned_csv", _broken)
+    spooled.seek(0)
+    with pytest.raises(OSError):
+        main._clean_and_load(spooled, "leads.csv", dedup=False)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,69 @@
+import io
+import json
+from decimal import Decimal
+
+import pyarrow as pa
+from fastapi.testclient import TestClient
+
+from app.columnar import ARROW_STREAM_MEDIA_TYPE, ColumnarResult
+from app.main import app
+from app.result_cache import CacheEntry
+from tests.test_leads_pagination import TABLE, leads_final
+
+SCORED = [(1, Decimal("10.5"), "A", "Lead", 0.9), (2, None, "B", "Lead", 0.1), (3, 4.0, "C", "Closed", 0.3)]
+
+
+def _scored(sql, params):
+    if "INFORMATION_SCHEMA.TABLES" in sql:
+        return [("2026-10-18 10:00:00",)]
+    return SCORED
+
+
+def test_json_matches_dict_path_in_batches():
+    columns = ("Lead_Number", "City", "Score")
+    rows = [(i, f"City {i}", Decimal("0.5") if i % 2 else None) for i in range(11)]
+    result = ColumnarResult.from_batches(columns, [rows[:4], rows[4:], []])
+
+    expected = [dict(zip(columns, row)) for row in rows]
+    for row in expected:
+        row["Score"] = float(row["Score"]) if row["Score"] is not None else None
+    assert len(result) == 11
+    assert json.loads(b"".join(result.iter_json(batch_rows=3))) == expected
+    assert json.loads(ColumnarResult(columns).to_json()) == []
+
+
+def test_arrow_falls_back_to_text_for_mixed_columns():
+    table = ColumnarResult(("a", "b"), [[1, 2], [1, "x"]]).to_arrow()
+    assert table.column("a").type == pa.int64()
+    assert table.column("b").to_pylist() == ["1", "x"]
+
+
+def test_score_all_leads_json_and_arrow(fake_snowflake):
+    fake_snowflake.responder = _scored
+    client = TestClient(app)
+
+    body = client.get("/score-all-leads").json()
+    assert [row["id"] for row in body] == [1, 3]
+    assert body[0] == {"id": 1, "activity_score": 10.5, "lead_grade": "A", "lead_stage": "Lead", "score": 0.9}
+
+    response = client.get("/score-all-leads", params={"limit": 50}, headers={"Accept": ARROW_STREAM_MEDIA_TYPE})
+    assert response.headers["content-type"] == ARROW_STREAM_MEDIA_TYPE
+    table = pa.ipc.open_stream(io.BytesIO(response.content)).read_all()
+    assert table.column_names == ["id", "activity_score", "lead_grade", "lead_stage", "score"]
+    assert table.column("id").to_pylist() == [1, 3]
+
+
+def test_leads_page_as_arrow_keeps_cursor(fake_snowflake):
+    fake_snowflake.responder = leads_final
+    response = TestClient(app).get("/leads", params={"limit": 10}, headers={"Accept": ARROW_STREAM_MEDIA_TYPE})
+
+    table = pa.ipc.open_stream(io.BytesIO(response.content)).read_all()
+    assert table.column("Lead_Number").to_pylist() == [row[0] for row in TABLE[:10]]
+    assert response.headers["X-Next-Cursor"]
+
+
+def test_columnar_result_survives_shared_cache():
+    result = ColumnarResult(("id", "score"), [[1, 2], [0.5, None]])
+    entry = CacheEntry.from_bytes(CacheEntry(result, "w", 1.0, 0.2).to_bytes())
+    assert isinstance(entry.value, ColumnarResult)
+    assert list(entry.value.rows()) == [(1, 0.5), (2, None)]
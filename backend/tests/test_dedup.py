@@ -0,0 +1,163 @@
+import io
+
+import pandas as pd
+import pytest
+
+from app import dedup
+from app.cleaning import clean_csv_to_s3
+from app.dedup import HashIndex, load_index, save_index
+from tests.test_cleaning import fake_s3  # noqa: F401
+
+
+def _csv(rows) -> bytes:
+    lines = ["Prospect ID,Lead Number,City"]
+    lines += [f"{pid},{number},{city}" for pid, number, city in rows]
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _frame(rows) -> pd.DataFrame:
+    return pd.DataFrame(rows, columns=["Prospect_ID", "Lead_Number", "City"])
+
+
+@pytest.fixture
+def index_path(tmp_path, monkeypatch):
+    path = tmp_path / "index.npz"
+    monkeypatch.setattr(dedup, "INDEX_PATH", str(path))
+    monkeypatch.setattr(dedup, "INDEX_S3_KEY", None)
+    monkeypatch.setattr(dedup, "_index", None)
+    return path
+
+
+def test_only_new_or_changed_rows_are_emitted():
+    index = HashIndex()
+    run = index.begin()
+    run.filter(_frame([("a", "1", "Madrid"), ("b", "2", "Sevilla")]))
+    run.commit()
+
+    run = index.begin()
+    emitted = run.filter(_frame([("a", "1", "Madrid"), ("b", "2", "Bilbao"), ("c", "3", "Cádiz")]))
+
+    assert list(emitted["Prospect_ID"]) == ["b", "c"]
+    assert run.stats["rows_skipped"] == 1
+    assert run.stats["bytes_saved"] == len("a,1,Madrid\n")
+
+
+def test_exact_repeats_within_a_file_are_emitted_once():
+    run = HashIndex().begin()
+    emitted = run.filter(_frame([("a", "1", "Madrid"), ("a", "1", "Madrid")]))
+    assert len(emitted) == 1
+    assert run.stats["rows_skipped"] == 1
+
+
+
+def test_repeats_in_later_chunks_of_the_same_run_are_skipped():
+    run = HashIndex().begin()
+    assert len(run.filter(_frame([("a", "1", "Madrid"), ("b", "2", "Sevilla")]))) == 2
+    emitted = run.filter(_frame([("a", "1", "Madrid"), ("b", "2", "Bilbao")]))
+    assert list(emitted["Prospect_ID"]) == ["b"]
+    # Vuelve al contenido confirmado tras cambiar en esta ejecución: se emite
+    emitted = run.filter(_frame([("b", "2", "Sevilla")]))
+    assert len(emitted) == 1
+    assert run.stats["rows_skipped"] == 1
+    assert len(run.pending()) == 2
+
+def test_uncommitted_run_does_not_touch_the_index():
+    index = HashIndex()
+    index.begin().filter(_frame([("a", "1", "Madrid")]))
+    assert len(index) == 0
+    assert len(index.begin().filter(_frame([("a", "1", "Madrid")]))) == 1
+
+
+def test_missing_key_column_is_rejected():
+    with pytest.raises(ValueError):
+        HashIndex().begin().filter(pd.DataFrame({"City": ["Madrid"]}))
+
+
+def test_index_roundtrip(index_path):
+    index = HashIndex()
+    run = index.begin()
+    run.filter(_frame([(f"p-{i}", str(i), "Madrid") for i in range(1000)]))
+    run.commit()
+    save_index(index)
+
+    loaded = load_index()
+    assert len(loaded) == 1000
+    # Dos uint64 por lead, comprimidos
+    assert index_path.stat().st_size < 1000 * 16 + 1024
+    assert len(loaded.begin().filter(_frame([("p-5", "5", "Madrid")]))) == 0
+
+
+def test_incremental_clean_to_s3_skips_unchanged_rows(fake_s3, index_path):
+    # Quien carga en Snowflake pasa su ejecución y la confirma tras la carga
+    run = dedup.get_index().begin()
+    first = clean_csv_to_s3(io.BytesIO(_csv([("a", 1, "Madrid"), ("b", 2, "Sevilla")])), "leads.csv",
+                            dedup=True, dedup_run=run)
+    assert first["rows"] == 2
+    assert first["rows_skipped"] == 0
+    assert not index_path.exists()
+    dedup.commit_run(run)
+    assert index_path.exists()
+
+    second = clean_csv_to_s3(io.BytesIO(_csv([("a", 1, "Madrid"), ("b", 2, "Huelva")])), "leads2.csv", dedup=True)
+    assert second["rows"] == 1
+    assert second["rows_skipped"] == 1
+    assert second["bytes_saved"] > 0
+    assert fake_s3.objects["leads2.csv"] == b"Prospect_ID,Lead_Number,City\nb,2,Huelva\n"
+
+
+def test_parquet_output_filters_against_the_index(fake_s3, index_path):
+    import pyarrow.parquet as pq
+    from app.parquet_stage import clean_csv_to_parquet_s3
+
+    index = dedup.get_index()
+    run = index.begin()
+    run.filter(_frame([("a", "1", "Madrid")]))
+    dedup.commit_run(run)
+
+    result = clean_csv_to_parquet_s3(io.BytesIO(_csv([("a", 1, "Madrid"), ("b", 2, "Huelva")])), "leads.csv",
+                                     dedup=True)
+    assert result["rows"] == 1 and result["rows_skipped"] == 1
+    table = pq.read_table(io.BytesIO(fake_s3.objects[result["s3_key"]]))
+    assert table.column("Prospect_ID").to_pylist() == ["b"]
+    # El Parquet no se carga en Snowflake: el índice no cambia
+    assert len(index) == 1
+
+
+def test_clean_only_upload_does_not_mark_rows_as_loaded(fake_s3, index_path, monkeypatch):
+    from fastapi.testclient import TestClient
+    from app import upload_s3
+    from app.main import app
+
+    monkeypatch.setattr(upload_s3, "_bucket_checked", True)
+    data = _csv([("a", 1, "Madrid"), ("b", 2, "Sevilla")])
+    response = TestClient(app).post("/clean-upload-and-generate-url", params={"dedup": True},
+                                    files={"file": ("leads.csv", data, "text/csv")})
+    assert response.json()["rows"] == 2
+    assert len(dedup.get_index()) == 0 and not index_path.exists()
+
+    # Una carga posterior del mismo archivo (p. ej. /upload-and-load) lo envía entero
+    run = dedup.get_index().begin()
+    assert clean_csv_to_s3(io.BytesIO(data), "again.csv", dedup_run=run)["rows"] == 2
+
+
+def test_index_needs_a_persistent_location(monkeypatch):
+    monkeypatch.setattr(dedup, "INDEX_PATH", None)
+    monkeypatch.setattr(dedup, "INDEX_S3_KEY", None)
+    with pytest.raises(RuntimeError, match="DEDUP_INDEX_S3_KEY"):
+        load_index()
+    with pytest.raises(RuntimeError):
+        save_index(HashIndex())
+
+
+def test_index_defaults_to_s3(fake_s3, monkeypatch):
+    from app import upload_s3
+
+    monkeypatch.setattr(upload_s3, "_bucket_checked", True)
+    monkeypatch.setattr(dedup, "INDEX_PATH", None)
+    assert dedup.INDEX_S3_KEY == "dedup/leads_hash_index.npz"
+    index = HashIndex()
+    run = index.begin()
+    run.filter(_frame([("a", "1", "Madrid")]))
+    run.commit()
+    save_index(index)
+    assert dedup.INDEX_S3_KEY in fake_s3.objects
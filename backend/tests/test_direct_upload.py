@@ -0,0 +1,143 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app import direct_upload, ingestion, upload_s3
+from app.main import app
+from tests.test_bulk_upload import _localstack_available
+from tests.test_cleaning import FakeS3, _sample_csv
+from tests.test_exports import ExportS3
+from tests.test_ingestion import _Queue
+
+
+class UploadS3(ExportS3):
+    """ExportS3 con head_object y firma de cualquier operación."""
+
+    def head_object(self, Bucket, Key):
+        return {"ContentLength": len(self.get_object(Bucket, Key)["Body"].getvalue())}
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        query = "&".join(f"{k}={v}" for k, v in Params.items() if k not in ("Bucket", "Key"))
+        return f"https://s3.test/{Params['Key']}?op={operation}&{query}"
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    fake = UploadS3()
+    monkeypatch.setattr(upload_s3, "s3", fake)
+    monkeypatch.setattr(upload_s3, "_bucket_checked", True)
+    monkeypatch.setattr(ingestion, "_jobs", {})
+    monkeypatch.setattr(ingestion, "_queue", _Queue())
+    return fake
+
+
+def test_single_put_then_complete_enqueues_ingestion(s3):
+    client = TestClient(app)
+    presigned = client.get("/generate-presigned-url", params={"filename": "leads.csv", "content_type": "text/csv"}).json()
+    assert presigned["url"].startswith(f"https://s3.test/{presigned['key']}?op=put_object")
+    assert presigned["key"] == f"ingest/{presigned['job_id']}/source/leads.csv"
+
+    # Todavía no se ha subido nada
+    assert client.post(presigned["complete_url"], json={"key": presigned["key"]}).status_code == 409
+
+    s3.objects[presigned["key"]] = _sample_csv(10)
+    response = client.post(presigned["complete_url"], json={"key": presigned["key"], "score": True})
+    assert response.status_code == 202
+    job = response.json()
+    assert job["job_id"] == presigned["job_id"]
+    assert job["options"]["score"] is True
+    assert ingestion.get_queue().sent == [presigned["job_id"]]
+    # Repetir el complete no crea otro trabajo
+    assert client.post(presigned["complete_url"], json={"key": presigned["key"]}).json()["job_id"] == job["job_id"]
+    assert ingestion.get_queue().sent == [presigned["job_id"]]
+
+
+def test_multipart_initiate_presigns_all_parts_and_completes(s3):
+    client = TestClient(app)
+    size = 2 * direct_upload.UPLOAD_PART_SIZE + 1
+    upload = client.post("/uploads/multipart", json={"filename": "big.csv", "size": size}).json()
+    assert upload["part_count"] == 3
+    assert [p["part_number"] for p in upload["parts"]] == [1, 2, 3]
+    assert "op=upload_part" in upload["parts"][0]["url"] and "PartNumber=1" in upload["parts"][0]["url"]
+
+    more = client.post(f"/uploads/{upload['job_id']}/parts",
+                       json={"key": upload["key"], "upload_id": upload["upload_id"], "part_numbers": [2]}).json()
+    assert [p["part_number"] for p in more["parts"]] == [2]
+
+    # El navegador sube las partes (en cualquier orden) y guarda los ETag
+    etags = {}
+    for n, body in ((2, b"b" * 3), (1, b"a" * 3), (3, b"c")):
+        etags[n] = s3.upload_part(Bucket=upload_s3.bucket, Key=upload["key"], UploadId=upload["upload_id"],
+                                  PartNumber=n, Body=body)["ETag"]
+    parts = [{"part_number": n, "etag": etag} for n, etag in etags.items()]
+    response = client.post(upload["complete_url"],
+                           json={"key": upload["key"], "upload_id": upload["upload_id"], "parts": parts})
+    assert response.status_code == 202
+    assert s3.objects[upload["key"]] == b"aaabbbc"
+    assert ingestion.get_job(upload["job_id"]).filename == "big.csv"
+
+
+def test_key_must_belong_to_the_upload(s3):
+    client = TestClient(app)
+    upload = client.post("/uploads/multipart", json={"filename": "a.csv"}).json()
+    assert "parts" not in upload
+    other = direct_upload._source_key("0" * 32, "a.csv")
+    response = client.post(f"/uploads/{upload['job_id']}/complete", json={"key": other})
+    assert response.status_code == 400
+    assert client.delete(f"/uploads/{upload['job_id']}",
+                         params={"key": upload["key"], "upload_id": upload["upload_id"]}).status_code == 200
+    assert s3.uploads == {}
+
+
+def test_part_size_grows_to_stay_under_part_limit():
+    assert direct_upload.part_size_for(None) == direct_upload.UPLOAD_PART_SIZE
+    huge = direct_upload.UPLOAD_PART_SIZE * direct_upload.MAX_PARTS * 2
+    assert direct_upload.part_size_for(huge) * direct_upload.MAX_PARTS >= huge
+
+
+def test_bucket_cors_exposes_etag_to_the_browser(monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(upload_s3, "s3", fake)
+    monkeypatch.setattr(upload_s3, "_bucket_checked", False)
+    upload_s3.ensure_bucket_exists()
+    [config] = fake.cors_puts
+    assert config["CORSRules"][0]["ExposeHeaders"] == ["ETag"]
+    assert "PUT" in config["CORSRules"][0]["AllowedMethods"]
+
+    # Con el ETag ya expuesto no se reescribe
+    monkeypatch.setattr(upload_s3, "_bucket_checked", False)
+    upload_s3.ensure_bucket_exists()
+    assert len(fake.cors_puts) == 1
+
+
+def test_bucket_cors_keeps_existing_rules(monkeypatch):
+    existing = {"AllowedOrigins": ["*"], "AllowedMethods": ["GET"]}
+    fake = FakeS3()
+    fake.cors_rules = [existing]
+    monkeypatch.setattr(upload_s3, "s3", fake)
+    monkeypatch.setattr(upload_s3, "_bucket_checked", False)
+    upload_s3.ensure_bucket_exists()
+    assert fake.cors_rules == [existing, upload_s3.CORS_RULE]
+
+
+@pytest.mark.skipif(not _localstack_available(), reason="LocalStack no disponible")
+def test_presigned_multipart_upload_against_localstack(monkeypatch):
+    import httpx
+
+    monkeypatch.setattr(upload_s3, "_bucket_checked", False)
+    monkeypatch.setattr(ingestion, "_queue", _Queue())
+    client = TestClient(app)
+    first = b"Prospect ID,Lead Number\n" + b"p,1\n" * (direct_upload.MIN_PART_SIZE // 4)
+    last = b"p,2\n"
+    upload = client.post("/uploads/multipart", json={"filename": "direct.csv",
+                                                     "size": len(first) + len(last)}).json()
+    monkeypatch.setattr(direct_upload, "UPLOAD_PART_SIZE", len(first))
+    parts = client.post(f"/uploads/{upload['job_id']}/parts", json={
+        "key": upload["key"], "upload_id": upload["upload_id"], "part_numbers": [1, 2]}).json()["parts"]
+
+    etags = [httpx.put(p["url"], content=body).headers["ETag"] for p, body in zip(parts, (first, last))]
+    response = client.post(upload["complete_url"], json={
+        "key": upload["key"], "upload_id": upload["upload_id"],
+        "parts": [{"part_number": i + 1, "etag": etag} for i, etag in enumerate(etags)]})
+    assert response.status_code == 202
+    stored = upload_s3.get_s3().get_object(Bucket=upload_s3.bucket, Key=upload["key"])["Body"].read()
+    assert stored == first + last
@@ -0,0 +1,209 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import ingestion, upload_s3
+from app.main import app, handler
+from tests.test_cleaning import _sample_csv
+from tests.test_exports import ExportS3
+
+
+class _Queue:
+    """Cola que guarda los trabajos y los procesa al llamar a `drain`."""
+
+    def __init__(self):
+        self.sent = []
+
+    def send(self, job_id):
+        self.sent.append(job_id)
+
+    def drain(self):
+        while self.sent:
+            ingestion.process(self.sent.pop(0))
+
+    def stats(self):
+        return {"backend": "test", "pending": len(self.sent)}
+
+
+def _responder(fail_copies: int = 0):
+    state = {"copies": 0}
+
+    def _respond(sql, params):
+        statement = sql.lstrip().upper()
+        if statement.startswith("PUT"):
+            source = sql.split("file://", 1)[1].split()[0].rsplit("/", 1)[-1]
+            return [(source, f"{source}.gz", 0, 0, "NONE", "GZIP", "UPLOADED", "")]
+        if statement.startswith("COPY"):
+            state["copies"] += 1
+            if state["copies"] <= fail_copies:
+                raise ConnectionError("warehouse suspended")
+            return [("ok",)]
+        return []
+    return _respond
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    fake = ExportS3()
+    monkeypatch.setattr(upload_s3, "s3", fake)
+    monkeypatch.setattr(upload_s3, "_bucket_checked", True)
+    monkeypatch.setattr(ingestion, "_jobs", {})
+    monkeypatch.setattr(ingestion, "INGEST_RETRY_BASE_DELAY", 0)
+    q = _Queue()
+    monkeypatch.setattr(ingestion, "_queue", q)
+    q.s3 = fake
+    return q
+
+
+def _submit(**options):
+    return TestClient(app).post("/ingestions", params=options,
+                                files={"file": ("leads.csv", _sample_csv(50), "text/csv")})
+
+
+def test_submit_returns_202_before_processing(fake_snowflake, queue):
+    fake_snowflake.responder = _responder()
+    response = _submit(dedup=False)
+    assert response.status_code == 202
+    body = response.json()
+    assert body["status"] == "queued"
+    assert body["events_url"] == f"/ingestions/{body['job_id']}/events"
+    assert queue.sent == [body["job_id"]]
+    # Solo se ha subido el original: ninguna sentencia en Snowflake todavía
+    assert queue.s3.objects[f"ingest/{body['job_id']}/source/leads.csv"] == _sample_csv(50)
+    assert fake_snowflake.executed == []
+
+
+def test_stages_run_in_order_and_record_progress(fake_snowflake, queue):
+    fake_snowflake.responder = _responder()
+    job_id = _submit(dedup=False).json()["job_id"]
+    queue.drain()
+
+    status = TestClient(app).get(f"/ingestions/{job_id}").json()
+    assert status["status"] == "succeeded"
+    assert [status["stages"][name]["status"] for name in ("clean", "stage", "load")] == ["succeeded"] * 3
+    assert status["stages"]["clean"]["progress"]["percent"] == 100.0
+    assert status["result"]["clean"]["rows"] == 50
+    assert status["result"]["stage"]["staged_file"].endswith("_cleaned.csv.gz")
+    statements = [sql.lstrip().split()[0] for sql, _ in fake_snowflake.executed]
+    assert statements == ["PUT", "COPY"]
+    assert b"Prospect_ID" in queue.s3.objects[f"ingest/{job_id}/cleaned.csv"]
+    # El manifiesto en S3 refleja el estado final
+    manifest = json.loads(queue.s3.objects[f"ingest/{job_id}/job.json"])
+    assert manifest["status"] == "succeeded"
+
+
+def test_transient_failure_is_retried(fake_snowflake, queue):
+    fake_snowflake.responder = _responder(fail_copies=1)
+    job_id = _submit(dedup=False).json()["job_id"]
+    queue.drain()
+
+    job = ingestion.get_job(job_id)
+    assert job.status == "succeeded"
+    assert job.stages["load"]["attempts"] == 2
+    assert job.stages["stage"]["attempts"] == 1
+
+
+def test_retry_resumes_from_failed_stage(fake_snowflake, queue, monkeypatch):
+    monkeypatch.setattr(ingestion, "INGEST_MAX_ATTEMPTS", 1)
+    fake_snowflake.responder = _responder(fail_copies=1)
+    job_id = _submit(dedup=False).json()["job_id"]
+    queue.drain()
+
+    client = TestClient(app)
+    failed = client.get(f"/ingestions/{job_id}").json()
+    assert failed["status"] == "failed"
+    assert failed["error"].startswith("load:")
+    assert client.post(f"/ingestions/{job_id}/retry").status_code == 202
+    queue.drain()
+
+    job = ingestion.get_job(job_id)
+    assert job.status == "succeeded"
+    # clean y stage no se repiten: un solo PUT
+    assert job.stages["clean"]["attempts"] == 1
+    assert sum(sql.lstrip().startswith("PUT") for sql, _ in fake_snowflake.executed) == 1
+    assert client.post(f"/ingestions/{job_id}/retry").status_code == 409
+
+
+def test_unreadable_csv_fails_without_retry(fake_snowflake, queue, monkeypatch):
+    def _bad_csv(job, stage):
+        raise ValueError("Error tokenizing data")
+
+    monkeypatch.setitem(ingestion.STAGE_FUNCTIONS, "clean", _bad_csv)
+    job_id = _submit(dedup=False).json()["job_id"]
+    queue.drain()
+
+    job = ingestion.get_job(job_id)
+    assert job.status == "failed"
+    assert job.stages["clean"]["attempts"] == 1
+    assert job.stages["stage"]["status"] == "pending"
+
+
+def test_background_flag_on_clean_endpoint_returns_download_url(fake_snowflake, queue):
+    response = TestClient(app).post("/clean-upload-and-generate-url", params={"background": True},
+                                    files={"file": ("leads.csv", _sample_csv(20), "text/csv")})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    queue.drain()
+
+    status = TestClient(app).get(f"/ingestions/{job_id}").json()
+    assert list(status["stages"]) == ["clean"]
+    assert status["download_url"].startswith(f"https://s3.test/ingest/{job_id}/cleaned.csv")
+    assert fake_snowflake.executed == []
+
+
+def test_events_stream_ends_at_terminal_status(fake_snowflake, queue):
+    fake_snowflake.responder = _responder()
+    job_id = _submit(dedup=False).json()["job_id"]
+    queue.drain()
+
+    with TestClient(app).stream("GET", f"/ingestions/{job_id}/events") as response:
+        body = "".join(response.iter_text())
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert body.startswith("event: succeeded\n")
+    assert TestClient(app).get("/ingestions/missing/events").status_code == 404
+
+
+def test_sqs_event_is_routed_to_worker(fake_snowflake, queue):
+    fake_snowflake.responder = _responder()
+    job_id = _submit(dedup=False).json()["job_id"]
+    queue.sent.clear()
+
+    event = {"Records": [{"messageId": "m1", "eventSource": "aws:sqs", "body": json.dumps({"job_id": job_id})}]}
+    assert handler(event, None) == {"batchItemFailures": []}
+    assert ingestion.get_job(job_id).status == "succeeded"
+
+
+def test_running_job_is_read_from_manifest(fake_snowflake, queue):
+    job_id = _submit(dedup=False).json()["job_id"]
+    # La worker SQS avanza el manifiesto; la copia en memoria de la API sigue en cola
+    key = f"ingest/{job_id}/job.json"
+    manifest = json.loads(queue.s3.objects[key])
+    manifest["status"] = "running"
+    manifest["stages"]["clean"]["progress"] = {"percent": 40.0}
+    queue.s3.objects[key] = json.dumps(manifest).encode()
+
+    status = TestClient(app).get(f"/ingestions/{job_id}").json()
+    assert status["status"] == "running"
+    assert status["stages"]["clean"]["progress"]["percent"] == 40.0
+
+
+def test_dedup_hashes_are_committed_only_after_load(fake_snowflake, queue, monkeypatch, tmp_path):
+    from app import dedup
+
+    monkeypatch.setattr(dedup, "INDEX_PATH", str(tmp_path / "index.npz"))
+    monkeypatch.setattr(dedup, "INDEX_S3_KEY", None)
+    monkeypatch.setattr(dedup, "_index", None)
+    monkeypatch.setattr(ingestion, "INGEST_MAX_ATTEMPTS", 1)
+    fake_snowflake.responder = _responder(fail_copies=1)
+    job_id = _submit(dedup=True).json()["job_id"]
+    queue.drain()
+
+    assert ingestion.get_job(job_id).status == "failed"
+    assert f"ingest/{job_id}/dedup_pending.npz" in queue.s3.objects
+    assert len(dedup.get_index()) == 0
+
+    TestClient(app).post(f"/ingestions/{job_id}/retry")
+    queue.drain()
+    assert ingestion.get_job(job_id).status == "succeeded"
+    assert len(dedup.get_index()) == 50
@@ -0,0 +1,89 @@
+import json
+import logging
+
+from fastapi.testclient import TestClient
+
+from app import instrumentation, upload_s3
+from app.instrumentation import Histogram, RequestTimings, instrument_client, span
+from app.main import app
+from tests.test_cleaning import FakeS3, _sample_csv
+from tests.test_leads_pagination import leads_final
+
+
+def _server_timing(response) -> dict:
+    entries = {}
+    for part in response.headers["server-timing"].split(", "):
+        name, dur = part.split(";")[:2]
+        entries[name] = float(dur.split("=")[1])
+    return entries
+
+
+def test_clean_upload_has_stage_breakdown(monkeypatch):
+    monkeypatch.setattr(upload_s3, "s3", FakeS3())
+    monkeypatch.setattr(upload_s3, "_bucket_checked", True)
+    response = TestClient(app).post("/clean-upload-and-generate-url",
+                                    files={"file": ("leads.csv", _sample_csv(100), "text/csv")})
+
+    timing = _server_timing(response)
+    assert {"total", "prevalidate.scan", "pandas.read_csv", "pandas.to_csv", "s3.presign"} <= set(timing)
+    assert timing["total"] >= timing["pandas.read_csv"]
+
+
+def test_snowflake_spans_and_json_log(fake_snowflake, caplog):
+    fake_snowflake.responder = leads_final
+    with caplog.at_level(logging.INFO, logger="timing"):
+        response = TestClient(app).get("/leads", params={"limit": 5})
+
+    assert {"snowflake.checkout", "snowflake.execute", "snowflake.fetch"} <= set(_server_timing(response))
+    line = json.loads([r.message for r in caplog.records if r.name == "timing"][-1])
+    assert line["route"] == "/leads" and line["status"] == 200
+    assert line["spans"]["snowflake.execute"]["count"] == 2  # esquema + página
+
+
+def test_prometheus_metrics_fold_in_pool_caches_and_concurrency(fake_snowflake):
+    fake_snowflake.responder = leads_final
+    client = TestClient(app)
+    client.get("/leads", params={"limit": 5})
+    client.get("/exports/unknown")
+
+    text = client.get("/metrics").text
+    assert 'http_requests_total{method="GET",route="/leads",status="200"}' in text
+    assert 'http_requests_total{method="GET",route="/exports/{job_id}",status="404"}' in text
+    assert 'span_duration_seconds_bucket{span="snowflake.execute",le="+Inf"}' in text
+    assert "snowflake_pool_checkouts " in text
+    assert "result_cache_hit_ratio " in text
+    assert 'concurrency_limit{group="io"}' in text
+
+
+def test_boto3_calls_are_timed_through_botocore_events():
+    import boto3
+    from botocore.stub import Stubber
+
+    client = instrument_client(boto3.client("s3", region_name="us-east-1", aws_access_key_id="x",
+                                            aws_secret_access_key="x"), "s3")
+    timings = RequestTimings()
+    token = instrumentation._current.set(timings)
+    try:
+        with Stubber(client) as stub:
+            stub.add_response("head_bucket", {}, {"Bucket": "leads"})
+            client.head_bucket(Bucket="leads")
+    finally:
+        instrumentation._current.reset(token)
+    assert timings.as_ms()["s3.HeadBucket"]["count"] == 1
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("h", "test", ("span",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(("x",), value)
+    lines = histogram.render()
+    assert 'h_bucket{span="x",le="0.1"} 1' in lines
+    assert 'h_bucket{span="x",le="1"} 2' in lines
+    assert 'h_bucket{span="x",le="+Inf"} 3' in lines
+    assert 'h_count{span="x"} 3' in lines
+
+
+def test_spans_outside_requests_only_feed_histogram():
+    with span("solo.global"):
+        pass
+    assert instrumentation.span_seconds.snapshot()[("solo.global",)]["count"] >= 1
@@ -0,0 +1,70 @@
+import csv
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.leads_reader import decode_cursor, encode_cursor
+from app.main import app
+
+COLUMNS = ["FILENAME", "LOAD_TS", "Lead_Number", "Lead_Grade", "City"]
+TABLE = [(660000 + i, "A" if i % 2 else "B", f"City {i}") for i in range(25)]
+
+
+def leads_final(sql, params):
+    """Responder que emula INFORMATION_SCHEMA y la consulta por keyset."""
+    if "INFORMATION_SCHEMA" in sql:
+        return [(name,) for name in COLUMNS]
+    rows = TABLE
+    if params and params.get("after") is not None:
+        rows = [row for row in rows if row[0] > params["after"]]
+    if "LIMIT" in sql:
+        rows = rows[:params["limit"]]
+    return rows
+
+
+@pytest.fixture
+def client(fake_snowflake):
+    fake_snowflake.responder = leads_final
+    return TestClient(app)
+
+
+def test_cursor_roundtrip():
+    assert decode_cursor(encode_cursor(660123)) == 660123
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_keyset_pages_cover_table(client, fake_snowflake):
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 10, **({"cursor": cursor} if cursor else {})}
+        response = client.get("/leads", params=params)
+        assert response.status_code == 200
+        seen += [row["Lead_Number"] for row in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert seen == [row[0] for row in TABLE]
+    page_queries = [sql for sql, _ in fake_snowflake.executed if "LEADS_FINAL" in sql and "INFORMATION" not in sql]
+    assert all("OFFSET" not in sql and "{" not in sql for sql in page_queries)
+    assert '"Lead_Number" > %(after)s' in page_queries[-1]
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get("/leads", params={"cursor": "###"}).status_code == 400
+
+
+def test_streaming_ndjson_and_csv(client):
+    response = client.get("/leads", params={"format": "ndjson"})
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert len(rows) == 25 and rows[0] == {"Lead_Number": 660000, "Lead_Grade": "B", "City": "City 0"}
+
+    cursor = encode_cursor(660019)
+    response = client.get("/leads", params={"format": "csv", "cursor": cursor, "limit": 3})
+    rows = list(csv.reader(io.StringIO(response.text)))
+    assert rows[0] == ["Lead_Number", "Lead_Grade", "City"]
+    assert [r[0] for r in rows[1:]] == ["660020", "660021", "660022"]
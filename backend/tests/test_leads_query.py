@@ -0,0 +1,124 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.leads_query import LeadQuery
+from app.leads_reader import decode_cursor
+from app.main import app
+from app.schema_cache import TableSchema
+
+COLUMNS = ["FILENAME", "LOAD_TS", "Lead_Number", "Lead_Grade", "Lead_Stage"]
+TABLE = [(660000 + i, "ABC"[i % 3], "Lead") for i in range(20)]
+
+
+def leads_final(sql, params):
+    """Emula INFORMATION_SCHEMA y la consulta de (Lead_Number, Lead_Grade) filtrada por grado."""
+    if "INFORMATION_SCHEMA" in sql:
+        return [(name,) for name in COLUMNS]
+    grades = {v for k, v in params.items() if k.startswith("grade_")}
+    rows = [(num, grade) for num, grade, _ in TABLE if not grades or grade in grades]
+    if params.get("after_key") is not None:
+        rows = [row for row in rows if row[0] > params["after_key"]]
+    return rows[:params["limit"]] if "LIMIT" in sql else rows
+
+
+@pytest.fixture
+def client(fake_snowflake):
+    fake_snowflake.responder = leads_final
+    return TestClient(app)
+
+
+def _queries(fake_snowflake):
+    return [(sql, params) for sql, params in fake_snowflake.executed if "INFORMATION_SCHEMA" not in sql]
+
+
+def test_filters_compile_to_bound_sql_cached_per_shape():
+    schema = TableSchema("LEADS_FINAL", COLUMNS[2:])
+    query = LeadQuery(grades=["A", "B", "C"], score_min=50, columns=["Lead_Number", "score"], limit=5)
+    compiled = query.compile(schema, page=True)
+
+    assert '"Lead_Grade" IN (%(grade_0)s, %(grade_1)s, %(grade_2)s, %(grade_3)s)' in compiled.sql
+    assert "SCORING_UDF" in compiled.sql and ">= %(score_min)s" in compiled.sql
+    assert compiled.sql.endswith("LIMIT %(limit)s") and "'A'" not in compiled.sql
+    assert compiled.columns == ("Lead_Number", "score")
+    params = query.params()
+    assert [params[f"grade_{i}"] for i in range(4)] == ["A", "B", "C", "C"]
+
+    # Mismos filtros presentes con otros valores: misma sentencia compilada
+    other = LeadQuery(grades=["D", "A", "B", "D"], score_min=10, columns=["Lead_Number", "score"], limit=50)
+    assert other.compile(schema, page=True) is compiled
+    assert LeadQuery(grades=["A"], columns=["Lead_Number", "score"], limit=5).compile(schema, page=True) is not compiled
+
+
+def test_order_by_other_column_pages_by_composite_keyset():
+    schema = TableSchema("LEADS_FINAL", COLUMNS[2:])
+    query = LeadQuery(columns=["Lead_Grade"], order_by="score", descending=True, limit=2)
+    compiled = query.compile(schema, page=True)
+    assert 'ORDER BY SCORING_UDF' in compiled.sql and "DESC NULLS LAST, \"Lead_Number\" ASC" in compiled.sql
+    # La columna de orden y la clave viajan al final aunque no se proyecten
+    assert decode_cursor(compiled.cursor_for(("A", 70.0, 660001), query), scope=query.fingerprint()) == [70.0, 660001]
+
+    after = LeadQuery(columns=["Lead_Grade"], order_by="score", descending=True, limit=2, after=[70.0, 660001])
+    assert "< %(after_value)s" in after.compile(schema, page=True).sql
+    assert after.params()["after_key"] == 660001
+    null_after = LeadQuery(order_by="score", limit=2, after=[None, 660001])
+    assert "IS NULL AND \"Lead_Number\" > %(after_key)s" in null_after.compile(schema, page=True).sql
+    with pytest.raises(ValueError):
+        LeadQuery(order_by="score", after=660001)
+
+
+def test_query_endpoint_filters_and_pages(client, fake_snowflake):
+    seen, cursor = [], None
+    while True:
+        params = {"grade": ["A", "C"], "columns": "Lead_Number,Lead_Grade", "limit": 4,
+                  **({"cursor": cursor} if cursor else {})}
+        response = client.get("/leads/query", params=params)
+        assert response.status_code == 200
+        seen += response.json()
+        cursor = response.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+
+    assert seen == [{"Lead_Number": num, "Lead_Grade": grade} for num, grade, _ in TABLE if grade in "AC"]
+    sql, params = _queries(fake_snowflake)[-1]
+    assert sql.startswith('SELECT "Lead_Number", "Lead_Grade" FROM') and "Lead_Stage" not in sql
+    assert params["grade_0"] == "A" and params["limit"] == 4
+
+
+def test_query_endpoint_streams_and_rejects_bad_input(client, fake_snowflake):
+    response = client.get("/leads/query", params={"grade": "B", "columns": ["Lead_Number", "Lead_Grade"],
+                                                  "format": "ndjson"})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert {line["Lead_Grade"] for line in lines} == {"B"} and len(lines) == 7
+    assert "LIMIT" not in _queries(fake_snowflake)[-1][0]
+
+    assert client.get("/leads/query", params={"columns": "Password"}).status_code == 400
+    assert client.get("/leads/query", params={"order_by": "x", "format": "csv"}).status_code == 400
+    assert client.get("/leads/query", params={"score_min": 5, "score_max": 1}).status_code == 400
+
+
+def test_query_endpoint_checks_the_load_date_column(client, fake_snowflake, monkeypatch):
+    from app import leads_query
+
+    assert client.get("/leads/query", params={"loaded_from": "2024-01-01"}).status_code == 200
+    monkeypatch.setattr(leads_query, "LEADS_DATE_COLUMN", "CREATED_AT")
+    response = client.get("/leads/query", params={"loaded_from": "2024-01-01"})
+    assert response.status_code == 400 and "CREATED_AT" in response.json()["detail"]
+
+
+def test_cursor_is_rejected_with_other_filters_or_order(client, fake_snowflake):
+    response = client.get("/leads/query", params={"grade": "A", "limit": 1})
+    cursor = response.headers["X-Next-Cursor"]
+    assert client.get("/leads/query", params={"grade": "A", "limit": 5, "cursor": cursor}).status_code == 200
+    assert client.get("/leads/query", params={"grade": "B", "limit": 1, "cursor": cursor}).status_code == 400
+    assert client.get("/leads/query", params={"grade": "A", "desc": True, "cursor": cursor}).status_code == 400
+
+
+def test_score_all_leads_filters_incomplete_rows_in_snowflake(fake_snowflake):
+    fake_snowflake.responder = lambda sql, params: [(1, 10.0, "A", "Lead", 0.9)]
+    TestClient(app).get("/score-all-leads", params={"limit": 7})
+    sql = next(sql for sql, _ in fake_snowflake.executed if "SCORING_UDF" in sql)
+    assert '"Lead_Grade" IS NOT NULL' in sql and "WHERE score IS NOT NULL\n        LIMIT %(limit)s" in sql
+    # La UDF se calcula una vez por fila y se filtra por su alias
+    assert sql.count("SCORING_UDF") == 1
@@ -0,0 +1,73 @@
+import io
+from datetime import date
+
+import pyarrow.parquet as pq
+import pytest
+
+from app.parquet_stage import clean_csv_to_parquet_s3, partition_key, write_parquet
+from test_cleaning import FakeS3, fake_s3  # noqa: F401
+
+
+def _csv(rows: int) -> bytes:
+    lines = ["Lead Number,Asymmetrique Activity Score,Lead Grade,Lead Stage,Notes"]
+    for i in range(rows):
+        activity = "" if i % 10 == 0 else str(10 + i % 5)
+        lines.append(f"{660000 + i},{activity},A,Customer,nota {i % 3}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def test_partition_key_layout():
+    key = partition_key("uploads/Leads Export.csv", date(2026, 10, 18))
+    assert key == "leads_parquet/ingest_date=2026-10-18/Leads Export.parquet"
+
+
+@pytest.mark.parametrize("compression", ["snappy", "zstd"])
+def test_write_parquet_typed_row_groups(compression):
+    sink = io.BytesIO()
+    result = write_parquet(io.BytesIO(_csv(1000)), sink, "utf-8", compression=compression,
+                           row_group_rows=300, score=True)
+    sink.seek(0)
+    parquet = pq.ParquetFile(sink)
+
+    assert result["rows"] == 1000
+    assert parquet.metadata.num_row_groups == 4
+    assert parquet.metadata.row_group(0).column(0).compression.lower() == compression
+    table = parquet.read()
+    assert str(table.schema.field("Lead_Number").type) == "int64"
+    assert str(table.schema.field("Asymmetrique_Activity_Score").type) == "int64"
+    assert str(table.schema.field("Notes").type) == "string"
+    assert str(table.schema.field("Lead_Score").type) == "double"
+    assert table.column("Asymmetrique_Activity_Score")[0].as_py() is None
+
+
+def test_later_values_outside_inferred_type_widen_the_column():
+    raw = (b"id,amount,code\n" + b"".join(f"{i},{i},{i}\n".encode() for i in range(10))
+           + b"10,1.5,7\n11,2,abc\n")
+    sink = io.BytesIO()
+    result = write_parquet(io.BytesIO(raw), sink, "utf-8", row_group_rows=10)
+    assert result["columns"] == {"id": "int64", "amount": "double", "code": "string"}
+    assert result["widened"] == {"amount": "int64 -> double", "code": "int64 -> string"}
+
+    sink.seek(0)
+    parquet = pq.ParquetFile(sink)
+    assert parquet.metadata.num_row_groups == 2
+    table = parquet.read()
+    assert table.column("amount").to_pylist()[-3:] == [9.0, 1.5, 2.0]
+    assert table.column("code").to_pylist()[-3:] == ["9", "7", "abc"]
+
+
+def test_rejects_unknown_compression():
+    with pytest.raises(ValueError):
+        write_parquet(io.BytesIO(_csv(5)), io.BytesIO(), "utf-8", compression="lzo")
+
+
+def test_clean_csv_to_parquet_s3_reports_ratio(fake_s3):
+    raw = _csv(5000)
+    stats = clean_csv_to_parquet_s3(io.BytesIO(raw), "leads.csv", ingest_date=date(2026, 1, 2))
+
+    assert stats["s3_key"] == "leads_parquet/ingest_date=2026-01-02/leads.parquet"
+    body = fake_s3.objects[stats["s3_key"]]
+    assert stats["bytes_out"] == len(body) and stats["bytes_in"] == len(raw)
+    assert stats["compression_ratio"] > 1
+    assert stats["write_mb_per_s"] > 0
+    assert pq.read_table(io.BytesIO(body)).num_rows == 5000
@@ -0,0 +1,127 @@
+import asyncio
+
+import httpx
+from fastapi.testclient import TestClient
+
+from app import prediction_cache as module
+from app import sagemaker_client
+from app.main import app
+from app.prediction_cache import PredictionCache, canonical_key
+from tests.test_async_io import SlowModel
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _score(payload):
+    return asyncio.run(sagemaker_client.call_sagemaker_async(payload))
+
+
+def test_key_ignores_field_order_and_int_floats():
+    assert canonical_key({"a": 1, "b": [2.0, "x"]}, "v1") == canonical_key({"b": [2, "x"], "a": 1.0}, "v1")
+    assert canonical_key({"a": 1}, "v1") != canonical_key({"a": 1}, "v2")
+    assert canonical_key({"a": 1}, "v1") != canonical_key({"a": 1.5}, "v1")
+
+
+def test_repeated_payload_is_served_from_cache(monkeypatch, prediction_cache):
+    model = SlowModel(0)
+    calls = []
+    monkeypatch.setattr(sagemaker_client, "call_sagemaker", lambda p: calls.append(p) or model(p))
+
+    assert _score({"id": 1, "x": 2}) == {"score": 1}
+    assert _score({"x": 2.0, "id": 1}) == {"score": 1}
+    assert len(calls) == 1
+    stats = prediction_cache.stats()
+    assert (stats["hits"], stats["misses"], stats["avoided_invocations"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_concurrent_identical_requests_share_one_invocation(monkeypatch, prediction_cache):
+    model = SlowModel(0.1)
+    calls = []
+    monkeypatch.setattr(sagemaker_client, "call_sagemaker", lambda p: calls.append(p) or model(p))
+
+    async def _burst():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await asyncio.gather(*(client.post("/score-lead", json={"id": 7}) for _ in range(5)))
+
+    responses = asyncio.run(_burst())
+    assert [r.json() for r in responses] == [{"score": 7}] * 5
+    assert len(calls) == 1
+    stats = prediction_cache.stats()
+    assert (stats["invocations"], stats["coalesced"], stats["inflight"]) == (1, 4, 0)
+
+
+def test_ttl_lru_bound_and_errors_not_cached():
+    clock = _Clock()
+    cache = PredictionCache(ttl=10, max_entries=2, version=lambda: "v1", clock=clock)
+    calls = []
+
+    def _get(payload, result=None):
+        async def _call():
+            calls.append(payload)
+            return result or {"score": payload["id"]}
+        return asyncio.run(cache.get_or_call(payload, _call))
+
+    _get({"id": 1})
+    _get({"id": 2})
+    _get({"id": 1})
+    _get({"id": 3})  # expulsa id=2, el menos usado
+    assert cache.stats()["evictions"] == 1
+    _get({"id": 1})
+    _get({"id": 2})
+    assert [c["id"] for c in calls] == [1, 2, 3, 2]
+
+    clock.now = 11
+    _get({"id": 2})
+    assert cache.stats()["expired"] == 1
+
+    _get({"id": 9}, {"error": "timeout"})
+    _get({"id": 9}, {"error": "timeout"})
+    assert [c["id"] for c in calls][-2:] == [9, 9]
+
+
+def test_endpoint_change_invalidates(monkeypatch, prediction_cache):
+    monkeypatch.setattr(sagemaker_client, "call_sagemaker", SlowModel(0))
+    _score({"id": 1})
+    assert prediction_cache.stats()["size"] == 1
+
+    monkeypatch.setattr(sagemaker_client, "SAGEMAKER_ENDPOINT", "lead-scoring-endpoint-v2")
+    _score({"id": 1})
+    stats = prediction_cache.stats()
+    assert stats["invalidations"] == 1 and stats["misses"] == 2
+    assert stats["model_version"].startswith("lead-scoring-endpoint-v2")
+
+    client = TestClient(app)
+    assert client.get("/metrics/prediction-cache").json()["size"] == 1
+    assert client.post("/prediction-cache/invalidate").json()["size"] == 0
+    assert "prediction_cache" in client.get("/metrics").text
+
+
+def test_cache_can_be_disabled(monkeypatch):
+    calls = []
+    monkeypatch.setattr(module, "PREDICTION_CACHE_ENABLED", False)
+    monkeypatch.setattr(sagemaker_client, "call_sagemaker", lambda p: calls.append(p) or {"score": 1})
+    _score({"id": 1})
+    _score({"id": 1})
+    assert len(calls) == 2
+
+
+def test_model_version_env_change_is_a_cache_miss(monkeypatch, prediction_cache):
+    calls = []
+    monkeypatch.setattr(sagemaker_client, "call_sagemaker", lambda p: calls.append(p) or {"score": len(calls)})
+    monkeypatch.delenv("SAGEMAKER_MODEL_VERSION", raising=False)
+    assert _score({"id": 1}) == {"score": 1}
+    assert _score({"id": 1}) == {"score": 1}
+
+    monkeypatch.setenv("SAGEMAKER_MODEL_VERSION", "2026-10-18")
+    assert _score({"id": 1}) == {"score": 2}
+    stats = prediction_cache.stats()
+    assert len(calls) == 2 and stats["misses"] == 2 and stats["invalidations"] == 1
+    assert stats["model_version"].endswith(":2026-10-18")
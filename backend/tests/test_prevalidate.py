@@ -0,0 +1,156 @@
+import io
+
+from fastapi.testclient import TestClient
+
+from app import upload_s3
+from app.cleaning import clean_csv_to_s3
+from app.main import app
+from app.prevalidate import prevalidate, skip_rows
+from tests.test_cleaning import FakeS3, _sample_csv
+
+
+def _with_bad_rows() -> bytes:
+    return (
+        "Prospect ID,Lead Number,Notes\n"
+        "p-1,1,ok\n"
+        "p-2,2\n"
+        "p-3,3,\"varias\nlíneas\"\n"
+        "p-4,4,a,b\n"
+        "p-5,5,ok\n"
+    ).encode("utf-8")
+
+
+def test_utf8_fast_path_skips_chardet(monkeypatch):
+    import chardet
+    monkeypatch.setattr(chardet, "UniversalDetector", None)
+
+    report = prevalidate(io.BytesIO(_sample_csv(50)))
+
+    assert report["encoding"] == "utf-8" and report["utf8_fast_path"]
+    assert report["rows"] == 50 and report["bad_row_count"] == 0
+    assert report["columns"] == [" Prospect ID", "Lead Number", "Lead Grade ", "City"]
+
+
+def test_non_utf8_uses_sampled_detection():
+    data = io.BytesIO(_sample_csv(500, "latin1"))
+    data.seek(7)
+
+    report = prevalidate(data)
+
+    assert not report["utf8_fast_path"]
+    assert report["encoding"].lower() not in ("utf-8", "ascii")
+    assert data.tell() == 7
+
+
+def test_bad_rows_report_offsets_lines_and_records():
+    data = _with_bad_rows()
+    report = prevalidate(io.BytesIO(data))
+
+    assert report["rows"] == 5
+    assert report["bad_row_count"] == 2
+    short, long = report["bad_rows"]
+    assert (short["record"], short["line"], short["fields"]) == (2, 3, 2)
+    assert (long["record"], long["line"], long["fields"]) == (4, 6, 4)
+    assert data[short["offset"]:].startswith(b"p-2,")
+    assert data[long["offset"]:].startswith(b"p-4,")
+    assert skip_rows(report) == {2, 4}
+    assert skip_rows(report, "repair") == {4}
+
+
+def test_parallel_chunks_respect_quoted_newlines():
+    rows = [f'p-{i},{i},"nota\n{i}"' if i % 3 == 0 else f"p-{i},{i},x" for i in range(300)]
+    rows[150] = "p-150,150"
+    data = ("Prospect ID,Lead Number,Notes\n" + "\n".join(rows) + "\n").encode()
+
+    report = prevalidate(io.BytesIO(data), chunk_bytes=256, workers=4)
+
+    assert report["chunks"] > 4
+    assert report["rows"] == 300
+    assert [b["record"] for b in report["bad_rows"]] == [151]
+
+
+def test_header_issues_are_reported():
+    data = io.BytesIO(b"Lead Number,Lead_Number,,City\n1,2,3,4\n")
+    issues = prevalidate(data)["header_issues"]
+    assert any("duplicadas" in i for i in issues)
+    assert any("sin nombre" in i for i in issues)
+
+
+def test_cleaner_skips_reported_rows(monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(upload_s3, "s3", fake)
+    data = io.BytesIO(_with_bad_rows())
+
+    result = clean_csv_to_s3(data, "bad.csv", report=prevalidate(data))
+
+    assert result["rows"] == 3 and result["bad_rows_skipped"] == 2
+    assert b"p-2" not in fake.objects["bad.csv"] and b"p-4" not in fake.objects["bad.csv"]
+
+
+def test_endpoint_returns_validation_summary(monkeypatch):
+    monkeypatch.setattr(upload_s3, "s3", FakeS3())
+    monkeypatch.setattr(upload_s3, "_bucket_checked", True)
+    response = TestClient(app).post(
+        "/clean-upload-and-generate-url?bad_rows=repair",
+        files={"file": ("bad.csv", _with_bad_rows(), "text/csv")},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert body["rows"] == 4
+    assert body["validation"]["bad_row_count"] == 2
+    assert body["validation"]["bad_rows_mode"] == "repair"
+
+
+def test_blank_lines_keep_skip_indices_aligned_with_pandas(monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(upload_s3, "s3", fake)
+    data = io.BytesIO(b"a,b,c\n1,1,1\n\n2,2,2\n3,3\n\n4,4,4\n5,5\n")
+
+    report = prevalidate(data)
+    assert report["rows"] == 5 and report["bad_row_count"] == 2
+    # pandas numera también las líneas en blanco en `skiprows`
+    assert skip_rows(report) == {4, 7}
+
+    clean_csv_to_s3(data, "blank.csv", report=report)
+    body = fake.objects["blank.csv"].decode()
+    assert "2,2,2" in body and "4,4,4" in body
+    assert "3,3" not in body and "5,5" not in body
+
+
+def test_spooled_upload_on_disk_is_not_copied(monkeypatch):
+    import tempfile
+    from app import prevalidate as module
+
+    spooled = tempfile.SpooledTemporaryFile(max_size=16)
+    spooled.write(_with_bad_rows())
+    assert spooled._rolled
+    monkeypatch.setattr(module.shutil, "copyfileobj", None)
+
+    report = prevalidate(spooled)
+    assert report["bad_row_count"] == 2
+
+
+def test_skip_set_is_not_capped_by_the_detail_list(monkeypatch):
+    fake = FakeS3()
+    monkeypatch.setattr(upload_s3, "s3", fake)
+    rows = [f"p-{i},{i}" if i % 2 else f"p-{i},{i},x" for i in range(3000)]
+    data = io.BytesIO(("Prospect ID,Lead Number,Notes\n" + "\n".join(rows) + "\n").encode())
+
+    report = prevalidate(data, chunk_bytes=4096, workers=4, max_bad_rows=1000)
+    assert len(report["bad_rows"]) == 1000 and report["bad_row_count"] == 1500
+    assert len(skip_rows(report)) == 1500 and skip_rows(report, "repair") == set()
+
+    result = clean_csv_to_s3(data, "bad.csv", report=report)
+    assert result["rows"] == 1500 and result["bad_rows_skipped"] == 1500
+
+
+def test_validation_pool_is_shared_and_uses_forkserver():
+    from app import prevalidate as module
+
+    data = ("Prospect ID,Lead Number\n" + "".join(f"p-{i},{i}\n" for i in range(500))).encode()
+    prevalidate(io.BytesIO(data), chunk_bytes=512, workers=4)
+    pool = module._executor()
+    prevalidate(io.BytesIO(data), chunk_bytes=512, workers=4)
+    assert module._executor() is pool
+    if hasattr(pool, "_mp_context"):
+        assert pool._mp_context.get_start_method() == "forkserver"
@@ -0,0 +1,116 @@
+import threading
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.result_cache import MemoryBackend, ResultCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _cache(watermark, clock, **kwargs):
+    return ResultCache(lambda: watermark[0], ttl=10, stale_ttl=60, watermark_interval=0, clock=clock, **kwargs)
+
+
+def test_fresh_hits_skip_the_query_and_count_saved_time():
+    calls = []
+    cache = _cache(["w1"], Clock())
+    compute = lambda: calls.append(1) or time.sleep(0.01) or [1, 2]
+
+    assert cache.get_or_compute("k", compute) == [1, 2]
+    assert cache.get_or_compute("k", compute) == [1, 2]
+
+    stats = cache.stats()
+    assert len(calls) == 1
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+    assert stats["saved_seconds"] >= 0.01
+
+
+def test_new_load_watermark_invalidates_entries():
+    watermark, calls = ["w1"], []
+    cache = _cache(watermark, Clock())
+    cache.get_or_compute("k", lambda: calls.append(1) or len(calls))
+
+    watermark[0] = "w2"
+    assert cache.get_or_compute("k", lambda: calls.append(1) or len(calls)) == 2
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_watermark_is_checked_at_interval_or_after_notify_load():
+    checks = []
+    clock = Clock()
+    cache = ResultCache(lambda: checks.append(1) or "w", ttl=100, watermark_interval=30, clock=clock)
+    for _ in range(3):
+        cache.get_or_compute("k", lambda: 1)
+    assert len(checks) == 1
+
+    cache.notify_load()
+    cache.get_or_compute("k", lambda: 1)
+    assert len(checks) == 2
+
+
+def test_stale_entry_is_served_while_refreshing():
+    clock = Clock()
+    cache = _cache(["w1"], clock)
+    cache.get_or_compute("k", lambda: "old")
+    clock.now += 20
+
+    release = threading.Event()
+    refreshed = threading.Event()
+
+    def slow_compute():
+        release.wait(1)
+        refreshed.set()
+        return "new"
+
+    assert cache.get_or_compute("k", slow_compute) == "old"
+    # Un segundo lector durante el refresco no lanza otro
+    assert cache.get_or_compute("k", slow_compute) == "old"
+    release.set()
+    assert refreshed.wait(1)
+    cache._executor.shutdown(wait=True)
+
+    assert cache.get_or_compute("k", lambda: "other") == "new"
+    assert cache.stats()["refreshes"] == 1
+
+
+def test_shared_backend_is_reused_by_other_instances():
+    shared = MemoryBackend()
+    clock = Clock()
+    first = _cache(["w1"], clock, shared=shared)
+    second = _cache(["w1"], clock, shared=shared)
+
+    first.get_or_compute("k", lambda: {"rows": 3})
+    assert second.get_or_compute("k", lambda: {"rows": -1}) == {"rows": 3}
+    assert second.stats()["hits"] == 1
+
+
+def test_lru_evicts_oldest_entry():
+    cache = ResultCache(lambda: "w", max_entries=2, watermark_interval=0)
+    for key in ("a", "b", "c"):
+        cache.get_or_compute(key, lambda: key)
+    assert cache.stats()["entries"] == 2
+
+
+def test_score_all_leads_is_cached(fake_snowflake):
+    def responder(sql, params):
+        if "INFORMATION_SCHEMA.TABLES" in sql:
+            return [("2026-10-18 10:00:00",)]
+        return [(1, 10.0, "A", "Lead", 0.9)]
+
+    fake_snowflake.responder = responder
+    client = TestClient(app)
+    for _ in range(3):
+        assert client.get("/score-all-leads").json()[0]["score"] == 0.9
+
+    scoring = [sql for sql, _ in fake_snowflake.executed if "SCORING_UDF" in sql]
+    assert len(scoring) == 1
+    assert client.get("/metrics/result-cache").json()["hits"] == 2
@@ -0,0 +1,44 @@
+import time
+
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.schema_cache import SchemaCache, TableSchema
+from test_leads_pagination import leads_final
+
+
+def test_compiled_mapper_matches_zip():
+    schema = TableSchema("T", ["Lead_Number", "it's \"quoted\"", "City"])
+    row = (1, "x", "Málaga")
+    assert schema.to_dict(row) == dict(zip(schema.columns, row))
+    assert schema.projection_sql == '"Lead_Number", "it\'s ""quoted""", "City"'
+
+
+def test_cache_ttl_and_invalidation():
+    loads = []
+    cache = SchemaCache(ttl=0.05)
+    loader = lambda: loads.append(1) or ["A", "B"]
+
+    first = cache.get("T", loader)
+    assert cache.get("T", loader) is first
+    time.sleep(0.06)
+    assert cache.get("T", loader) is not first
+    cache.invalidate("T")
+    cache.get("T", loader)
+    assert len(loads) == 3
+
+
+def test_leads_queries_information_schema_once(fake_snowflake):
+    fake_snowflake.responder = leads_final
+    client = TestClient(app)
+    for _ in range(3):
+        assert client.get("/leads", params={"limit": 5}).status_code == 200
+    assert client.get("/leads", params={"format": "ndjson"}).status_code == 200
+
+    schema_queries = [sql for sql, _ in fake_snowflake.executed if "INFORMATION_SCHEMA" in sql]
+    assert len(schema_queries) == 1
+
+    client.post("/schema-cache/invalidate")
+    client.get("/leads")
+    schema_queries = [sql for sql, _ in fake_snowflake.executed if "INFORMATION_SCHEMA" in sql]
+    assert len(schema_queries) == 2
@@ -0,0 +1,113 @@
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+
+from app import snowflake_client
+from app.columnar import ARROW_STREAM_MEDIA_TYPE
+from app.main import app
+from app.snowflake_client import write_scores
+
+
+@pytest.fixture
+def staged(fake_snowflake, monkeypatch):
+    """Lee cada Parquet en el PUT (el archivo local se borra justo después)."""
+    monkeypatch.setattr(snowflake_client, "_scores_ready", False)
+    files = []
+
+    def _respond(sql, params):
+        statement = sql.lstrip().upper()
+        if statement.startswith("PUT"):
+            path = sql.split("file://", 1)[1].split()[0]
+            files.append(pq.read_table(path))
+            return [(path, path, 0, 0, "NONE", "NONE", "UPLOADED", "")]
+        if statement.startswith("MERGE"):
+            return [(3, 2)]
+        return []
+
+    fake_snowflake.responder = _respond
+    return files
+
+
+def _statements(fake_snowflake):
+    return [sql.split()[0].upper() for sql, _ in fake_snowflake.executed]
+
+
+def test_scores_are_chunked_staged_and_merged_once(fake_snowflake, staged):
+    frame = pd.DataFrame({"Lead_Number": [1, 2, 3, 4, 5], "Lead_Score": [0.1, 0.2, 0.3, 0.4, 0.5]})
+    result = write_scores(frame, source="sagemaker", chunk_rows=2)
+
+    assert [t.num_rows for t in staged] == [2, 2, 1]
+    assert staged[0].schema == pa.schema([("Lead_Number", pa.int64()), ("Lead_Score", pa.float64())])
+    assert _statements(fake_snowflake) == ["CREATE", "CREATE", "PUT", "PUT", "PUT", "MERGE", "REMOVE"]
+    merge_sql, merge_params = fake_snowflake.executed[5]
+    assert "ON t.\"Lead_Number\" = s.lead_number" in merge_sql
+    assert merge_params == {"source": "sagemaker"}
+    stage_path = fake_snowflake.executed[2][0].split()[2]
+    assert f"FROM {stage_path}/" in merge_sql
+    assert fake_snowflake.executed[-1][0] == f"REMOVE {stage_path}/"
+    assert result["rows"] == 5 and result["chunks"] == 3
+    assert (result["rows_inserted"], result["rows_updated"]) == (3, 2)
+    assert result["rows_per_s"] > 0
+
+
+def test_small_arrow_batches_are_coalesced(fake_snowflake, staged):
+    batches = [pa.record_batch({"Lead_Number": ["10", "11", None], "score": [1.0, 2.0, 3.0]})] * 3
+    result = write_scores(iter(batches), score_column="score", chunk_rows=5)
+
+    # Las filas sin Lead_Number se descartan y los lotes se agrupan por trozo
+    assert [t.num_rows for t in staged] == [5, 1]
+    assert staged[0]["Lead_Number"].to_pylist() == [10, 11, 10, 11, 10]
+    assert result["rows"] == 6
+    # La tabla y el formato se crean una sola vez por proceso
+    write_scores(batches[0], score_column="score")
+    assert _statements(fake_snowflake).count("CREATE") == 2
+
+
+
+@pytest.mark.parametrize("failing", ["MERGE", "PUT"])
+def test_stage_is_cleared_when_staging_or_merge_fails(fake_snowflake, staged, failing):
+    respond = fake_snowflake.responder
+    puts = []
+
+    def _fail(sql, params):
+        statement = sql.split()[0].upper()
+        puts.append(statement == "PUT")
+        # Falla el MERGE o el segundo PUT
+        if statement == failing and (failing == "MERGE" or sum(puts) == 2):
+            raise RuntimeError("warehouse suspended")
+        return respond(sql, params)
+
+    fake_snowflake.responder = _fail
+    frame = pd.DataFrame({"Lead_Number": [1, 2, 3], "Lead_Score": [0.1, 0.2, 0.3]})
+    with pytest.raises(RuntimeError):
+        write_scores(frame, chunk_rows=2)
+    assert _statements(fake_snowflake)[-1] == "REMOVE"
+
+
+def test_missing_columns_and_empty_input(fake_snowflake, staged):
+    with pytest.raises(ValueError, match="Lead_Score"):
+        write_scores(pd.DataFrame({"Lead_Number": [1]}))
+    result = write_scores(pd.DataFrame({"Lead_Number": [], "Lead_Score": []}))
+    assert result["rows"] == 0
+    assert "MERGE" not in _statements(fake_snowflake)
+
+
+def test_scores_endpoint_accepts_arrow_and_json(fake_snowflake, staged):
+    table = pa.table({"Lead_Number": [1, 2], "Lead_Score": [0.5, 0.7]})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    client = TestClient(app)
+    response = client.post("/scores", content=sink.getvalue().to_pybytes(),
+                           headers={"content-type": ARROW_STREAM_MEDIA_TYPE})
+    assert response.status_code == 200
+    assert response.json()["rows"] == 2
+
+    response = client.post("/scores", params={"score_column": "score"},
+                           content=b'{"Lead_Number": 3, "score": 0.9}\n{"Lead_Number": 4, "score": 0.1}\n',
+                           headers={"content-type": "application/x-ndjson"})
+    assert response.json()["rows"] == 2
+    assert staged[-1]["Lead_Score"].to_pylist() == [0.9, 0.1]
+    assert client.post("/scores", json=[{"Lead_Number": 1}]).status_code == 400
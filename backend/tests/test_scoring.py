@@ -0,0 +1,70 @@
+import io
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from app.cleaning import iter_cleaned_csv
+from app.scoring import score_arrays, score_frame, score_lead
+
+# Salidas de SCORING_UDF (frontend/README.md) calculadas a mano, no con las
+# tablas de app.scoring: grado A/B/C suma 50/30/10, etapa Qualified/Unreachable
+# suma 20/5; un grado o una etapa NULL caen en el ELSE, un activity NULL da NULL
+REFERENCE = [
+    ((15.0, "A", "Qualified"), 85.0),
+    ((10.0, "B", "Unreachable"), 45.0),
+    ((20.0, "C", "Lead"), 30.0),
+    ((25.0, "D", "Qualified"), 45.0),
+    ((-3.0, "A", "Customer"), 47.0),
+    ((7.5, "a", "qualified"), 7.5),
+    ((100.0, "B", "Qualified"), 150.0),
+    ((0.0, "", ""), 0.0),
+    ((12.0, None, "Qualified"), 32.0),
+    ((14.0, "A", None), 64.0),
+    ((14.0, None, None), 14.0),
+    ((None, "A", "Qualified"), None),
+]
+
+
+@pytest.mark.parametrize("inputs,expected", REFERENCE)
+def test_reference_rules(inputs, expected):
+    assert score_lead(*inputs) == expected
+
+
+def test_vectorized_matches_reference_table():
+    activity, grade, stage = zip(*(inputs for inputs, _ in REFERENCE))
+    scores = score_arrays(list(activity), list(grade), list(stage))
+    for score, (_, expected) in zip(scores, REFERENCE):
+        if expected is None:
+            assert math.isnan(score)
+        else:
+            assert score == pytest.approx(expected)
+
+
+def test_vectorized_matches_reference_on_random_batch():
+    rng = np.random.default_rng(7)
+    n = 20_000
+    grades = np.array(["A", "B", "C", "D", "E", None], dtype=object)
+    stages = np.array(["Qualified", "Unreachable", "Lead", "Lost", None], dtype=object)
+    activity = rng.uniform(-5, 30, n)
+    activity[rng.random(n) < 0.05] = np.nan
+    df = pd.DataFrame({
+        "Asymmetrique_Activity_Score": activity,
+        "Lead_Grade": rng.choice(grades, n),
+        "Lead_Stage": rng.choice(stages, n),
+    })
+
+    vectorized = score_frame(df).to_numpy()
+    reference = np.array([
+        np.nan if (s := score_lead(None if np.isnan(a) else a, g, st)) is None else s
+        for a, g, st in df.itertuples(index=False)
+    ])
+    np.testing.assert_allclose(vectorized, reference, equal_nan=True)
+
+
+def test_cleaning_adds_lead_score_column():
+    raw = b"Lead Number,Asymmetrique Activity Score,Lead Grade,Lead Stage\n1,15,A,Customer\n2,,B,Qualified\n"
+    cleaned = b"".join(iter_cleaned_csv(io.BytesIO(raw), "utf-8", score=True)).decode()
+    df = pd.read_csv(io.StringIO(cleaned), dtype=str, keep_default_na=False)
+    assert df["Lead_Score"].tolist() == ["65.0", ""]
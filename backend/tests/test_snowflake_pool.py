@@ -0,0 +1,95 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.snowflake_client import ConnectionPool, get_connection
+from conftest import FakeSnowflakeConnection
+
+
+def test_pool_reuses_connections_without_probe_query():
+    created = []
+
+    def factory():
+        conn = FakeSnowflakeConnection()
+        created.append(conn)
+        return conn
+
+    pool = ConnectionPool(factory=factory, size=2)
+    for _ in range(5):
+        with pool.connection() as conn:
+            conn.cursor().execute("SELECT 42")
+
+    assert len(created) == 1
+    assert [sql for sql, _ in created[0].executed] == ["SELECT 42"] * 5
+    stats = pool.stats()
+    assert stats["hits"] == 4 and stats["misses"] == 1
+    assert stats["idle"] == 1 and stats["in_use"] == 0
+
+
+def test_pool_validates_only_stale_connections():
+    conn = FakeSnowflakeConnection()
+    pool = ConnectionPool(factory=lambda: conn, size=1, validate_after=0.01)
+    pool.release(pool.acquire())
+    time.sleep(0.02)
+    pool.release(pool.acquire())
+    assert [sql for sql, _ in conn.executed] == ["SELECT 1"]
+
+
+def test_pool_discards_closed_and_evicts_idle():
+    created = []
+
+    def factory():
+        created.append(FakeSnowflakeConnection())
+        return created[-1]
+
+    pool = ConnectionPool(factory=factory, size=2, idle_timeout=0.01)
+    first = pool.acquire()
+    pool.release(first)
+    first.closed = True
+    second = pool.acquire()
+    assert second is not first
+    pool.release(second)
+
+    time.sleep(0.02)
+    third = pool.acquire()
+    assert second.closed and third is created[-1]
+    stats = pool.stats()
+    assert stats["discarded"] == 1 and stats["evicted"] == 1
+
+
+def test_pool_blocks_until_release_and_times_out():
+    pool = ConnectionPool(factory=FakeSnowflakeConnection, size=1, checkout_timeout=0.05)
+    conn = pool.acquire()
+    with pytest.raises(TimeoutError):
+        pool.acquire()
+
+    timer = threading.Timer(0.02, pool.release, args=(conn,))
+    timer.start()
+    pool.checkout_timeout = 1
+    assert pool.acquire() is conn
+    assert pool.stats()["checkout_wait_seconds_max"] > 0
+
+
+def test_get_connection_close_returns_to_pool(fake_snowflake):
+    conn = get_connection()
+    conn.cursor().execute("SELECT 1")
+    conn.close()
+    conn.close()
+    assert fake_snowflake.pool.stats()["idle"] == 1
+    assert not fake_snowflake.connections[0].closed
+
+
+def test_endpoints_share_pooled_connection(fake_snowflake):
+    fake_snowflake.responder = lambda sql, params: [(1, 10.0, "A", "Lead", 0.9)]
+    client = TestClient(app)
+    # Límites distintos para no servir desde la caché de resultados
+    for limit in (10, 20, 30):
+        assert client.get("/score-all-leads", params={"limit": limit}).status_code == 200
+
+    assert len(fake_snowflake.connections) == 1
+    metrics = client.get("/metrics/snowflake-pool").json()
+    # Marca de carga (una vez) + tres consultas de scoring
+    assert metrics["hits"] == 3 and metrics["misses"] == 1
@@ -0,0 +1,137 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app.snowpipe import INSERT_FILES_LIMIT, JWTProvider, SnowpipeNotifier
+
+
+class MockSnowpipe(BaseHTTPRequestHandler):
+    """Servidor REST local que imita `insertFiles`."""
+
+    received = []
+    fail_next = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        if MockSnowpipe.fail_next:
+            MockSnowpipe.fail_next -= 1
+            self.send_response(503)
+            self.end_headers()
+            return
+        MockSnowpipe.received.append({"path": self.path, "auth": self.headers["Authorization"], "files": body["files"]})
+        payload = json.dumps({"responseCode": "SUCCESS", "files": len(body["files"])}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    MockSnowpipe.received = []
+    MockSnowpipe.fail_next = 0
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), MockSnowpipe)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+
+
+@pytest.fixture
+def key_path(tmp_path):
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    path = tmp_path / "rsa_key.p8"
+    path.write_bytes(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                       serialization.NoEncryption()))
+    return str(path)
+
+
+def test_token_is_reused_until_refresh_margin(key_path):
+    now = [1_000_000]
+    provider = JWTProvider("ACME", "LOADER", key_path, lifetime=3600, refresh_margin=60, clock=lambda: now[0])
+    first = provider.token()
+    now[0] += 3500
+    assert provider.token() is first
+    now[0] += 100
+    second = provider.token()
+    assert second != first
+    assert jwt.decode(second, options={"verify_signature": False})["iss"] == "ACME.LOADER"
+
+
+def test_insert_files_splits_on_api_limit(server, key_path):
+    notifier = SnowpipeNotifier("LEADS_PIPE", JWTProvider("ACME", "LOADER", key_path), server)
+    paths = [f"leads/{i}.csv" for i in range(INSERT_FILES_LIMIT + 10)]
+    responses = notifier.insert_files(paths)
+
+    assert [len(r["files"]) for r in MockSnowpipe.received] == [INSERT_FILES_LIMIT, 10]
+    assert [r["files"] for r in responses] == [INSERT_FILES_LIMIT, 10]
+    assert MockSnowpipe.received[0]["path"].startswith("/v1/data/pipes/LEADS_PIPE/insertFiles?requestId=")
+    assert len({r["auth"] for r in MockSnowpipe.received}) == 1
+
+
+def test_add_coalesces_by_size_and_time(server, key_path):
+    notifier = SnowpipeNotifier("LEADS_PIPE", JWTProvider("ACME", "LOADER", key_path), server,
+                                batch_size=100, flush_interval=0.05)
+    for i in range(250):
+        notifier.add(f"f{i}.csv")
+    deadline = time.time() + 5
+    while notifier.stats()["files_sent"] < 250 and time.time() < deadline:
+        time.sleep(0.01)
+    notifier.close()
+
+    sent = [f["path"] for r in MockSnowpipe.received for f in r["files"]]
+    assert sent == [f"f{i}.csv" for i in range(250)]
+    assert notifier.stats()["requests_sent"] <= 4
+
+
+def test_failed_flush_requeues_files(server, key_path):
+    notifier = SnowpipeNotifier("LEADS_PIPE", JWTProvider("ACME", "LOADER", key_path), server,
+                                flush_interval=60)
+    MockSnowpipe.fail_next = 1
+    notifier.add("a.csv")
+    notifier.add("b.csv")
+    assert notifier.flush() == []
+    assert notifier.stats()["pending"] == 2
+    notifier.close()
+    assert [f["path"] for f in MockSnowpipe.received[0]["files"]] == ["a.csv", "b.csv"]
+
+
+def test_insert_files_async_uses_same_batching(server, key_path):
+    import asyncio
+
+    notifier = SnowpipeNotifier("LEADS_PIPE", JWTProvider("ACME", "LOADER", key_path), server, batch_size=3)
+    responses = asyncio.run(notifier.insert_files_async([f"leads/{i}.csv" for i in range(7)]))
+
+    assert [r["files"] for r in responses] == [3, 3, 1]
+    assert MockSnowpipe.received[0]["path"].startswith("/v1/data/pipes/LEADS_PIPE/insertFiles?requestId=")
+    assert notifier.stats()["files_sent"] == 7
+
+
+def test_jwt_does_not_need_snowpipe(key_path, monkeypatch):
+    from app import snowpipe
+    from app.snowflake_client import generate_snowflake_jwt
+
+    monkeypatch.setattr(snowpipe, "_jwt_provider", None)
+    monkeypatch.setattr(snowpipe, "_notifier", None)
+    monkeypatch.setenv("SNOWFLAKE_ACCOUNT", "ACME")
+    monkeypatch.setenv("SNOWFLAKE_USER", "LOADER")
+    monkeypatch.setenv("PRIVATE_KEY_PATH", key_path)
+    monkeypatch.delenv("SNOWPIPE_NAME", raising=False)
+
+    token = generate_snowflake_jwt()
+    assert jwt.decode(token, options={"verify_signature": False})["sub"] == "ACME.LOADER"
+    assert generate_snowflake_jwt() is token
+    assert snowpipe._notifier is None
+
+    monkeypatch.setenv("SNOWPIPE_NAME", "LEADS_PIPE")
+    assert snowpipe.get_notifier().token_provider is snowpipe.get_jwt_provider()
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from app import sagemaker_client, startup
+from app.startup import HEAVY_MODULES, import_profile, prewarm
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_main_import_does_not_load_heavy_modules():
+    profile = import_profile("app.main")
+    assert [name for name in HEAVY_MODULES if name in profile] == []
+
+
+def test_main_import_leaves_heavy_modules_out_of_sys_modules():
+    # El tiempo de arranque se mide en benchmarks/bench_startup.py (--budget-ms);
+    # aquí solo se comprueba qué se importa, que no depende de la máquina
+    code = ("import sys, app.main; "
+            "print(','.join(m for m in ('boto3', 'pandas', 'pyarrow') if m in sys.modules))")
+    env = dict(os.environ, PREWARM_MODULES="", PREWARM_CLIENTS="")
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == ""
+
+
+@pytest.mark.parametrize("module", ["app.upload_s3", "app.athena_client", "app.sagemaker_client",
+                                    "app.snowflake_client"])
+def test_client_modules_create_clients_lazily(module):
+    profile = import_profile(module)
+    assert "boto3" not in profile
+    assert "snowflake.connector" not in profile
+
+
+def test_prewarm_imports_modules_and_reports_failures(monkeypatch):
+    monkeypatch.delitem(sys.modules, "json", raising=False)
+    report = prewarm(modules="json, no_such_module", clients=[])
+
+    assert "ms" in report["json"]
+    assert "error" in report["no_such_module"]
+    assert startup.last_report["json"] == report["json"]
+
+
+def test_prewarm_creates_clients(monkeypatch):
+    created = []
+    monkeypatch.setattr(sagemaker_client, "sagemaker_runtime", None)
+    monkeypatch.setattr(sagemaker_client, "get_runtime", lambda: created.append("sagemaker"))
+    report = prewarm(modules=[], clients="sagemaker,unknown")
+
+    assert created == ["sagemaker"]
+    assert "ms" in report["client:sagemaker"]
+    assert "error" in report["client:unknown"]
@@ -1,15 +1,73 @@
-
 import React, { useState } from 'react';
 import axios from 'axios';
 
+// Partes subidas a S3 a la vez
+const PARALLEL_PARTS = 4;
+
 function Upload() {
     const [file, setFile] = useState(null);
     const [message, setMessage] = useState('');
+    const [progress, setProgress] = useState(0);
 
     const API_BASE = process.env.REACT_APP_API_BASE_URL;
 
     const handleChange = (e) => {
         setFile(e.target.files[0]);
+        setProgress(0);
+    };
+
+    // Subida multipart directa a S3: la API solo firma las partes. La respuesta
+    // inicial trae como mucho un lote de URLs; el resto se pide por lotes a
+    // /uploads/{id}/parts cuando los workers llegan a ellas
+    const uploadToS3 = async (upload) => {
+        const etags = [];
+        const partCount = upload.part_count || Math.ceil(file.size / upload.part_size);
+        const batchSize = upload.parts.length;
+        const urls = new Map(upload.parts.map((part) => [part.part_number, part.url]));
+        const batches = new Map();
+        let uploaded = 0;
+        let next = 0;
+
+        const signBatch = async (first) => {
+            const partNumbers = [];
+            for (let n = first; n < first + batchSize && n <= partCount; n++) {
+                partNumbers.push(n);
+            }
+            const { data } = await axios.post(`${API_BASE}/uploads/${upload.job_id}/parts`, {
+                key: upload.key,
+                upload_id: upload.upload_id,
+                part_numbers: partNumbers
+            });
+            data.parts.forEach((part) => urls.set(part.part_number, part.url));
+        };
+
+        const urlFor = async (partNumber) => {
+            if (!urls.has(partNumber)) {
+                // Un único POST por lote aunque varios workers lo necesiten a la vez
+                const batch = Math.floor((partNumber - 1) / batchSize);
+                if (!batches.has(batch)) {
+                    batches.set(batch, signBatch(batch * batchSize + 1));
+                }
+                await batches.get(batch);
+            }
+            return urls.get(partNumber);
+        };
+
+        const worker = async () => {
+            while (next < partCount) {
+                const partNumber = ++next;
+                const url = await urlFor(partNumber);
+                const start = (partNumber - 1) * upload.part_size;
+                const blob = file.slice(start, start + upload.part_size);
+                const response = await axios.put(url, blob);
+                etags.push({ part_number: partNumber, etag: response.headers.etag });
+                uploaded += blob.size;
+                setProgress(Math.round((100 * uploaded) / file.size));
+            }
+        };
+
+        await Promise.all(Array.from({ length: PARALLEL_PARTS }, worker));
+        return etags;
     };
 
     const handleSubmit = async (e) => {
@@ -20,18 +78,29 @@ function Upload() {
             return;
         }
 
-        const formData = new FormData();
-        formData.append('file', file);
-
+        let upload = null;
         try {
-            const response = await axios.post(`${API_BASE}/clean-upload-and-generate-url`, formData, {
-                headers: {
-                    'Content-Type': 'multipart/form-data'
-                }
+            setMessage('⏳ Subiendo a S3...');
+            const { data } = await axios.post(`${API_BASE}/uploads/multipart`, {
+                filename: file.name,
+                content_type: file.type || 'text/csv',
+                size: file.size
+            });
+            upload = data;
+            const parts = await uploadToS3(upload);
+
+            const response = await axios.post(`${API_BASE}${upload.complete_url}`, {
+                key: upload.key,
+                upload_id: upload.upload_id,
+                parts
             });
-            
-            setMessage(`✅ ${response.data.status}`);
+            setMessage(`✅ Archivo subido. Ingesta ${response.data.job_id}: ${response.data.status}`);
         } catch (error) {
+            if (upload) {
+                axios.delete(`${API_BASE}/uploads/${upload.job_id}`, {
+                    params: { key: upload.key, upload_id: upload.upload_id }
+                }).catch(() => {});
+            }
             setMessage('❌ Error al subir el archivo');
             console.error(error);
         }
@@ -45,6 +114,7 @@ function Upload() {
                 <input type="file" onChange={handleChange} className="mb-4" />
                 <button type="submit" className="bg-blue-500 text-white px-4 py-2 rounded">Subir</button>
             </form>
+            {progress > 0 && progress < 100 && <p className="mt-4">{progress}%</p>}
             {message && <p className="mt-4">{message}</p>}
         </div>
     );